@@ -0,0 +1,139 @@
+"""
+系统管理 API 路由（管理员）
+向量库运行状态：Collection 加载状态、缓存统计等
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from domain.auth import User
+from domain.entities import Agent
+from domain.managers.collection_load_manager import LoadState
+from api.schemas import ReplicaParityRequest
+from domain.processors.vector_store_manager import get_vector_store_manager
+from application.auth_service import get_current_superuser
+from config.database import get_db
+
+router = APIRouter(prefix="/admin", tags=["系统管理"])
+vector_manager = get_vector_store_manager()
+
+
+@router.get("/collections", summary="Collection 加载状态")
+async def get_collection_status(
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    获取各智能体 Collection 的加载状态及最近的状态转换
+    
+    需要管理员权限
+    """
+    return {"success": True, "data": vector_manager.load_manager.get_status()}
+
+
+@router.post("/collections/{agent_id}/load", summary="加载 Collection")
+def load_collection(
+    agent_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    手动加载智能体的 Collection 到 Milvus 查询节点
+    
+    参数：agent_id (UUID)
+    需要管理员权限
+    """
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent:
+        raise HTTPException(404, "智能体不存在")
+    
+    loaded = vector_manager.load_manager.ensure_loaded(agent.name, reason="manual")
+    return {
+        "success": loaded,
+        "message": "Collection 已加载" if loaded else "Collection 加载失败或不存在",
+        "data": {"state": vector_manager.load_manager.get_state(agent.name)}
+    }
+
+
+@router.post("/collections/{agent_id}/release", summary="释放 Collection")
+def release_collection(
+    agent_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    手动释放智能体的 Collection（下次检索时自动重新加载）
+    
+    参数：agent_id (UUID)
+    需要管理员权限
+    """
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent:
+        raise HTTPException(404, "智能体不存在")
+    
+    released = vector_manager.release_collection(agent.name)
+    state = vector_manager.load_manager.get_state(agent.name)
+    if not released:
+        message = "Collection 释放失败"
+    elif state == LoadState.LOADED:
+        message = "共享 Collection 始终保持加载，未释放"
+    else:
+        message = "Collection 已释放"
+    return {
+        "success": released,
+        "message": message,
+        "data": {"state": state}
+    }
+
+
+@router.get("/replicas", summary="进程内向量副本状态")
+async def get_replica_status(
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    获取各智能体进程内向量副本的状态（是否就绪、向量数、内存占用、命中次数）
+    
+    需要管理员权限
+    """
+    return {"success": True, "data": vector_manager.replicas.get_status()}
+
+
+@router.post("/replicas/{agent_id}/parity", summary="副本一致性校验")
+def check_replica_parity(
+    agent_id: str,
+    request: ReplicaParityRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    用给定查询对比进程内副本与 Milvus 稠密检索的 top-k 结果
+    
+    参数：agent_id (UUID)
+    需要管理员权限
+    """
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent:
+        raise HTTPException(404, "智能体不存在")
+    
+    try:
+        report = vector_manager.check_replica_parity(agent.name, request.queries, request.top_k)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"success": True, "data": report}
+
+
+@router.get("/vector-store/stats", summary="向量库运行统计")
+async def get_vector_store_stats(
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    获取向量库进程内运行统计：查询向量缓存、知识库统计、Milvus 连接池状态、Embedding 后端
+    
+    需要管理员权限
+    """
+    return {
+        "success": True,
+        "data": {
+            "query_embedding_cache": vector_manager.milvus_store.query_embedding_cache.get_stats(),
+            "knowledge_base": vector_manager.stats.get_stats(),
+            "milvus_connections": vector_manager.milvus_store.pool.get_status(),
+            "embedding_backends": vector_manager.milvus_store.get_embedding_stats()
+        }
+    }
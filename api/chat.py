@@ -50,7 +50,7 @@ async def send_message(
         
         # 获取 RAG Agent 并回答
         rag_agent = agent_service.get_rag_agent(db, agent_name)
-        answer = rag_agent.ask(message.content)
+        answer = await rag_agent.aask(message.content)
         
         # 更新活跃时间
         conversation_service.update_activity(db, conversation_id)
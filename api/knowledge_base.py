@@ -2,8 +2,9 @@
 知识库管理 API 路由
 """
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from api.schemas import DocumentUploadResponse, KnowledgeBaseStats
+from api.schemas import DocumentUploadResponse, KnowledgeBaseStats, IndexRebuildRequest
 from domain.auth import User
 from domain.entities import Agent
 from application.agent_service import get_agent_service
@@ -11,8 +12,8 @@ from application.auth_service import get_current_active_user
 from config.database import get_db, SessionLocal
 from config.settings import settings
 import os
-import shutil
 import uuid
+from typing import Optional
 
 router = APIRouter(prefix="/knowledge-base", tags=["知识库管理"])
 agent_service = get_agent_service()
@@ -33,6 +34,23 @@ def process_document_background(agent_name: str, temp_path: str):
         db.close()
 
 
+def _save_upload(source, temp_path: str) -> int:
+    """
+    分块复制上传文件（同步磁盘 IO，在线程池中执行，不阻塞事件循环）
+    
+    Returns:
+        int: 已复制的字节数；超过上限时停止复制，返回值大于 MAX_UPLOAD_SIZE
+    """
+    file_size = 0
+    with open(temp_path, "wb") as buffer:
+        while chunk := source.read(1024 * 1024):
+            file_size += len(chunk)
+            if file_size > settings.MAX_UPLOAD_SIZE:
+                break
+            buffer.write(chunk)
+    return file_size
+
+
 @router.post("/{agent_id}/documents", response_model=DocumentUploadResponse, summary="上传文档")
 async def upload_document(
     agent_id: str,
@@ -71,14 +89,11 @@ async def upload_document(
         file_id = str(uuid.uuid4())[:8]
         temp_path = os.path.join(upload_dir, f"{file_id}_{file.filename}")
         
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 验证文件大小
-        file_size = os.path.getsize(temp_path)
+        # 分块复制并验证文件大小（请求体此时已由框架暂存；超大请求由 Content-Length 检查在读取前拒绝）
+        file_size = await run_in_threadpool(_save_upload, file.file, temp_path)
         if file_size > settings.MAX_UPLOAD_SIZE:
             os.remove(temp_path)
-            raise HTTPException(400, f"文件过大: {file_size / 1024 / 1024:.1f}MB > 10MB")
+            raise HTTPException(400, f"文件过大: > {settings.MAX_UPLOAD_SIZE // 1024 // 1024}MB")
         
         # 添加后台任务处理文档（不传递 db session）
         background_tasks.add_task(process_document_background, agent.name, temp_path)
@@ -135,15 +150,16 @@ async def delete_document(
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    删除指定文档（级联删除向量数据和元数据）
+    删除指定文档（软删除，立即返回）
     
     参数：
     - agent_id: 智能体 ID (UUID)
     - file_id: 文件 ID (UUID)
     
-    注意：此操作会同时删除：
+    注意：文档标记为删除后检索立即排除该文件，随后后台清除：
     1. Milvus 向量数据库中的向量记录
-    2. 元数据文件中的文件记录
+    2. 数据库中的文档记录
+    清除进度可通过 GET /{agent_id}/purge 查询
     """
     try:
         # 轻量级验证智能体存在（不构建完整响应）
@@ -206,6 +222,7 @@ async def clear_knowledge_base(
     
     参数：agent_id (UUID)
     警告：此操作不可逆，将删除所有文档和向量数据
+    （文档标记删除后立即返回，向量由后台清除，进度可通过 GET /{agent_id}/purge 查询）
     """
     try:
         # 验证智能体存在并获取 name
@@ -222,33 +239,95 @@ async def clear_knowledge_base(
         raise HTTPException(500, f"清空失败: {str(e)}")
 
 
-@router.post("/{agent_id}/rebuild", summary="重建知识库索引")
-async def rebuild_knowledge_base(
+@router.get("/{agent_id}/purge", summary="查询删除清除进度")
+async def get_purge_status(
     agent_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    重建知识库索引
+    查询已删除文档的后台清除进度
     
     参数：agent_id (UUID)
-    用于优化搜索性能或修复索引问题
+    返回：待清除文件数、是否等待清空、已清除的文件/向量数、最近一次清除时间与错误
     """
     try:
-        # 验证智能体存在
         from domain.entities import Agent
         agent = db.query(Agent).filter(Agent.id == agent_id).first()
         if not agent:
             raise HTTPException(404, "智能体不存在")
         
+        return {"success": True, "data": agent_service.get_purge_status(agent.name)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"查询失败: {str(e)}")
+
+
+@router.post("/{agent_id}/rebuild", summary="重建知识库索引")
+async def rebuild_knowledge_base(
+    agent_id: str,
+    background_tasks: BackgroundTasks,
+    request: Optional[IndexRebuildRequest] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    在线重建知识库索引（异步处理）
+    
+    参数：agent_id (UUID)
+    请求体（可选）：index_type / index_params / search_params / vector_dtype / vector_dim，为空则按当前配置重建
+    （vector_dtype / vector_dim 变化时同时迁移已有向量的存储格式）
+    
+    流程：
+    1. 新建 Collection 并复制向量，旧 Collection 持续提供检索
+    2. 按新配置构建索引并加载
+    3. 原子切换别名，删除旧 Collection
+    
+    用于更换索引类型/参数，或在大量删除后压缩数据；进度通过 GET 接口查询
+    """
+    try:
+        request = request or IndexRebuildRequest()
+        rebuild = agent_service.start_rebuild(
+            db, agent_id,
+            index_type=request.index_type,
+            index_params=request.index_params,
+            search_params=request.search_params,
+            vector_dtype=request.vector_dtype,
+            vector_dim=request.vector_dim
+        )
+        background_tasks.add_task(agent_service.run_rebuild, rebuild["id"])
+        
         return {
             "success": True,
-            "message": "索引重建功能待实现"
+            "message": "索引重建已开始",
+            "data": rebuild
         }
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     except Exception as e:
         raise HTTPException(500, f"重建失败: {str(e)}")
 
 
+@router.get("/{agent_id}/rebuild", summary="查询索引重建进度")
+async def get_rebuild_status(
+    agent_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """获取智能体的索引重建记录（最新的在前），参数：agent_id (UUID)"""
+    try:
+        agent = db.query(Agent).filter(Agent.id == agent_id).first()
+        if not agent:
+            raise HTTPException(404, "智能体不存在")
+        
+        return {"success": True, "data": agent_service.list_rebuilds(db, agent_id)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"查询失败: {str(e)}")
+
+
 @router.post("/{agent_id}/fix-inconsistency", summary="修复数据不一致")
 async def fix_data_inconsistency(
     agent_id: str,
@@ -284,8 +363,8 @@ async def fix_data_inconsistency(
                 "data": stats
             }
         
-        # 执行修复：完全清空知识库
-        result = agent_service.clear_knowledge_base(db, agent_id, agent.name)
+        # 执行修复：完全清空知识库（同步执行，修复后立即重新统计）
+        result = agent_service.clear_knowledge_base(db, agent_id, agent.name, wait=True)
         
         # 获取修复后的统计信息
         new_stats = agent_service.get_statistics(agent.name)
@@ -10,7 +10,7 @@ from api.schemas.conversation import (
     AgentInfo, AgentSwitchRequest, AgentSwitchResponse
 )
 from api.schemas.knowledge_base import (
-    DocumentUploadResponse, KnowledgeBaseStats
+    DocumentUploadResponse, KnowledgeBaseStats, IndexRebuildRequest, ReplicaParityRequest
 )
 from api.schemas.chat import (
     MessageRequest, MessageResponse
@@ -30,7 +30,7 @@ __all__ = [
     "ConversationCreate", "ConversationUpdate", "ConversationResponse",
     "AgentInfo", "AgentSwitchRequest", "AgentSwitchResponse",
     # Knowledge Base
-    "DocumentUploadResponse", "KnowledgeBaseStats",
+    "DocumentUploadResponse", "KnowledgeBaseStats", "IndexRebuildRequest", "ReplicaParityRequest",
     # Chat
     "MessageRequest", "MessageResponse",
     # Auth
@@ -2,7 +2,7 @@
 智能体相关的 Pydantic Schema
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 
@@ -14,6 +14,27 @@ class AgentCreate(BaseModel):
     agent_type: str = Field(default="general", description="类型：general/legal/medical/financial/custom")
     system_prompt: Optional[str] = Field(None, description="系统提示词（为空则使用默认）")
     description: Optional[str] = Field(None, description="智能体描述")
+    index_type: Optional[str] = Field(
+        None,
+        description="向量索引类型：AUTO/FLAT/IVF_FLAT/IVF_PQ/HNSW/SCANN/DISKANN/IVF_SQ8/HNSW_SQ/IVF_RABITQ（为空则使用全局默认）"
+    )
+    index_params: Optional[Dict[str, Any]] = Field(None, description="索引构建参数（覆盖默认值）")
+    search_params: Optional[Dict[str, Any]] = Field(None, description="检索参数（覆盖默认值）")
+    vector_dtype: Optional[str] = Field(None, description="向量存储精度：FLOAT32/FLOAT16/BFLOAT16（为空则使用全局默认）")
+    vector_dim: Optional[int] = Field(None, ge=32, description="向量截断维度（Matryoshka，为空则保留模型完整维度）")
+    embedding_provider: Optional[str] = Field(
+        None, description="Embedding 后端：openai 远程 API / onnx 本地 CPU 推理（为空则使用全局默认）"
+    )
+    consistency_levels: Optional[Dict[str, str]] = Field(
+        None,
+        description="一致性级别（Strong/Session/Bounded/Eventually），按操作类别覆盖全局默认："
+                    "search 对话检索 / stats 管理端统计 / verify 入库后校验"
+    )
+    similarity_threshold: Optional[float] = Field(
+        None, ge=0, le=1,
+        description="相似度阈值（0-1，余弦相似度）：没有文档达到阈值时直接返回预设回复，不调用大模型；0 表示不启用，为空使用全局默认"
+    )
+    no_match_response: Optional[str] = Field(None, description="未命中时的预设回复（为空使用全局默认）")
 
 
 class AgentUpdate(BaseModel):
@@ -22,6 +43,15 @@ class AgentUpdate(BaseModel):
     system_prompt: Optional[str] = None
     status: Optional[str] = None
     description: Optional[str] = None
+    index_type: Optional[str] = None
+    index_params: Optional[Dict[str, Any]] = None
+    search_params: Optional[Dict[str, Any]] = None
+    vector_dtype: Optional[str] = None
+    vector_dim: Optional[int] = Field(None, ge=32)
+    embedding_provider: Optional[str] = None
+    consistency_levels: Optional[Dict[str, str]] = None
+    similarity_threshold: Optional[float] = Field(None, ge=0, le=1)
+    no_match_response: Optional[str] = None
 
 
 class KnowledgeBaseInfo(BaseModel):
@@ -43,6 +73,15 @@ class AgentResponse(BaseModel):
     system_prompt: str
     description: Optional[str]
     knowledge_base: KnowledgeBaseInfo
+    index_type: Optional[str] = None
+    index_params: Optional[Dict[str, Any]] = None
+    search_params: Optional[Dict[str, Any]] = None
+    vector_dtype: Optional[str] = None
+    vector_dim: Optional[int] = None
+    embedding_provider: Optional[str] = None
+    consistency_levels: Optional[Dict[str, str]] = None
+    similarity_threshold: Optional[float] = None
+    no_match_response: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     conversations_using: List[str] = []
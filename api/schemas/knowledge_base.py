@@ -2,7 +2,7 @@
 知识库相关的 Pydantic Schema
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 
 
 class DocumentUploadResponse(BaseModel):
@@ -23,3 +23,20 @@ class KnowledgeBaseStats(BaseModel):
     total_files: int
     total_vectors: int
     files: List[dict]
+
+
+class IndexRebuildRequest(BaseModel):
+    """索引重建请求（字段均为空时按当前配置重建）"""
+    index_type: Optional[str] = Field(
+        None, description="新的索引类型：AUTO/FLAT/IVF_FLAT/IVF_PQ/HNSW/SCANN/DISKANN/IVF_SQ8/HNSW_SQ/IVF_RABITQ"
+    )
+    index_params: Optional[Dict[str, Any]] = Field(None, description="索引构建参数（覆盖默认值）")
+    search_params: Optional[Dict[str, Any]] = Field(None, description="检索参数（覆盖默认值）")
+    vector_dtype: Optional[str] = Field(None, description="新的向量存储精度：FLOAT32/FLOAT16/BFLOAT16（迁移已有向量）")
+    vector_dim: Optional[int] = Field(None, ge=32, description="新的向量截断维度（Matryoshka）")
+
+
+class ReplicaParityRequest(BaseModel):
+    """进程内向量副本一致性校验请求"""
+    queries: List[str] = Field(..., min_length=1, max_length=50, description="用于对比的查询文本")
+    top_k: int = Field(10, ge=1, le=100, description="对比的结果数量")
@@ -2,12 +2,13 @@
 FastAPI 主应用
 Atlas 智能客服后端系统
 """
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from config.settings import settings
 from config.database import init_db
-from api import agents, conversations, knowledge_base, chat, auth, users
+from api import agents, conversations, knowledge_base, chat, auth, users, admin
 
 
 @asynccontextmanager
@@ -18,6 +19,21 @@ async def lifespan(app: FastAPI):
     init_db()
     print("✅ 数据库已初始化")
     
+    # 进程重启前未完成的索引重建无法继续，标记为失败
+    try:
+        from config.database import SessionLocal
+        from repository.agent_repository import IndexRebuildRepository
+        
+        db = SessionLocal()
+        try:
+            interrupted = IndexRebuildRepository.fail_unfinished(db)
+            if interrupted:
+                print(f"⚠️ {interrupted} 个未完成的索引重建已标记为失败")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"⚠️ 检查索引重建记录失败: {e}")
+    
     # 测试 Milvus 连接
     try:
         from application.milvus_service import get_milvus_store
@@ -26,10 +42,44 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"⚠️ Milvus 连接失败: {e}")
     
+    # 预热在线客服所用智能体的 Collection，并启动空闲释放
+    try:
+        import asyncio
+        from config.database import SessionLocal
+        from repository.agent_repository import AgentRepository
+        from domain.processors.vector_store_manager import get_vector_store_manager
+        
+        db = SessionLocal()
+        try:
+            agent_names = AgentRepository.list_names_with_online_conversations(db)
+        finally:
+            db.close()
+        await asyncio.to_thread(get_vector_store_manager().warm_up_collections, agent_names)
+    except Exception as e:
+        print(f"⚠️ Collection 预热失败: {e}")
+    
+    # 启动后台向量清除（处理上次关闭前未完成的软删除）
+    try:
+        from domain.processors.vector_store_manager import get_vector_store_manager
+        get_vector_store_manager().purger.start()
+    except Exception as e:
+        print(f"⚠️ 启动向量清除失败: {e}")
+    
     yield
     
     # 关闭时清理
     print("👋 正在关闭系统...")
+    try:
+        from domain.processors.vector_store_manager import get_vector_store_manager
+        vector_manager = get_vector_store_manager()
+        vector_manager.load_manager.stop()
+        vector_manager.purger.stop()
+        await vector_manager.milvus_store.close_async_client()
+        vector_manager.milvus_store.pool.close()
+        from domain.processors.pdf_loader import shutdown_pdf_pool
+        shutdown_pdf_pool()
+    except Exception as e:
+        print(f"⚠️ 停止后台任务失败: {e}")
 
 
 # 创建 FastAPI 应用
@@ -67,7 +117,27 @@ app = FastAPI(
     redoc_url=None  # 禁用默认 ReDoc 路由
 )
 
-# 配置 CORS
+# multipart 请求体中表单字段与边界的余量
+UPLOAD_BODY_OVERHEAD = 1024 * 1024
+
+
+@app.middleware("http")
+async def limit_request_body(request: Request, call_next):
+    """
+    Content-Length 超过上传上限时在读取请求体之前拒绝（框架会先把整个请求体暂存到磁盘再调用路由）
+    
+    未声明 Content-Length 的分块传输无法在此拦截，部署时应同时在反向代理上限制请求体大小。
+    """
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > settings.MAX_UPLOAD_SIZE + UPLOAD_BODY_OVERHEAD:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"文件过大: > {settings.MAX_UPLOAD_SIZE // 1024 // 1024}MB"}
+        )
+    return await call_next(request)
+
+
+# 配置 CORS（在请求体大小检查之后注册，位于外层，拒绝响应同样带有 CORS 头）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS + ["*"],  # 开发环境允许所有来源
@@ -86,6 +156,7 @@ atlas_router.include_router(agents.router, prefix=settings.API_PREFIX)
 atlas_router.include_router(conversations.router, prefix=settings.API_PREFIX)
 atlas_router.include_router(knowledge_base.router, prefix=settings.API_PREFIX)
 atlas_router.include_router(chat.router, prefix=settings.API_PREFIX)
+atlas_router.include_router(admin.router, prefix=settings.API_PREFIX)
 
 
 @atlas_router.get("/", tags=["系统"])
@@ -136,7 +207,8 @@ async def api_info():
             "agents": f"{settings.ROOT_PATH}{settings.API_PREFIX}/agents",
             "conversations": f"{settings.ROOT_PATH}{settings.API_PREFIX}/conversations",
             "knowledge_base": f"{settings.ROOT_PATH}{settings.API_PREFIX}/knowledge-base",
-            "chat": f"{settings.ROOT_PATH}{settings.API_PREFIX}/chat"
+            "chat": f"{settings.ROOT_PATH}{settings.API_PREFIX}/chat",
+            "admin": f"{settings.ROOT_PATH}{settings.API_PREFIX}/admin"
         },
         "features": {
             "authentication": "JWT",
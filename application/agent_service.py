@@ -3,6 +3,7 @@
 职责：协调 Repository、RAGAgentManager、KnowledgeBaseService
 """
 import uuid
+import threading
 from datetime import datetime
 from typing import List, Optional
 from sqlalchemy.orm import Session
@@ -12,11 +13,18 @@ from repository.agent_repository import AgentRepository
 from domain.managers.rag_agent_manager import RAGAgentManager, get_rag_agent_manager
 from application.knowledge_base_service import KnowledgeBaseService, get_kb_service
 from application.rag_agent import RAGAgent
+from application.embedding_providers import normalize_provider
+from config.milvus import (
+    build_index_profile, build_vector_format, check_index_vector_format, build_consistency_policy
+)
 
 
 class AgentService:
     """智能体管理服务（协调器 / Facade）"""
     
+    # 变更后需要同步到向量存储的索引配置字段（含向量存储格式）
+    INDEX_FIELDS = {"index_type", "index_params", "search_params", "vector_dtype", "vector_dim"}
+    
     def __init__(
         self,
         rag_manager: RAGAgentManager,
@@ -51,8 +59,12 @@ class AgentService:
         if not agent:
             raise ValueError(f"Agent 不存在: {agent_name}")
         
+        self._sync_index_config(agent)
+        
         # 通过 RAGAgentManager 获取或创建实例
-        return self.rag_manager.get_or_create(agent_name, agent.system_prompt)
+        return self.rag_manager.get_or_create(
+            agent_name, agent.system_prompt, agent.similarity_threshold, agent.no_match_response
+        )
     
     # ==================== CRUD 操作 ====================
     
@@ -75,14 +87,28 @@ class AgentService:
             status=AgentStatus.ACTIVE,
             system_prompt=agent_data.system_prompt,
             description=agent_data.description,
-            milvus_collection=f"agent_{agent_data.name}".replace("-", "_")
+            milvus_collection=f"agent_{agent_data.name}".replace("-", "_"),
+            index_type=agent_data.index_type.upper() if agent_data.index_type else None,
+            index_params=agent_data.index_params,
+            search_params=agent_data.search_params,
+            vector_dtype=agent_data.vector_dtype.upper() if agent_data.vector_dtype else None,
+            vector_dim=agent_data.vector_dim,
+            embedding_provider=agent_data.embedding_provider.lower() if agent_data.embedding_provider else None,
+            consistency_levels=agent_data.consistency_levels,
+            similarity_threshold=agent_data.similarity_threshold,
+            no_match_response=agent_data.no_match_response
         )
         
+        # 校验索引配置（不合法时抛出 ValueError）
+        self._sync_index_config(agent)
+        
         # 保存到数据库
         agent = self.agent_repo.create(db, agent)
         
         # 初始化 RAG Agent
-        self.rag_manager.get_or_create(agent.name, agent.system_prompt)
+        self.rag_manager.get_or_create(
+            agent.name, agent.system_prompt, agent.similarity_threshold, agent.no_match_response
+        )
         
         print(f"✅ 智能体已创建: {agent_data.name}")
         return self._to_response(db, agent)
@@ -140,13 +166,64 @@ class AgentService:
             update_dict["status"] = AgentStatus(update_dict["status"])
         if "agent_type" in update_dict:
             update_dict["agent_type"] = AgentType(update_dict["agent_type"])
+        if update_dict.get("index_type"):
+            update_dict["index_type"] = update_dict["index_type"].upper()
+        if update_dict.get("vector_dtype"):
+            update_dict["vector_dtype"] = update_dict["vector_dtype"].upper()
+        
+        # 索引配置 / 存储格式变更：知识库非空时走在线重建（成功后写回配置），否则直接保存
+        index_update = {field: update_dict.pop(field) for field in self.INDEX_FIELDS & update_dict.keys()}
+        rebuild = None
+        if index_update:
+            index_config = {
+                field: index_update.get(field, getattr(agent, field))
+                for field in ("index_type", "index_params", "search_params", "vector_dtype", "vector_dim")
+            }
+            profile = build_index_profile(
+                index_config["index_type"], 0, index_config["index_params"], index_config["search_params"]
+            )
+            check_index_vector_format(
+                profile["index_type"], build_vector_format(index_config["vector_dtype"], index_config["vector_dim"])
+            )
+            milvus_store = self.kb_service.vector_manager.milvus_store
+            if not milvus_store.shared_layout and milvus_store.resolve_collection(agent.name):
+                rebuild = self.kb_service.start_rebuild(db, agent, **index_config)
+            else:
+                update_dict.update(index_config)
+        
+        # Embedding 后端：不同模型的向量空间不同，知识库非空（含待清除的文档）时不可切换；
+        # 切换前校验维度与已有 Collection 兼容
+        if "embedding_provider" in update_dict:
+            provider = update_dict["embedding_provider"]
+            update_dict["embedding_provider"] = provider.lower() if provider else None
+            if normalize_provider(provider) != normalize_provider(agent.embedding_provider) and agent.documents:
+                raise ValueError("知识库非空时不能切换 Embedding 后端，请先清空知识库")
+            self.kb_service.vector_manager.configure_embedding(agent.name, provider)
+        
+        # 一致性级别不影响存储，校验后直接保存并同步
+        if "consistency_levels" in update_dict:
+            build_consistency_policy(update_dict["consistency_levels"])
         
         # 更新数据库
         agent = self.agent_repo.update(db, agent, update_dict)
         
-        # 如果更新了 system_prompt，重新加载 RAG Agent
-        if "system_prompt" in update_dict:
-            self.rag_manager.reload(agent.name, agent.system_prompt)
+        # 如果更新了 system_prompt 或相似度阈值配置，重新加载 RAG Agent
+        if update_dict.keys() & {"system_prompt", "similarity_threshold", "no_match_response"}:
+            self.rag_manager.reload(
+                agent.name, agent.system_prompt, agent.similarity_threshold, agent.no_match_response
+            )
+        
+        if rebuild is not None:
+            threading.Thread(
+                target=self.kb_service.run_rebuild,
+                args=(rebuild.id,),
+                name=f"index-rebuild-{agent.name}",
+                daemon=True
+            ).start()
+        elif index_update:
+            self._sync_index_config(agent)
+        if "consistency_levels" in update_dict:
+            self.kb_service.vector_manager.configure_consistency(agent.name, agent.consistency_levels)
         
         print(f"✅ 智能体已更新: {agent.name}")
         return self._to_response(db, agent)
@@ -161,11 +238,12 @@ class AgentService:
         if agent.conversations:
             raise ValueError(f"无法删除：仍有 {len(agent.conversations)} 个客服在使用此智能体")
         
-        # 清空知识库
-        self.kb_service.clear_knowledge_base(db, agent.id, agent.name)
+        # 清空知识库（同步删除：文档记录随智能体删除，无法再由后台清除）
+        self.kb_service.clear_knowledge_base(db, agent.id, agent.name, wait=True)
         
-        # 移除 RAG Agent 实例
+        # 移除 RAG Agent 实例并释放向量存储句柄与统计
         self.rag_manager.remove(agent.name)
+        self.kb_service.vector_manager.release_agent(agent.name)
         
         # 删除数据库记录
         self.agent_repo.delete(db, agent)
@@ -181,6 +259,7 @@ class AgentService:
         if not agent:
             raise ValueError(f"Agent 不存在: {agent_name}")
         
+        self._sync_index_config(agent)
         return self.kb_service.upload_file(db, agent.id, agent.name, file_path)
     
     def delete_file(self, db: Session, agent_name: str, file_id: str) -> dict:
@@ -195,12 +274,65 @@ class AgentService:
         """获取统计信息"""
         return self.kb_service.get_statistics(agent_name)
     
-    def clear_knowledge_base(self, db: Session, agent_id: str, agent_name: str) -> dict:
+    def clear_knowledge_base(self, db: Session, agent_id: str, agent_name: str, wait: bool = False) -> dict:
         """清空知识库"""
-        return self.kb_service.clear_knowledge_base(db, agent_id, agent_name)
+        return self.kb_service.clear_knowledge_base(db, agent_id, agent_name, wait=wait)
+    
+    def get_purge_status(self, agent_name: str) -> dict:
+        """获取删除清除进度"""
+        return self.kb_service.get_purge_status(agent_name)
+    
+    def start_rebuild(
+        self,
+        db: Session,
+        agent_id: str,
+        index_type: Optional[str] = None,
+        index_params: Optional[dict] = None,
+        search_params: Optional[dict] = None,
+        vector_dtype: Optional[str] = None,
+        vector_dim: Optional[int] = None
+    ) -> dict:
+        """登记在线重建（由调用方在后台执行 run_rebuild）"""
+        agent = self.agent_repo.get_by_id(db, agent_id)
+        if not agent:
+            raise ValueError(f"智能体不存在: {agent_id}")
+        
+        self._sync_index_config(agent)
+        rebuild = self.kb_service.start_rebuild(
+            db, agent, index_type, index_params, search_params, vector_dtype, vector_dim
+        )
+        return self.kb_service.rebuild_to_dict(rebuild)
+    
+    def run_rebuild(self, rebuild_id: str):
+        """执行在线重建"""
+        self.kb_service.run_rebuild(rebuild_id)
+    
+    def list_rebuilds(self, db: Session, agent_id: str) -> List[dict]:
+        """获取重建记录"""
+        return self.kb_service.list_rebuilds(db, agent_id)
     
     # ==================== 辅助方法 ====================
     
+    def _sync_index_config(self, agent: Agent) -> bool:
+        """
+        将智能体的索引配置、向量存储格式、Embedding 后端与一致性级别同步到向量存储
+        
+        Returns:
+            bool: 索引配置是否发生变化
+        """
+        vector_manager = self.kb_service.vector_manager
+        vector_manager.configure_consistency(agent.name, agent.consistency_levels)
+        changed = vector_manager.configure_index(
+            agent.name,
+            agent.index_type,
+            agent.index_params,
+            agent.search_params,
+            agent.vector_dtype,
+            agent.vector_dim
+        )
+        vector_manager.configure_embedding(agent.name, agent.embedding_provider)
+        return changed
+    
     def _get_default_prompt(self, agent_type: str) -> str:
         """获取默认系统提示词"""
         prompts = {
@@ -226,7 +358,7 @@ class AgentService:
         
         kb_info = KnowledgeBaseInfo(
             collection_name=agent.milvus_collection or f"agent_{agent.name}",
-            total_files=len(agent.documents) if agent.documents else 0,
+            total_files=sum(1 for doc in agent.documents if not doc.deleted_at) if agent.documents else 0,
             total_vectors=vector_count,
             total_size_mb=0.0,
             files=[]
@@ -241,6 +373,15 @@ class AgentService:
             system_prompt=agent.system_prompt,
             description=agent.description,
             knowledge_base=kb_info,
+            index_type=agent.index_type,
+            index_params=agent.index_params,
+            search_params=agent.search_params,
+            vector_dtype=agent.vector_dtype,
+            vector_dim=agent.vector_dim,
+            embedding_provider=agent.embedding_provider,
+            consistency_levels=agent.consistency_levels,
+            similarity_threshold=agent.similarity_threshold,
+            no_match_response=agent.no_match_response,
             created_at=agent.created_at,
             updated_at=agent.updated_at
         )
@@ -255,7 +396,7 @@ class AgentService:
         如果需要精确统计，请使用 get_agent (详情接口)
         """
         # 使用数据库的文档记录（已通过 joinedload 预加载）
-        file_count = len(agent.documents) if agent.documents else 0
+        file_count = sum(1 for doc in agent.documents if not doc.deleted_at) if agent.documents else 0
         estimated_vectors = file_count * 100  # 每个文档估算100个向量
         
         # 构建知识库信息（完全不查询 Milvus）
@@ -276,6 +417,15 @@ class AgentService:
             system_prompt=agent.system_prompt,
             description=agent.description,
             knowledge_base=kb_info,
+            index_type=agent.index_type,
+            index_params=agent.index_params,
+            search_params=agent.search_params,
+            vector_dtype=agent.vector_dtype,
+            vector_dim=agent.vector_dim,
+            embedding_provider=agent.embedding_provider,
+            consistency_levels=agent.consistency_levels,
+            similarity_threshold=agent.similarity_threshold,
+            no_match_response=agent.no_match_response,
             created_at=agent.created_at,
             updated_at=agent.updated_at
         )
@@ -0,0 +1,240 @@
+"""
+Embedding 缓存
+职责：缓存查询文本与文档文本块的向量，避免重复调用 Embedding API
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本（全角转半角、合并空白），用作缓存键"""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """查询向量 LRU 缓存（线程安全，支持容量与 TTL 淘汰）"""
+
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 3600):
+        """
+        初始化缓存
+
+        Args:
+            max_size: 最大缓存条目数（<= 0 表示禁用缓存）
+            ttl_seconds: 条目存活时间（秒，<= 0 表示永不过期）
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """读取缓存，未命中或已过期返回 None"""
+        if not self.enabled:
+            return None
+
+        key = (model, normalize_text(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, vector = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model: str, text: str, vector: List[float]):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if not self.enabled:
+            return
+
+        key = (model, normalize_text(text))
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存（计数器保留）"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class ChunkEmbeddingCache:
+    """
+    文本块向量持久化缓存（SQLite，内容寻址）
+
+    键为 sha256(模型名 + 文本)，可在多个 worker 进程间共享同一个数据库文件。
+    """
+
+    # SQLite 单条语句的参数数量上限较低，批量查询时分段执行
+    _QUERY_CHUNK = 500
+
+    def __init__(self, db_path: str):
+        """
+        初始化缓存
+
+        Args:
+            db_path: SQLite 数据库文件路径
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # 允许多进程并发读写
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "key TEXT PRIMARY KEY, "
+                "dim INTEGER NOT NULL, "
+                "vector BLOB NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """打开短连接（提交后关闭），避免跨线程共享连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """生成内容寻址的缓存键"""
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        批量读取缓存
+
+        Args:
+            keys: 缓存键列表
+
+        Returns:
+            dict: 命中的 {key: vector}
+        """
+        found: Dict[str, List[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+
+        with self._connect() as conn:
+            for i in range(0, len(unique_keys), self._QUERY_CHUNK):
+                chunk = unique_keys[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM chunk_embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """
+        批量写入缓存（已存在的键保持不变）
+
+        Args:
+            items: {key: vector}
+        """
+        if not items:
+            return
+
+        rows = [
+            (key, len(vector), np.asarray(vector, dtype=np.float32).tobytes())
+            for key, vector in items.items()
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunk_embeddings (key, dim, vector) VALUES (?, ?, ?)",
+                rows
+            )
+
+    def count(self) -> int:
+        """缓存条目总数"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带持久化缓存的 Embeddings 包装器（用于文档入库）
+
+    embed_documents 先批量查询缓存，仅将未命中的文本发送给底层模型；
+    embed_query 直接透传（查询向量由 QueryEmbeddingCache 负责）。
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: ChunkEmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [ChunkEmbeddingCache.make_key(self.model, text) for text in texts]
+
+        try:
+            cached = self.cache.get_many(keys)
+        except Exception as e:
+            print(f"⚠️ 读取 Embedding 缓存失败: {e}")
+            cached = {}
+
+        # 同一批次内重复的文本只请求一次
+        missing_keys = [key for key in dict.fromkeys(keys) if key not in cached]
+        if missing_keys:
+            key_to_text = dict(zip(keys, texts))
+            new_vectors = self.embeddings.embed_documents([key_to_text[key] for key in missing_keys])
+            new_items = dict(zip(missing_keys, new_vectors))
+            try:
+                self.cache.put_many(new_items)
+            except Exception as e:
+                print(f"⚠️ 写入 Embedding 缓存失败: {e}")
+            cached.update(new_items)
+
+        if len(texts) > 0:
+            print(f"  Embedding 缓存命中: {len(texts) - len(missing_keys)}/{len(texts)}")
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
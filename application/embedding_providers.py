@@ -0,0 +1,400 @@
+"""
+Embedding 后端
+职责：按名称构建 Embedding 后端——远程 API（OpenAI 兼容接口，经入库调度器限速）或
+本地 CPU 推理（ONNX Runtime 运行量化的多语言模型，线程池 + 动态批处理，无网络依赖）；
+并提供与模型一致的 token 计数，供文本分块按模型输入上限切分
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from application.embedding_cache import ChunkEmbeddingCache, CachedEmbeddings
+from application.embedding_scheduler import EmbeddingScheduler, estimate_tokens
+from config.settings import settings
+
+PROVIDER_OPENAI = "openai"
+PROVIDER_ONNX = "onnx"
+EMBEDDING_PROVIDERS = (PROVIDER_OPENAI, PROVIDER_ONNX)
+
+# 模型目录下按顺序查找的 ONNX 文件（优先量化版本）
+ONNX_MODEL_FILES = ("model_quantized.onnx", "model_int8.onnx", "model.onnx")
+
+
+def normalize_provider(provider: Optional[str]) -> str:
+    """
+    校验并规范化后端名称（为空使用全局默认）
+
+    Raises:
+        ValueError: 不支持的后端
+    """
+    name = (provider or settings.EMBEDDING_PROVIDER).lower()
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"不支持的 Embedding 后端: {provider}（可选 {'/'.join(EMBEDDING_PROVIDERS)}）")
+    return name
+
+
+class OnnxEmbeddingModel:
+    """ONNX Runtime 推理模型（会话、分词器与推理线程池，多个 Embeddings 视图共享）"""
+
+    def __init__(
+        self,
+        model_dir: str,
+        workers: int = 2,
+        max_batch_size: int = 32,
+        max_batch_tokens: int = 8192,
+        max_length: int = 512,
+        pooling: str = "mean"
+    ):
+        """
+        Args:
+            model_dir: 模型目录（含 tokenizer.json 与 ONNX 文件，ONNX 文件可位于 onnx/ 子目录）
+            workers: 并行推理的批次数（每个批次使用 CPU 核数 / workers 个线程）
+            max_batch_size: 单批最大文本数
+            max_batch_tokens: 单批最大 token 数（按补齐后的长度计，限制内存与单批耗时）
+            max_length: 单条文本截断长度
+            pooling: 池化方式（mean 平均池化 / cls 取首个 token）
+
+        Raises:
+            ValueError: 未安装本地推理依赖（onnxruntime / tokenizers）
+            FileNotFoundError: 模型目录中没有 ONNX 文件
+        """
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ValueError(
+                f"ONNX Embedding 后端需要 {e.name}，请安装可选依赖 echo[onnx]（pip install -e '.[onnx]'）"
+            ) from e
+
+        model_path = next(
+            (
+                os.path.join(directory, name)
+                for directory in (model_dir, os.path.join(model_dir, "onnx"))
+                for name in ONNX_MODEL_FILES
+                if os.path.isfile(os.path.join(directory, name))
+            ),
+            None
+        )
+        if model_path is None:
+            raise FileNotFoundError(f"未找到 ONNX 模型文件: {model_dir}（{'/'.join(ONNX_MODEL_FILES)}）")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.no_padding()  # 按批内最长文本补齐，避免补齐到 max_length
+        # 计数用分词器不截断，得到文本的真实 token 数（含特殊 token）
+        self.counting_tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.counting_tokenizer.no_truncation()
+        self.counting_tokenizer.no_padding()
+
+        self.workers = max(1, workers)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.model_path = model_path
+        self.max_length = max_length
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_tokens = max(max_length, max_batch_tokens)
+        self.pooling = pooling
+        # InferenceSession.run 线程安全，多个批次在线程池中并行推理
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="onnx-embedding")
+        print(f"✅ ONNX Embedding 模型已加载: {model_path}（并行 {self.workers} × {options.intra_op_num_threads} 线程）")
+
+    def _plan_batches(self, lengths: List[int]) -> List[List[int]]:
+        """动态批处理：按长度降序分组，每批受文本数与补齐后 token 数两个上限约束"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches, current = [], []
+        for i in order:
+            # 降序排列，批内首条即最长文本，补齐后的 token 数 = 首条长度 × 条数
+            if current and (
+                len(current) >= self.max_batch_size
+                or lengths[current[0]] * (len(current) + 1) > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run(self, encodings: List) -> np.ndarray:
+        """推理一批（已分词），返回 L2 归一化后的 float32 矩阵"""
+        width = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.zeros((len(encodings), width), dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), width), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.ids)] = 1
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        output = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+
+        if output.ndim == 3:
+            # last_hidden_state (n, seq, dim) -> 池化
+            if self.pooling == "cls":
+                output = output[:, 0]
+            else:
+                mask = attention_mask[:, :, None].astype(np.float32)
+                output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        output = output.astype(np.float32)
+        return output / np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        向量化文本（结果顺序与输入一致）
+
+        Returns:
+            np.ndarray: float32 矩阵 (n, dim)
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(texts)
+        batches = self._plan_batches([len(encoding.ids) for encoding in encodings])
+        futures = [
+            self._executor.submit(self._run, [encodings[i] for i in batch])
+            for batch in batches
+        ]
+        matrix = None
+        for batch, future in zip(batches, futures):
+            vectors = future.result()
+            if matrix is None:
+                matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            matrix[batch] = vectors
+        return matrix
+
+    def count_tokens(self, text: str) -> int:
+        """文本的 token 数（与推理时的分词一致，超过 max_length 的部分推理时会被截断）"""
+        return len(self.counting_tokenizer.encode(text).ids)
+
+    def close(self):
+        """关闭推理线程池"""
+        self._executor.shutdown(wait=False)
+
+
+class TiktokenCounter:
+    """
+    远程模型的 token 计数（tiktoken 的 Rust BPE 实现，中文按字节级 BPE 计数准确）
+
+    编码表首次计数时加载；模型不在 tiktoken 映射中（如兼容接口的第三方模型）时使用 cl100k_base，
+    编码表无法加载（离线且无本地缓存）时按 UTF-8 字节数估算。
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self._count: Optional[Callable[[str], int]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Callable[[str], int]:
+        try:
+            import tiktoken
+            try:
+                encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            print(f"✅ Token 计数使用 tiktoken 编码: {encoding.name}")
+            return lambda text: len(encoding.encode_ordinary(text))
+        except Exception as e:
+            print(f"⚠️ 无法加载 tiktoken 编码，按字节数估算 token 数: {e}")
+            return estimate_tokens
+
+    def __call__(self, text: str) -> int:
+        if self._count is None:
+            with self._lock:
+                if self._count is None:
+                    self._count = self._load()
+        return self._count(text)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    ONNX 模型的 Embeddings 视图
+
+    E5 等非对称检索模型要求查询与文档使用不同前缀（"query: " / "passage: "），
+    查询与入库各用一个视图，共享同一个模型。
+    """
+
+    def __init__(self, model: OnnxEmbeddingModel, prefix: str = ""):
+        self.model = model
+        self.prefix = prefix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed([self.prefix + text for text in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingBackend:
+    """
+    Embedding 后端
+
+    query_embeddings 用于对话检索（由 QueryEmbeddingCache 缓存），
+    document_embeddings 用于入库（经文本块持久化缓存）；
+    count_tokens 按文档向量化时的实际输入计数，单条不超过 max_tokens 即不会被截断。
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        query_embeddings: Embeddings,
+        document_embeddings: Embeddings,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        max_tokens: int = 512,
+        scheduler: Optional[EmbeddingScheduler] = None,
+        onnx_model: Optional[OnnxEmbeddingModel] = None
+    ):
+        self.provider = provider
+        self.model = model  # 缓存键使用的模型标识
+        self.query_embeddings = query_embeddings
+        self.document_embeddings = document_embeddings
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.scheduler = scheduler
+        self.onnx_model = onnx_model
+        self._dim: Optional[int] = None
+        self._dim_lock = threading.Lock()
+
+    @property
+    def dim(self) -> int:
+        """模型输出的完整维度（首次访问时向量化一条探测文本）"""
+        if self._dim is None:
+            with self._dim_lock:
+                if self._dim is None:
+                    self._dim = len(self.query_embeddings.embed_query("dimension probe"))
+        return self._dim
+
+    def get_stats(self) -> Dict:
+        """后端运行统计（用于监控）"""
+        stats = {"provider": self.provider, "model": self.model, "dim": self._dim, "max_tokens": self.max_tokens}
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.get_stats()
+        if self.onnx_model is not None:
+            stats["model_path"] = self.onnx_model.model_path
+            stats["workers"] = self.onnx_model.workers
+        return stats
+
+    def close(self):
+        """释放线程池"""
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self.onnx_model is not None:
+            self.onnx_model.close()
+
+
+def _with_chunk_cache(embeddings: Embeddings, model: str, chunk_cache: Optional[ChunkEmbeddingCache]) -> Embeddings:
+    if chunk_cache is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, model, chunk_cache)
+
+
+def _build_openai_backend(chunk_cache: Optional[ChunkEmbeddingCache]) -> EmbeddingBackend:
+    embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    base_url = os.getenv("OPENAI_BASE_URL", "")
+    api_key = os.getenv("OPENAI_API_KEY", "")
+    chunk_size = 10
+
+    print(f"🔧 初始化 Embedding 模型: {embedding_model}")
+    embeddings = OpenAIEmbeddings(
+        model=embedding_model,
+        api_key=api_key,
+        base_url=base_url,
+        check_embedding_ctx_length=False,  # 禁用 token 长度检查
+        chunk_size=chunk_size,  # 关键：限制批处理大小
+        max_retries=3,
+        timeout=30.0
+    )
+
+    # 入库向量化经进程级调度器（并发、限速、自适应批大小与重试），使用独立客户端：
+    # 单次调用即一次请求，客户端自身不重试
+    scheduler = EmbeddingScheduler(
+        OpenAIEmbeddings(
+            model=embedding_model,
+            api_key=api_key,
+            base_url=base_url,
+            check_embedding_ctx_length=False,
+            chunk_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+            max_retries=0,
+            timeout=30.0
+        ),
+        concurrency=settings.EMBEDDING_CONCURRENCY,
+        rpm_limit=settings.EMBEDDING_RPM_LIMIT,
+        tpm_limit=settings.EMBEDDING_TPM_LIMIT,
+        min_batch_size=settings.EMBEDDING_MIN_BATCH_SIZE,
+        max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+        target_latency=settings.EMBEDDING_TARGET_LATENCY,
+        max_retries=settings.EMBEDDING_MAX_RETRIES
+    )
+    print(f"✅ Embedding 模型已初始化: {embedding_model}")
+    return EmbeddingBackend(
+        PROVIDER_OPENAI,
+        embedding_model,
+        query_embeddings=embeddings,
+        document_embeddings=_with_chunk_cache(scheduler, embedding_model, chunk_cache),
+        count_tokens=TiktokenCounter(embedding_model),
+        max_tokens=settings.EMBEDDING_MAX_TOKENS,
+        scheduler=scheduler
+    )
+
+
+def _build_onnx_backend(chunk_cache: Optional[ChunkEmbeddingCache]) -> EmbeddingBackend:
+    model_dir = settings.ONNX_EMBEDDING_MODEL_DIR
+    if not model_dir:
+        raise ValueError("未配置 ONNX_EMBEDDING_MODEL_DIR，无法使用本地 Embedding 后端")
+
+    print(f"🔧 加载 ONNX Embedding 模型: {model_dir}")
+    onnx_model = OnnxEmbeddingModel(
+        model_dir,
+        workers=settings.ONNX_EMBEDDING_WORKERS,
+        max_batch_size=settings.ONNX_EMBEDDING_MAX_BATCH_SIZE,
+        max_batch_tokens=settings.ONNX_EMBEDDING_MAX_BATCH_TOKENS,
+        max_length=settings.ONNX_EMBEDDING_MAX_LENGTH,
+        pooling=settings.ONNX_EMBEDDING_POOLING
+    )
+    # 模型名与同名远程模型区分
+    model = f"onnx:{os.path.basename(os.path.normpath(model_dir))}"
+    document_prefix = settings.ONNX_EMBEDDING_DOCUMENT_PREFIX
+    # 持久化缓存键：实际加载的 ONNX 文件（量化/完整版本、同名的不同目录）与文档前缀不同，向量即不同
+    model_path = os.path.realpath(onnx_model.model_path)
+    cache_model = f"{model}|{model_path}|{os.path.getsize(model_path)}|{document_prefix}"
+    return EmbeddingBackend(
+        PROVIDER_ONNX,
+        model,
+        query_embeddings=OnnxEmbeddings(onnx_model, settings.ONNX_EMBEDDING_QUERY_PREFIX),
+        document_embeddings=_with_chunk_cache(
+            OnnxEmbeddings(onnx_model, document_prefix), cache_model, chunk_cache
+        ),
+        # 文档向量化时文本带前缀，计数同样带前缀
+        count_tokens=lambda text: onnx_model.count_tokens(document_prefix + text),
+        max_tokens=onnx_model.max_length,
+        onnx_model=onnx_model
+    )
+
+
+def build_embedding_backend(provider: str, chunk_cache: Optional[ChunkEmbeddingCache] = None) -> EmbeddingBackend:
+    """
+    构建 Embedding 后端
+
+    Args:
+        provider: 后端名称（openai / onnx）
+        chunk_cache: 文本块持久化缓存（为空不缓存入库向量）
+
+    Returns:
+        EmbeddingBackend: 后端实例
+
+    Raises:
+        ValueError: 不支持的后端或缺少配置
+    """
+    provider = normalize_provider(provider)
+    if provider == PROVIDER_ONNX:
+        return _build_onnx_backend(chunk_cache)
+    return _build_openai_backend(chunk_cache)
@@ -0,0 +1,209 @@
+"""
+Embedding 请求调度
+职责：入库向量化的进程级调度——有界并发、令牌桶限速（RPM/TPM），
+按观测到的延迟与 429 限流自适应调整批大小，批次失败时带抖动退避重试
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数（UTF-8 字节数 / 3：中文约 1 字 1 token，英文偏保守）"""
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """判断异常是否为服务商限流（HTTP 429）"""
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    message = str(exc).lower()
+    return "429" in message or "rate limit" in message
+
+
+class TokenBucket:
+    """令牌桶限速器（线程安全）"""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10):
+        """
+        Args:
+            per_minute: 每分钟补充的令牌数
+            burst_seconds: 桶容量（以补充秒数计），允许的突发量
+        """
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1):
+        """取走令牌，不足时阻塞等待（超过桶容量的请求按容量计，避免永久等待）"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """清空令牌（收到 429 时调用，让所有并发请求一起放慢）"""
+        with self._lock:
+            self._refill()
+            self.tokens = 0
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Embedding 请求调度器（进程内所有智能体共享）
+
+    embed_documents 将文本按当前批大小切分，经共享线程池并发请求；
+    每批请求前按 RPM / TPM 取令牌。批次成功且延迟低于目标时逐步增大批大小，
+    延迟超标时缩小，遇到 429 时减半并清空令牌桶。
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        concurrency: int = 4,
+        rpm_limit: int = 0,
+        tpm_limit: int = 0,
+        min_batch_size: int = 1,
+        max_batch_size: int = 10,
+        target_latency: float = 5.0,
+        max_retries: int = 5,
+        max_backoff: float = 30.0
+    ):
+        """
+        Args:
+            embeddings: 底层 Embedding 客户端（每次调用即一次请求，自身不重试）
+            concurrency: 同时进行的请求数
+            rpm_limit: 每分钟请求数上限（0 不限）
+            tpm_limit: 每分钟 token 数上限（0 不限）
+            min_batch_size: 批大小下限
+            max_batch_size: 批大小上限（服务商单次请求的条数限制）
+            target_latency: 单次请求的目标延迟（秒），超过则缩小批大小
+            max_retries: 单批最大重试次数
+            max_backoff: 重试退避的最大间隔（秒）
+        """
+        self.embeddings = embeddings
+        self.concurrency = max(1, concurrency)
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.request_limiter: Optional[TokenBucket] = TokenBucket(rpm_limit) if rpm_limit > 0 else None
+        self.token_limiter: Optional[TokenBucket] = TokenBucket(tpm_limit) if tpm_limit > 0 else None
+
+        self.batch_size = self.max_batch_size
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embedding")
+        # 限制已提交的批次数：切分下一批前等待空位，使其使用最新的批大小
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "retries": 0, "rate_limited": 0, "failed_batches": 0}
+        self._latency: Optional[float] = None  # 请求延迟的指数移动平均
+
+    # ==================== 调度 ====================
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        并发向量化文本（结果顺序与输入一致）
+
+        Raises:
+            Exception: 某一批重试耗尽后仍失败
+        """
+        futures = []
+        start = 0
+        while start < len(texts):
+            self._slots.acquire()
+            batch = texts[start:start + self.batch_size]
+            future = self._executor.submit(self._run_batch, batch)
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+            start += len(batch)
+
+        vectors: List[List[float]] = []
+        for future in futures:
+            vectors.extend(future.result())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _throttle(self, batch: List[str]):
+        if self.request_limiter is not None:
+            self.request_limiter.acquire()
+        if self.token_limiter is not None:
+            self.token_limiter.acquire(sum(estimate_tokens(text) for text in batch))
+
+    def _run_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self._throttle(batch)
+            started = time.monotonic()
+            try:
+                vectors = self.embeddings.embed_documents(batch)
+            except Exception as e:
+                rate_limited = is_rate_limited(e)
+                self._on_failure(rate_limited)
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self._stats["failed_batches"] += 1
+                    raise
+                # 指数退避 + 抖动，避免并发批次同时重试
+                delay = min(self.max_backoff, 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"⚠️ Embedding 请求失败（{'限流' if rate_limited else e}），{delay:.1f}s 后重试 "
+                      f"[{attempt + 1}/{self.max_retries}]")
+                time.sleep(delay)
+                continue
+            self._on_success(len(batch), time.monotonic() - started)
+            return vectors
+
+    # ==================== 自适应批大小 ====================
+
+    def _on_success(self, size: int, latency: float):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["texts"] += size
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            if latency > self.target_latency:
+                self.batch_size = max(self.min_batch_size, int(self.batch_size * 0.75))
+            elif size >= self.batch_size:
+                # 满批且延迟达标：加性增大
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 8))
+
+    def _on_failure(self, rate_limited: bool):
+        with self._lock:
+            self._stats["retries"] += 1
+            if rate_limited:
+                self._stats["rate_limited"] += 1
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        if rate_limited:
+            for limiter in (self.request_limiter, self.token_limiter):
+                if limiter is not None:
+                    limiter.drain()
+
+    def get_stats(self) -> Dict:
+        """调度器运行统计（用于监控）"""
+        with self._lock:
+            return {
+                **self._stats,
+                "batch_size": self.batch_size,
+                "concurrency": self.concurrency,
+                "avg_latency": round(self._latency, 3) if self._latency is not None else None
+            }
+
+    def close(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=False)
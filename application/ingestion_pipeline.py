@@ -0,0 +1,82 @@
+"""
+入库流水线
+职责：以有界队列连接入库各阶段（解析 → 分割 → 向量化 → 插入），
+上游在后台线程中领先下游至多若干批，内存占用由队列深度而非文件大小决定
+"""
+import itertools
+import queue
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+_END = object()
+
+
+class _Failure:
+    """生产方抛出的异常（交给消费方重新抛出）"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """按固定大小分批（最后一批可能不足）"""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, max(1, size))):
+        yield batch
+
+
+def prefetch(iterable: Iterable[T], depth: int = 4, name: str = "ingest-prefetch") -> Iterator[T]:
+    """
+    在后台线程中迭代 iterable，经有界队列交给消费方
+
+    生产方最多领先 depth 项，队列满时阻塞；生产方抛出的异常在消费方重新抛出。
+    消费方提前结束（关闭生成器）时通知生产方停止，并关闭源生成器。
+
+    Args:
+        iterable: 上游数据源（如逐页解析、逐块分割的生成器）
+        depth: 队列深度
+        name: 后台线程名称
+
+    Yields:
+        上游产生的每一项
+    """
+    items: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put(item):
+                    return
+            put(_END)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(source, "close", None)
+            if stop.is_set() and close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
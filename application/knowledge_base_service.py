@@ -3,14 +3,17 @@
 职责：文档上传、删除、列表、统计（协调 DocumentProcessor 和 VectorStoreManager）
 """
 import os
+import threading
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 from sqlalchemy.orm import Session
+from config.database import SessionLocal
+from config.milvus import build_index_profile, build_vector_format, check_index_vector_format
 from domain.processors.document_processor import DocumentProcessor
 from domain.processors.vector_store_manager import VectorStoreManager
-from repository.agent_repository import DocumentRepository
-from domain.entities import Document, DocumentStatus
+from repository.agent_repository import AgentRepository, DocumentRepository, IndexRebuildRepository
+from domain.entities import Agent, Document, DocumentStatus, IndexRebuild, IndexRebuildStatus
 
 
 class KnowledgeBaseService:
@@ -31,6 +34,8 @@ class KnowledgeBaseService:
         self.doc_processor = doc_processor
         self.vector_manager = vector_manager
         self.doc_repo = DocumentRepository()
+        self.agent_repo = AgentRepository()
+        self.rebuild_repo = IndexRebuildRepository()
     
     def upload_file(
         self,
@@ -72,25 +77,36 @@ class KnowledgeBaseService:
         print(f"📝 文档记录已创建: {filename} (status=processing)")
         
         try:
-            # 2. 使用 DocumentProcessor 处理文档
-            documents, stats = self.doc_processor.process_file(
+            # 2-3. 流式入库：DocumentProcessor 逐页解析、按智能体 Embedding 模型的 token 数分割产出文本块，
+            # VectorStoreManager 边接收边向量化、插入（解析失败时清理已写入的向量）
+            backend = self.vector_manager.milvus_store.embedding_backend_for(agent_name)
+            chunks = self.doc_processor.iter_chunks(
                 file_path=file_path,
                 file_id=file_id,
                 filename=filename,
-                agent_name=agent_name
+                agent_name=agent_name,
+                length_function=backend.count_tokens,
+                max_tokens=backend.max_tokens
             )
-            
-            # 3. 使用 VectorStoreManager 添加到向量数据库
-            result = self.vector_manager.add_documents(agent_name, documents)
+            try:
+                result = self.vector_manager.add_documents(agent_name, chunks)
+            except Exception:
+                self.vector_manager.delete_by_file_id(agent_name, file_id)
+                raise
             
             # 4. 更新数据库状态为 ready
             self.doc_repo.update_status(
                 db=db,
                 doc_id=file_id,
                 status=DocumentStatus.READY,
-                chunks_count=result['added']
+                chunks_count=result['added'],
+                vector_ids=result['vector_ids'].get(file_id, []),
+                vector_collection=result['vector_collection']
             )
             
+            # 数据规模变化后，AUTO 索引跨过阈值时登记在线重建
+            self.start_auto_rebuild(db, agent_id)
+            
             # 5. 删除源文件
             try:
                 os.remove(file_path)
@@ -132,7 +148,7 @@ class KnowledgeBaseService:
         file_id: str
     ) -> Dict[str, Any]:
         """
-        删除文档
+        删除文档（软删除：标记后立即返回，检索随即排除该文件，向量由后台批量清除）
         
         Args:
             db: 数据库会话
@@ -143,22 +159,18 @@ class KnowledgeBaseService:
             dict: 删除结果
         """
         try:
-            # 1. 从向量数据库删除
-            vector_success = self.vector_manager.delete_by_file_id(agent_name, file_id)
-            
-            # 2. 从数据库删除记录
-            db_success = self.doc_repo.delete(db, file_id)
-            
-            if db_success:
-                return {
-                    "success": True,
-                    "message": "文件删除成功"
-                }
-            else:
+            document = self.doc_repo.mark_deleted(db, file_id)
+            if document is None:
                 return {
                     "success": False,
                     "message": "文件不存在"
                 }
+            
+            self.vector_manager.purger.mark_deleted(agent_name, [file_id])
+            return {
+                "success": True,
+                "message": "文件已删除，向量正在后台清除"
+            }
         except Exception as e:
             return {
                 "success": False,
@@ -184,7 +196,7 @@ class KnowledgeBaseService:
                 'filename': doc.filename,
                 'file_size': doc.file_size,
                 'file_type': doc.file_type,
-                'status': doc.status.value,
+                'status': 'deleting' if doc.deleted_at else doc.status.value,
                 'chunks_count': doc.chunks_count,
                 'processing_progress': doc.processing_progress,
                 'error_message': doc.error_message,
@@ -206,24 +218,49 @@ class KnowledgeBaseService:
         """
         return self.vector_manager.get_statistics(agent_name)
     
+    def get_purge_status(self, agent_name: str) -> Dict[str, Any]:
+        """
+        获取删除清除进度
+        
+        Args:
+            agent_name: 智能体名称
+            
+        Returns:
+            dict: 待清除文件数、已清除数量、最近一次清除时间与错误
+        """
+        return self.vector_manager.purger.get_status(agent_name)
+    
     def clear_knowledge_base(
         self,
         db: Session,
         agent_id: str,
-        agent_name: str
+        agent_name: str,
+        wait: bool = False
     ) -> Dict[str, Any]:
         """
         清空知识库
         
+        默认软删除所有文档后立即返回，由后台删除整个 Collection；
+        wait=True 时同步删除（删除智能体、修复不一致时使用）。
+        
         Args:
             db: 数据库会话
             agent_id: 智能体 ID
             agent_name: 智能体名称
+            wait: 是否同步删除向量与文档记录
             
         Returns:
             dict: 清空结果
         """
         try:
+            if not wait:
+                doc_ids = self.doc_repo.mark_deleted_by_agent(db, agent_id)
+                self.vector_manager.purger.mark_deleted(agent_name, doc_ids, clear=True)
+                return {
+                    "success": True,
+                    "message": f"知识库已清空，{len(doc_ids)} 个文档正在后台清除"
+                }
+            
             # 1. 清空向量数据库
             vector_success = self.vector_manager.clear_collection(agent_name)
             
@@ -245,6 +282,217 @@ class KnowledgeBaseService:
                 "success": False,
                 "message": f"清空失败: {str(e)}"
             }
+    
+    # ==================== 在线重建 ====================
+    
+    def start_rebuild(
+        self,
+        db: Session,
+        agent: Agent,
+        index_type: Optional[str] = None,
+        index_params: Optional[Dict[str, Any]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        vector_dtype: Optional[str] = None,
+        vector_dim: Optional[int] = None
+    ) -> IndexRebuild:
+        """
+        登记一次在线重建（实际执行见 run_rebuild）
+        
+        未指定 index_type 时沿用智能体当前的索引配置（用于大量删除后的压缩重建）；
+        指定时重建成功后新配置会写回智能体。
+        
+        Args:
+            db: 数据库会话
+            agent: 智能体
+            index_type: 新的索引类型
+            index_params: 新的索引构建参数
+            search_params: 新的检索参数
+            vector_dtype: 新的向量存储精度（为空沿用智能体配置）
+            vector_dim: 新的截断维度（为空沿用智能体配置）
+            
+        Returns:
+            IndexRebuild: 重建记录（status=pending）
+            
+        Raises:
+            ValueError: 已有进行中的重建、知识库为空或索引配置不合法
+        """
+        if self.rebuild_repo.get_active_by_agent(db, agent.id):
+            raise ValueError(f"智能体 {agent.name} 已有进行中的索引重建")
+        
+        milvus_store = self.vector_manager.milvus_store
+        if milvus_store.shared_layout:
+            raise ValueError("共享存储布局下索引由共享 Collection 统一管理，不支持按智能体重建")
+        
+        source = milvus_store.resolve_collection(agent.name)
+        if source is None:
+            raise ValueError(f"知识库为空，无需重建: {agent.name}")
+        
+        if index_type is None:
+            index_type, index_params, search_params = agent.index_type, agent.index_params, agent.search_params
+        index_type = index_type.upper() if index_type else None
+        vector_dtype = (vector_dtype or agent.vector_dtype or "").upper() or None
+        vector_dim = vector_dim or agent.vector_dim
+        
+        # 校验配置（不合法时抛出 ValueError）
+        profile = build_index_profile(index_type, 0, index_params, search_params)
+        check_index_vector_format(profile["index_type"], build_vector_format(vector_dtype, vector_dim))
+        
+        rebuild = IndexRebuild(
+            id=str(uuid.uuid4()),
+            agent_id=agent.id,
+            source_collection=source,
+            index_type=index_type,
+            index_params=index_params,
+            search_params=search_params,
+            vector_dtype=vector_dtype,
+            vector_dim=vector_dim,
+            status=IndexRebuildStatus.PENDING,
+            progress=0
+        )
+        return self.rebuild_repo.create(db, rebuild)
+    
+    def start_auto_rebuild(self, db: Session, agent_id: str) -> Optional[IndexRebuild]:
+        """
+        AUTO 索引的数据规模跨过阈值（如 FLAT -> HNSW）时，登记并在后台执行在线重建
+        
+        与手动重建走同一路径（重建记录、并发重建检查）；检查或登记失败不影响调用方。
+        
+        Args:
+            db: 数据库会话
+            agent_id: 智能体 ID
+            
+        Returns:
+            Optional[IndexRebuild]: 登记的重建记录，无需重建时返回 None
+        """
+        try:
+            agent = self.agent_repo.get_by_id(db, agent_id)
+            if agent is None or self.vector_manager.index_needs_rebuild(agent.name) is None:
+                return None
+            rebuild = self.start_rebuild(db, agent)
+        except Exception as e:
+            print(f"⚠️ 跳过索引自动调整: {e}")
+            return None
+        
+        print(f"📈 数据规模跨过 AUTO 索引阈值，开始在线重建: {agent.name}")
+        threading.Thread(
+            target=self.run_rebuild,
+            args=(rebuild.id,),
+            name=f"index-rebuild-{agent.name}",
+            daemon=True
+        ).start()
+        return rebuild
+    
+    def run_rebuild(self, rebuild_id: str):
+        """
+        执行在线重建（后台任务，使用独立的数据库会话）
+        
+        Args:
+            rebuild_id: 重建记录 ID
+        """
+        db = SessionLocal()
+        try:
+            rebuild = self.rebuild_repo.get_by_id(db, rebuild_id)
+            if not rebuild:
+                return
+            agent = rebuild.agent
+            
+            profile = build_index_profile(
+                index_type=rebuild.index_type,
+                num_entities=self.vector_manager.get_vector_count(agent.name),
+                index_params=rebuild.index_params,
+                search_params=rebuild.search_params
+            )
+            
+            stage_status = {
+                "copying": IndexRebuildStatus.COPYING,
+                "indexing": IndexRebuildStatus.INDEXING,
+                "swapping": IndexRebuildStatus.SWAPPING
+            }
+            last_progress = {"value": -1}
+            
+            def on_progress(stage: str, copied: int, total: int):
+                # 复制阶段占 0-80%，建索引 80-95%，切换 95-100%
+                if stage == "copying":
+                    progress = int(80 * copied / total) if total else 80
+                    if progress == last_progress["value"]:
+                        return
+                else:
+                    progress = 80 if stage == "indexing" else 95
+                last_progress["value"] = progress
+                self.rebuild_repo.update(db, rebuild_id, {
+                    "status": stage_status[stage],
+                    "progress": progress,
+                    "total_vectors": total,
+                    "copied_vectors": copied
+                })
+            
+            vector_format = build_vector_format(rebuild.vector_dtype, rebuild.vector_dim)
+            result = self.vector_manager.rebuild_index(agent.name, profile, on_progress, vector_format)
+            
+            # 写回索引配置与存储格式，并同步到向量存储（刷新检索参数）
+            self.agent_repo.update(db, agent, {
+                "index_type": rebuild.index_type,
+                "index_params": rebuild.index_params,
+                "search_params": rebuild.search_params,
+                "vector_dtype": rebuild.vector_dtype,
+                "vector_dim": rebuild.vector_dim
+            })
+            self.vector_manager.configure_index(
+                agent.name, rebuild.index_type, rebuild.index_params, rebuild.search_params,
+                rebuild.vector_dtype, rebuild.vector_dim
+            )
+            
+            self.rebuild_repo.update(db, rebuild_id, {
+                "status": IndexRebuildStatus.COMPLETED,
+                "progress": 100,
+                "target_collection": result["target"],
+                "copied_vectors": result["copied"]
+            })
+        except Exception as e:
+            print(f"❌ 索引重建失败: {e}")
+            import traceback
+            traceback.print_exc()
+            db.rollback()
+            self.rebuild_repo.update(db, rebuild_id, {
+                "status": IndexRebuildStatus.FAILED,
+                "error_message": str(e)
+            })
+        finally:
+            db.close()
+    
+    def list_rebuilds(self, db: Session, agent_id: str) -> List[Dict[str, Any]]:
+        """
+        获取智能体的重建记录（最新的在前）
+        
+        Args:
+            db: 数据库会话
+            agent_id: 智能体 ID
+            
+        Returns:
+            list: 重建记录列表
+        """
+        return [self.rebuild_to_dict(r) for r in self.rebuild_repo.list_by_agent(db, agent_id)]
+    
+    @staticmethod
+    def rebuild_to_dict(rebuild: IndexRebuild) -> Dict[str, Any]:
+        """重建记录转换为字典"""
+        return {
+            'id': rebuild.id,
+            'status': rebuild.status.value,
+            'progress': rebuild.progress,
+            'index_type': rebuild.index_type,
+            'index_params': rebuild.index_params,
+            'search_params': rebuild.search_params,
+            'vector_dtype': rebuild.vector_dtype,
+            'vector_dim': rebuild.vector_dim,
+            'source_collection': rebuild.source_collection,
+            'target_collection': rebuild.target_collection,
+            'total_vectors': rebuild.total_vectors,
+            'copied_vectors': rebuild.copied_vectors,
+            'error_message': rebuild.error_message,
+            'created_at': rebuild.created_at.strftime('%Y-%m-%d %H:%M:%S') if rebuild.created_at else None,
+            'finished_at': rebuild.finished_at.strftime('%Y-%m-%d %H:%M:%S') if rebuild.finished_at else None
+        }
 
 
 # 全局单例
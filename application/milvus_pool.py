@@ -0,0 +1,305 @@
+"""
+Milvus 连接池
+职责：维护多个 Milvus 连接别名（各自独立的 gRPC 通道），按负载分配请求，
+后台健康检查并以指数退避重连；所有连接均不可用时快速失败
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import grpc
+from pymilvus import connections, utility, MilvusClient
+from pymilvus.exceptions import (
+    MilvusException, MilvusUnavailableException, ConnectError, ConnectionNotExistException
+)
+
+
+class MilvusUnavailableError(RuntimeError):
+    """Milvus 不可用（连接池中没有健康连接）"""
+
+
+# 视为连接故障的 gRPC 状态码（其余错误如参数错误不影响连接健康）
+_CONNECTION_STATUS_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    """判断异常是否由连接故障（服务不可达、调用超时）引起"""
+    if isinstance(exc, (MilvusUnavailableException, ConnectError, ConnectionNotExistException,
+                        grpc.FutureTimeoutError)):
+        return True
+    if isinstance(exc, (grpc.RpcError, MilvusException)):
+        code = getattr(exc, "code", None)
+        if callable(code):
+            code = code()
+        return code in _CONNECTION_STATUS_CODES
+    return False
+
+
+class PooledConnection:
+    """连接池中的单个连接"""
+
+    def __init__(self, alias: str):
+        self.alias = alias
+        self.client: Optional[MilvusClient] = None  # 绑定该别名的 MilvusClient
+        self.healthy = False
+        self.in_flight = 0        # 正在进行的请求数
+        self.failures = 0         # 连续失败次数（决定重连退避时长）
+        self.retry_at = 0.0       # 下次允许重连的时间（monotonic）
+        self.last_error: Optional[str] = None
+        self.reconnect_lock = threading.Lock()  # 避免多个线程同时重连同一连接
+
+
+class MilvusConnectionPool:
+    """Milvus 连接池（线程安全）"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        db_name: str = "default",
+        size: int = 4,
+        connect_timeout: float = 5.0,
+        call_timeout: float = 10.0,
+        health_check_interval: float = 15.0,
+        max_backoff: float = 60.0,
+        alias_prefix: str = "atlas"
+    ):
+        """
+        初始化连接池（不立即连接，需调用 start）
+
+        Args:
+            host: Milvus 地址
+            port: Milvus 端口
+            user: 用户名
+            password: 密码
+            db_name: 数据库名称
+            size: 连接数量
+            connect_timeout: 建立连接 / 健康检查的超时（秒）
+            call_timeout: 单次检索、写入、删除、统计调用的截止时间（秒）
+            health_check_interval: 后台健康检查间隔（秒，<= 0 不启动后台检查）
+            max_backoff: 重连退避的最大间隔（秒）
+            alias_prefix: 连接别名前缀
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.db_name = db_name
+        self.connect_timeout = connect_timeout
+        self.call_timeout = call_timeout
+        self.health_check_interval = health_check_interval
+        self.max_backoff = max_backoff
+        self._connections = [PooledConnection(f"{alias_prefix}_{i}") for i in range(max(1, size))]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def size(self) -> int:
+        return len(self._connections)
+
+    def start(self):
+        """
+        建立所有连接并启动后台健康检查
+
+        Raises:
+            MilvusUnavailableError: 一个连接都无法建立
+        """
+        for conn in self._connections:
+            self._reconnect(conn)
+        if not any(conn.healthy for conn in self._connections):
+            raise MilvusUnavailableError(f"无法连接 Milvus: {self._connections[0].last_error}")
+
+        if self.health_check_interval > 0 and self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="milvus-pool-health", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """停止健康检查并断开所有连接"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        for conn in self._connections:
+            self._disconnect(conn)
+
+    def _disconnect(self, conn: PooledConnection):
+        try:
+            connections.disconnect(alias=conn.alias)
+        except Exception:
+            pass
+        conn.client = None
+        conn.healthy = False
+
+    def _reconnect(self, conn: PooledConnection) -> bool:
+        """（重新）建立连接，失败时按连续失败次数指数退避"""
+        if not conn.reconnect_lock.acquire(blocking=False):
+            return conn.healthy
+        try:
+            return self._connect(conn)
+        finally:
+            conn.reconnect_lock.release()
+
+    def _connect(self, conn: PooledConnection) -> bool:
+        self._disconnect(conn)
+        conn_params = {
+            "alias": conn.alias,
+            "host": self.host,
+            "port": str(self.port),
+            "db_name": self.db_name,
+            "timeout": self.connect_timeout,
+        }
+        if self.user:
+            conn_params["user"] = self.user
+        if self.password:
+            conn_params["password"] = self.password
+
+        try:
+            connections.connect(**conn_params)
+            # MilvusClient 复用已注册的别名，不会新建通道
+            client = MilvusClient(alias=conn.alias)
+        except Exception as e:
+            with self._lock:
+                conn.failures += 1
+                conn.retry_at = time.monotonic() + min(self.max_backoff, 2 ** (conn.failures - 1))
+                conn.last_error = str(e)
+            print(f"⚠️ Milvus 连接 {conn.alias} 建立失败（第 {conn.failures} 次）: {e}")
+            return False
+
+        with self._lock:
+            recovered = conn.failures > 0
+            conn.client = client
+            conn.healthy = True
+            conn.failures = 0
+            conn.retry_at = 0.0
+            conn.last_error = None
+        if recovered:
+            print(f"✅ Milvus 连接 {conn.alias} 已恢复")
+        return True
+
+    def _mark_unhealthy(self, conn: PooledConnection, error: BaseException):
+        """标记连接故障，等待后台（或下一次取用时）退避重连"""
+        with self._lock:
+            if not conn.healthy:
+                return
+            conn.healthy = False
+            conn.failures += 1
+            conn.retry_at = time.monotonic() + min(self.max_backoff, 2 ** (conn.failures - 1))
+            conn.last_error = str(error)
+        print(f"⚠️ Milvus 连接 {conn.alias} 不可用: {error}")
+
+    def _pick(self) -> Optional[PooledConnection]:
+        """选择在途请求最少的健康连接（并列时轮转），调用方需持有锁"""
+        count = len(self._connections)
+        start = self._next
+        self._next = (self._next + 1) % count
+        best = None
+        for offset in range(count):
+            conn = self._connections[(start + offset) % count]
+            if conn.healthy and (best is None or conn.in_flight < best.in_flight):
+                best = conn
+        return best
+
+    def _checkout(self) -> PooledConnection:
+        with self._lock:
+            conn = self._pick()
+            if conn is not None:
+                conn.in_flight += 1
+                return conn
+            now = time.monotonic()
+            candidate = next((c for c in self._connections if c.retry_at <= now), None)
+
+        # 没有健康连接：有退避到期的连接时立即尝试重连一次，否则快速失败
+        if candidate is not None and self._reconnect(candidate):
+            with self._lock:
+                candidate.in_flight += 1
+            return candidate
+        raise MilvusUnavailableError(self._unavailable_message())
+
+    def _unavailable_message(self) -> str:
+        with self._lock:
+            wait = max(0.0, min(c.retry_at for c in self._connections) - time.monotonic())
+            error = next((c.last_error for c in self._connections if c.last_error), None)
+        return f"Milvus 不可用（{wait:.0f}s 后重试）: {error}"
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        """
+        取用一个连接（非独占，gRPC 通道可并发复用，取用只用于负载均衡与故障标记）
+
+        调用中出现连接故障时将该连接标记为不可用。
+
+        Raises:
+            MilvusUnavailableError: 没有可用连接
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+        except Exception as e:
+            if is_connection_error(e):
+                self._mark_unhealthy(conn, e)
+            raise
+        finally:
+            with self._lock:
+                conn.in_flight -= 1
+
+    def alias(self) -> str:
+        """
+        返回当前负载最低的健康连接别名（供长耗时的管理操作使用，不计入在途请求）
+
+        Raises:
+            MilvusUnavailableError: 没有可用连接
+        """
+        with self.connection() as conn:
+            return conn.alias
+
+    def check_available(self):
+        """
+        所有连接均不健康时立即抛出异常（供不经过连接池的调用快速失败）
+
+        Raises:
+            MilvusUnavailableError: 没有可用连接
+        """
+        with self._lock:
+            if any(conn.healthy for conn in self._connections):
+                return
+        raise MilvusUnavailableError(self._unavailable_message())
+
+    def health_check(self):
+        """检查所有连接：健康连接探测服务端，故障连接在退避到期后重连"""
+        for conn in self._connections:
+            if conn.healthy:
+                try:
+                    utility.get_server_version(using=conn.alias, timeout=self.connect_timeout)
+                except Exception as e:
+                    self._mark_unhealthy(conn, e)
+            elif conn.retry_at <= time.monotonic():
+                self._reconnect(conn)
+
+    def _run(self):
+        while not self._stop_event.wait(self.health_check_interval):
+            try:
+                self.health_check()
+            except Exception as e:
+                print(f"⚠️ Milvus 连接健康检查失败: {e}")
+
+    def get_status(self) -> List[Dict]:
+        """连接池状态（用于监控）"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "alias": conn.alias,
+                    "healthy": conn.healthy,
+                    "in_flight": conn.in_flight,
+                    "failures": conn.failures,
+                    "retry_in": round(max(0.0, conn.retry_at - now), 1) if not conn.healthy else 0,
+                    "last_error": conn.last_error
+                }
+                for conn in self._connections
+            ]
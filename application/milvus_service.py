@@ -2,140 +2,1079 @@
 Milvus 向量存储服务
 管理向量数据库的连接、Collection 创建、检索等操作
 """
-from pymilvus import connections, Collection, utility, CollectionSchema, FieldSchema, DataType
-from langchain_milvus import Milvus
-from langchain_openai import OpenAIEmbeddings
-from typing import List, Optional, Dict
-import os
-from config.milvus import milvus_settings
+from pymilvus import (
+    Collection, utility, connections, CollectionSchema, FieldSchema, DataType, AsyncMilvusClient,
+    AnnSearchRequest, RRFRanker, Function, FunctionType
+)
+from langchain_milvus import Milvus, BM25BuiltInFunction
+from typing import Callable, Iterable, List, Optional, Dict
+import copy
+import itertools
+import json
+import asyncio
+import threading
+import time
+import numpy as np
+from config.milvus import (
+    milvus_settings, build_index_profile, build_search_params, build_vector_format, check_index_vector_format,
+    build_consistency_policy, OP_SEARCH, OP_STATS, OP_VERIFY, similarity_from_distance, similarity_radius,
+    distance_from_similarity,
+    LAYOUT_SHARED, PARTITION_KEY_FIELD, SPARSE_FIELD, BM25_INDEX_PARAMS, BM25_SEARCH_PARAMS,
+    FILE_ID_FIELD, FILE_ID_INDEX_NAME, FILE_ID_INDEX_PARAMS, AUTO_INDEX_TYPES
+)
+from config.settings import settings
+from application.embedding_cache import QueryEmbeddingCache, ChunkEmbeddingCache
+from application.embedding_providers import EmbeddingBackend, build_embedding_backend, normalize_provider
+from application.milvus_pool import MilvusConnectionPool, PooledConnection
+from application.vector_format import (
+    VECTOR_DATA_TYPES, FormattedEmbeddings, dtype_name, truncate_vectors, decode_vectors, encode_vectors, encode_queries
+)
 
 
 class MilvusVectorStore:
     """Milvus 向量存储管理"""
     
     def __init__(self):
-        self.connection_alias = "default"
-        self.embeddings = None
+        # 连接池：多个连接别名分担检索、写入、删除与统计请求
+        self.pool = MilvusConnectionPool(
+            host=milvus_settings.host,
+            port=milvus_settings.port,
+            user=milvus_settings.user,
+            password=milvus_settings.password,
+            db_name=milvus_settings.db_name,
+            size=milvus_settings.pool_size,
+            connect_timeout=milvus_settings.connect_timeout,
+            call_timeout=milvus_settings.call_timeout,
+            health_check_interval=milvus_settings.health_check_interval,
+            max_backoff=milvus_settings.reconnect_max_backoff
+        )
+        # Embedding 后端：provider -> 后端实例（懒加载）；agent_name -> provider（未配置的使用全局默认）
+        self._embedding_backends: Dict[str, EmbeddingBackend] = {}
+        self._embedding_backends_lock = threading.Lock()
+        self._embedding_providers: Dict[str, str] = {}
+        self.default_embedding_provider: Optional[str] = None
+        self.chunk_cache: Optional[ChunkEmbeddingCache] = None
+        self.query_embedding_cache = QueryEmbeddingCache(
+            max_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+            ttl_seconds=settings.QUERY_EMBEDDING_CACHE_TTL
+        )
+        # 进程级向量存储句柄注册表：collection_name -> Milvus 包装器
+        self._vector_stores: Dict[str, Milvus] = {}
+        self._vector_stores_lock = threading.Lock()
+        # 智能体索引配置：agent_name -> {"index_type", "index_params", "search_params", "vector_dtype", "vector_dim"}
+        self._index_configs: Dict[str, Dict] = {}
+        # 一致性策略：agent_name -> {"search", "stats", "verify"}（未配置的智能体使用全局默认）
+        self._consistency_policies: Dict[str, Dict[str, str]] = {}
+        self._default_consistency = build_consistency_policy()
+        self._file_id_indexed: set = set()  # 已确认建有 file_id 索引的物理 Collection
+        # 异步检索客户端（与连接池同等数量，绑定事件循环，懒加载）
+        self._async_clients: List[AsyncMilvusClient] = []
+        self._async_client_aliases: List[str] = []  # 与 _async_clients 一一对应的连接别名
+        self._async_client_loop = None
+        self._async_client_counter = itertools.count()
+        self._async_client_generation = itertools.count()
         self._connect()
         self._init_embeddings()
     
     def _connect(self):
-        """连接 Milvus 服务器"""
+        """连接 Milvus 服务器（建立连接池）"""
         try:
-            # 检查是否已连接
-            try:
-                connections.disconnect(alias=self.connection_alias)
-            except:
-                pass
-            
-            # 建立新连接
-            conn_params = {
-                "alias": self.connection_alias,
-                "host": milvus_settings.host,
-                "port": str(milvus_settings.port),
-            }
-            
-            if milvus_settings.user:
-                conn_params["user"] = milvus_settings.user
-            if milvus_settings.password:
-                conn_params["password"] = milvus_settings.password
-            
-            connections.connect(**conn_params)
-            print(f"✅ 已连接到 Milvus: {milvus_settings.host}:{milvus_settings.port}")
+            self.pool.start()
+            print(f"✅ 已连接到 Milvus: {milvus_settings.host}:{milvus_settings.port}（连接数 {self.pool.size}）")
         except Exception as e:
             print(f"❌ Milvus 连接失败: {e}")
             raise
     
     def _init_embeddings(self):
-        """初始化 Embedding 模型"""
-        embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
-        base_url = os.getenv("OPENAI_BASE_URL", "")
-        api_key = os.getenv("OPENAI_API_KEY", "")
-        chunk_size = 10
-        
-        print(f"🔧 初始化 Embedding 模型: {embedding_model}")
-        self.embeddings = OpenAIEmbeddings(
-            model=embedding_model,
-            api_key=api_key,
-            base_url=base_url,
-            check_embedding_ctx_length=False,  # 禁用 token 长度检查
-            chunk_size=chunk_size,  # 关键：限制批处理大小
-            max_retries=3,
-            timeout=30.0
-        )
-        print(f"✅ Embedding 模型已初始化: {embedding_model}")
+        """初始化默认 Embedding 后端（其余后端在智能体首次使用时加载）"""
+        # 入库向量化走持久化缓存，重复上传的文本块无需再次请求 API
+        if settings.CHUNK_EMBEDDING_CACHE_ENABLED:
+            try:
+                self.chunk_cache = ChunkEmbeddingCache(settings.CHUNK_EMBEDDING_CACHE_PATH)
+                print(f"✅ 文本块 Embedding 缓存已启用: {settings.CHUNK_EMBEDDING_CACHE_PATH}")
+            except Exception as e:
+                print(f"⚠️ 文本块 Embedding 缓存初始化失败，将直接调用 API: {e}")
+        self.default_embedding_provider = normalize_provider(None)
+        self.get_embedding_backend(self.default_embedding_provider)
     
-    def get_collection_name(self, agent_name: str) -> str:
-        """生成 Collection 名称（符合 Milvus 命名规则）"""
+    # ==================== Embedding 后端 ====================
+    
+    def get_embedding_backend(self, provider: Optional[str] = None) -> EmbeddingBackend:
+        """
+        获取 Embedding 后端（进程内每种后端一个实例，所有智能体共享）
+        
+        Args:
+            provider: 后端名称（为空使用全局默认）
+            
+        Raises:
+            ValueError: 不支持的后端或缺少配置
+        """
+        provider = normalize_provider(provider)
+        backend = self._embedding_backends.get(provider)
+        if backend is None:
+            with self._embedding_backends_lock:
+                backend = self._embedding_backends.get(provider)
+                if backend is None:
+                    backend = build_embedding_backend(provider, self.chunk_cache)
+                    self._embedding_backends[provider] = backend
+        return backend
+    
+    def embedding_backend_for(self, agent_name: Optional[str] = None) -> EmbeddingBackend:
+        """获取智能体使用的 Embedding 后端（未配置的智能体使用全局默认）"""
+        return self.get_embedding_backend(self._embedding_providers.get(agent_name, self.default_embedding_provider))
+    
+    def configure_embedding(self, agent_name: str, provider: Optional[str] = None) -> bool:
+        """
+        设置智能体使用的 Embedding 后端
+        
+        后端输出维度（或配置的截断维度）与已有 Collection 的向量维度不一致时拒绝切换，
+        避免同一 Collection 中混入不同维度的向量。
+        
+        Args:
+            agent_name: 智能体名称
+            provider: 后端名称（openai / onnx，为空使用全局默认）
+            
+        Returns:
+            bool: 配置是否发生变化
+            
+        Raises:
+            ValueError: 不支持的后端、缺少配置或维度不兼容
+        """
+        provider = normalize_provider(provider)
+        if self._embedding_providers.get(agent_name, self.default_embedding_provider) == provider:
+            return False
+        
+        backend = self.get_embedding_backend(provider)
+        self.check_embedding_dim(agent_name, backend)
+        if provider == self.default_embedding_provider:
+            self._embedding_providers.pop(agent_name, None)
+        else:
+            self._embedding_providers[agent_name] = provider
+        self.invalidate_vector_store(agent_name)
+        return True
+    
+    def check_embedding_dim(self, agent_name: str, backend: Optional[EmbeddingBackend] = None):
+        """
+        校验 Embedding 后端与智能体的存储维度是否兼容
+        
+        Args:
+            agent_name: 智能体名称
+            backend: 待校验的后端（为空使用智能体当前后端）
+            
+        Raises:
+            ValueError: 截断维度大于模型维度，或与已有 Collection 的向量维度不一致
+        """
+        backend = backend or self.embedding_backend_for(agent_name)
+        configured_dim = self.get_vector_format(agent_name)["vector_dim"]
+        if configured_dim and configured_dim > backend.dim:
+            raise ValueError(f"截断维度 {configured_dim} 大于 Embedding 模型维度 {backend.dim}（{backend.model}）")
+        
+        current = self.describe_vector_format(agent_name)
+        expected_dim = configured_dim or backend.dim
+        if current is not None and current["vector_dim"] != expected_dim:
+            raise ValueError(
+                f"Embedding 模型 {backend.model} 的向量维度（{expected_dim}）与 Collection "
+                f"{self.get_collection_name(agent_name)} 的维度（{current['vector_dim']}）不一致，"
+                f"不能混入同一 Collection"
+            )
+    
+    def get_embedding_stats(self) -> Dict:
+        """已加载的 Embedding 后端运行统计"""
+        return {provider: backend.get_stats() for provider, backend in list(self._embedding_backends.items())}
+    
+    def embed_queries(self, queries: List[str], agent_name: Optional[str] = None) -> List[List[float]]:
+        """
+        向量化查询文本（优先读取查询向量缓存，未命中的一次性批量请求）
+        
+        Args:
+            queries: 查询文本列表
+            agent_name: 智能体名称（决定使用的 Embedding 后端，为空使用全局默认）
+            
+        Returns:
+            List[List[float]]: 与输入顺序一致的向量列表
+        """
+        backend = self.embedding_backend_for(agent_name)
+        vectors: List[Optional[List[float]]] = [
+            self.query_embedding_cache.get(backend.model, q) for q in queries
+        ]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        
+        if missing:
+            new_vectors = backend.query_embeddings.embed_documents([queries[i] for i in missing])
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+                self.query_embedding_cache.put(backend.model, queries[i], vector)
+        
+        return vectors
+    
+    async def aembed_queries(self, queries: List[str], agent_name: Optional[str] = None) -> List[List[float]]:
+        """向量化查询文本（异步版本，逻辑同 embed_queries）"""
+        backend = self.embedding_backend_for(agent_name)
+        vectors: List[Optional[List[float]]] = [
+            self.query_embedding_cache.get(backend.model, q) for q in queries
+        ]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        
+        if missing:
+            new_vectors = await backend.query_embeddings.aembed_documents([queries[i] for i in missing])
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+                self.query_embedding_cache.put(backend.model, queries[i], vector)
+        
+        return vectors
+    
+    def get_embedding_dim(self, agent_name: Optional[str] = None) -> int:
+        """智能体所用 Embedding 模型输出的完整维度（首次调用时向量化一条探测文本）"""
+        return self.embedding_backend_for(agent_name).dim
+    
+    @property
+    def shared_layout(self) -> bool:
+        """是否使用共享 Collection 布局（所有智能体共用一个 Collection）"""
+        return milvus_settings.storage_layout.lower() == LAYOUT_SHARED
+    
+    def get_agent_collection_name(self, agent_name: str) -> str:
+        """生成智能体独立 Collection 的名称（符合 Milvus 命名规则）"""
         # Milvus Collection 名称：字母、数字、下划线，长度 1-255
         safe_name = agent_name.replace("-", "_").replace(" ", "_")
         return f"agent_{safe_name}"
     
+    def get_collection_name(self, agent_name: str) -> str:
+        """获取智能体数据所在的 Collection 名称（共享布局下所有智能体相同）"""
+        if self.shared_layout:
+            return milvus_settings.shared_collection
+        return self.get_agent_collection_name(agent_name)
+    
+    def _scope_expr(self, agent_name: str, expr: str = "") -> str:
+        """
+        将过滤表达式限定在智能体范围内
+        
+        共享布局下追加 agent_name 条件（分区键过滤，只扫描对应分区）；独立布局原样返回。
+        """
+        if not self.shared_layout:
+            return expr
+        agent_expr = f'{PARTITION_KEY_FIELD} == "{agent_name}"'
+        return f"{agent_expr} and ({expr})" if expr else agent_expr
+    
     def collection_exists(self, agent_name: str) -> bool:
         """检查 Collection 是否存在"""
         collection_name = self.get_collection_name(agent_name)
         try:
-            return utility.has_collection(collection_name, using=self.connection_alias)
+            with self.pool.connection() as conn:
+                if utility.has_collection(collection_name, using=conn.alias, timeout=self.pool.call_timeout):
+                    return True
+            # 别名缺失但存在版本化 Collection（旧 Collection 迁移中断）时恢复别名
+            return not self.shared_layout and \
+                self._recover_alias(agent_name, self._physical_collections(agent_name)) is not None
         except Exception as e:
             print(f"⚠️ 检查 Collection 失败: {e}")
             return False
     
-    def create_vector_store(self, agent_name: str) -> Milvus:
-        """为智能体创建向量存储"""
-        collection_name = self.get_collection_name(agent_name)
+    def _build_vector_store(self, agent_name: str, collection_name: Optional[str] = None) -> Milvus:
+        """
+        构建 LangChain Milvus 包装器（会触发 schema/索引探测，开销较大）
         
-        print(f"🔨 创建向量存储: {collection_name}")
-        
-        # 构建连接参数 - 使用已建立的连接
+        collection_name 为空时使用智能体的 Collection 名称（别名）；新建版本化的物理 Collection 时
+        传入其名称，schema 与索引按新建处理。
+        """
+        collection_name = collection_name or self.get_collection_name(agent_name)
+        # 构建连接参数 - 使用连接池中的连接（检索、写入时再按调用绑定连接）
         connection_args = {
-            "alias": self.connection_alias,  # 使用已建立的连接
+            "alias": self.pool.alias(),
         }
         
-        # LangChain Milvus 会自动创建 Collection
+        # 新建 Collection 按初始（空）规模选择索引；已存在时检索参数跟随实际索引
+        # 共享布局下索引由所有智能体共用，不使用单个智能体的配置
+        config = {} if self.shared_layout else self.get_index_config(agent_name)
+        profile = build_index_profile(
+            index_type=config.get("index_type"),
+            num_entities=0,
+            index_params=config.get("index_params"),
+            search_params=config.get("search_params")
+        )
+        search_params = profile["search_params"]
+        current_index = self.describe_vector_index(agent_name)
+        if current_index is not None:
+            search_params = build_search_params(
+                current_index["index_type"],
+                current_index["params"],
+                config.get("search_params")
+            )
+        
+        # 混合检索：新建的 Collection 增加 BM25 稀疏向量字段；已有 Collection 沿用其 schema
+        # （旧 Collection 可通过在线重建补充稀疏字段）
+        index_params = profile["index_params"]
+        hybrid_kwargs = {}
+        existing_fields = self._collection_field_names(agent_name)
+        if milvus_settings.hybrid_search and (existing_fields is None or SPARSE_FIELD in existing_fields):
+            hybrid_kwargs = {
+                "builtin_function": BM25BuiltInFunction(
+                    input_field_names="text",
+                    output_field_names=SPARSE_FIELD,
+                    analyzer_params=self._bm25_analyzer_params()
+                ),
+                "vector_field": ["vector", SPARSE_FIELD]
+            }
+            index_params = [index_params, BM25_INDEX_PARAMS]
+            search_params = [search_params, BM25_SEARCH_PARAMS]
+        
+        # 向量存储格式：已有 Collection 以实际 schema 为准，新建时按配置
+        vector_format = self.describe_vector_format(agent_name) or self.get_vector_format(agent_name)
+        document_embeddings = self.embedding_backend_for(agent_name).document_embeddings
+        embedding_function = document_embeddings
+        format_kwargs = {}
+        if vector_format["vector_dtype"] != "FLOAT32" or vector_format["vector_dim"]:
+            embedding_function = FormattedEmbeddings(document_embeddings, vector_format)
+        if existing_fields is None and embedding_function is not document_embeddings:
+            vector_schema = {
+                "dtype": VECTOR_DATA_TYPES[vector_format["vector_dtype"]],
+                "dim": vector_format["vector_dim"] or self.get_embedding_dim(agent_name)
+            }
+            if hybrid_kwargs:
+                format_kwargs["vector_schema"] = [vector_schema, {"dtype": DataType.SPARSE_FLOAT_VECTOR}]
+            else:
+                format_kwargs["vector_schema"] = vector_schema
+        
+        layout_kwargs = {}
+        if self.shared_layout:
+            # 各智能体文档的元数据字段不尽相同，使用动态字段存储；agent_name 作为分区键
+            layout_kwargs = {
+                "enable_dynamic_field": True,
+                "partition_key_field": PARTITION_KEY_FIELD,
+                "num_partitions": milvus_settings.shared_num_partitions
+            }
+        
+        # LangChain Milvus 会在首次写入时自动创建 Collection
         vector_store = Milvus(
-            embedding_function=self.embeddings,
+            embedding_function=embedding_function,
             collection_name=collection_name,
             connection_args=connection_args,
-            index_params={
-                "metric_type": milvus_settings.metric_type,
-                "index_type": milvus_settings.index_type,
-                "params": {"nlist": milvus_settings.nlist}
-            },
-            drop_old=False  # 不删除旧数据
+            index_params=index_params,
+            search_params=search_params,
+            drop_old=False,  # 不删除旧数据
+            **hybrid_kwargs,
+            **format_kwargs,
+            **layout_kwargs
         )
+        # 检索时按该格式准备查询向量
+        vector_store.vector_format = vector_format
+        return vector_store
+    
+    def _collection_field_names(self, agent_name: str) -> Optional[List[str]]:
+        """获取 Collection 的字段名称（Collection 不存在返回 None）"""
+        if not self.collection_exists(agent_name):
+            return None
+        collection = Collection(self.get_collection_name(agent_name), using=self.pool.alias())
+        return [field.name for field in collection.schema.fields]
+    
+    @staticmethod
+    def _bm25_analyzer_params() -> Dict:
+        return {"type": milvus_settings.bm25_analyzer}
+    
+    @classmethod
+    def _with_bm25(cls, schema: CollectionSchema) -> CollectionSchema:
+        """
+        为 schema 补充 BM25 稀疏向量字段与函数（已包含时原样返回）
+        
+        text 字段需开启分析器，BM25 函数在写入时由服务端分词并生成稀疏向量。
+        """
+        if any(field.name == SPARSE_FIELD for field in schema.fields):
+            return schema
         
+        fields = []
+        for field in schema.fields:
+            if field.name == "text":
+                field = FieldSchema(
+                    "text",
+                    DataType.VARCHAR,
+                    max_length=field.params.get("max_length", 65_535),
+                    enable_analyzer=True,
+                    analyzer_params=cls._bm25_analyzer_params()
+                )
+            fields.append(field)
+        fields.append(FieldSchema(SPARSE_FIELD, DataType.SPARSE_FLOAT_VECTOR))
+        
+        bm25 = Function(
+            name="text_bm25",
+            function_type=FunctionType.BM25,
+            input_field_names=["text"],
+            output_field_names=[SPARSE_FIELD]
+        )
+        return CollectionSchema(
+            fields,
+            description=schema.description,
+            enable_dynamic_field=schema.enable_dynamic_field,
+            functions=[*schema.functions, bm25]
+        )
+    
+    @staticmethod
+    def _copy_skip_fields(schema: CollectionSchema) -> set:
+        """复制数据时需要跳过的字段（自增主键、函数生成的字段）"""
+        return {
+            field.name for field in schema.fields
+            if field.auto_id or getattr(field, "is_function_output", False)
+        }
+    
+    def create_vector_store(self, agent_name: str) -> Milvus:
+        """为智能体创建向量存储"""
+        collection_name = self.get_collection_name(agent_name)
+        
+        print(f"🔨 创建向量存储: {collection_name}")
+        vector_store = self.get_vector_store(agent_name)
         print(f"✅ 向量存储已创建: {collection_name}")
         return vector_store
     
     def get_vector_store(self, agent_name: str) -> Milvus:
-        """获取现有的向量存储（不存在则创建）"""
+        """
+        获取现有的向量存储（不存在则创建）
+        
+        句柄按 Collection 名称缓存复用，避免每次检索都重新构建包装器。
+        Collection 尚未创建时不缓存，以便其他进程写入后能重新探测 schema。
+        """
         collection_name = self.get_collection_name(agent_name)
         
-        # 构建连接参数 - 确保使用现有连接
-        connection_args = {
-            "alias": self.connection_alias,  # 使用已建立的连接
+        vector_store = self._vector_stores.get(collection_name)
+        if vector_store is not None:
+            return vector_store
+        
+        with self._vector_stores_lock:
+            # 双重检查，避免并发重复构建
+            vector_store = self._vector_stores.get(collection_name)
+            if vector_store is not None:
+                return vector_store
+            
+            vector_store = self._build_vector_store(agent_name)
+            if vector_store.col is not None:
+                self._vector_stores[collection_name] = vector_store
+        
+        return vector_store
+    
+    def invalidate_vector_store(self, agent_name: str) -> bool:
+        """
+        使缓存的向量存储句柄失效
+        
+        在 Collection 被删除、清空或智能体被删除后调用。
+        
+        Returns:
+            bool: 是否存在并移除了缓存句柄
+        """
+        collection_name = self.get_collection_name(agent_name)
+        with self._vector_stores_lock:
+            removed = self._vector_stores.pop(collection_name, None)
+        self._file_id_indexed = {
+            name for name in self._file_id_indexed
+            if name != collection_name and not name.startswith(f"{collection_name}__v")
         }
+        if removed is not None:
+            print(f"🗑️ 向量存储句柄已失效: {collection_name}")
+        return removed is not None
+    
+    # ==================== 索引配置 ====================
+    
+    def get_index_config(self, agent_name: str) -> Dict:
+        """获取智能体的索引配置（未配置时返回空字典，即使用全局默认）"""
+        return dict(self._index_configs.get(agent_name, {}))
+    
+    def configure_index(
+        self,
+        agent_name: str,
+        index_type: Optional[str] = None,
+        index_params: Optional[Dict] = None,
+        search_params: Optional[Dict] = None,
+        vector_dtype: Optional[str] = None,
+        vector_dim: Optional[int] = None
+    ) -> bool:
+        """
+        设置智能体的索引配置与向量存储格式
         
-        vector_store = Milvus(
-            embedding_function=self.embeddings,
-            collection_name=collection_name,
-            connection_args=connection_args,
-            index_params={
-                "metric_type": milvus_settings.metric_type,
-                "index_type": milvus_settings.index_type,
-                "params": {"nlist": milvus_settings.nlist}
-            },
-            drop_old=False
+        配置变化时使缓存的向量存储句柄失效，下次检索使用新的检索参数。
+        存储格式只影响新建的 Collection，已有数据需在线重建迁移。
+        
+        Args:
+            agent_name: 智能体名称
+            index_type: 索引类型（AUTO/FLAT/IVF_FLAT/IVF_PQ/HNSW/SCANN/DISKANN/IVF_SQ8/HNSW_SQ/IVF_RABITQ）
+            index_params: 覆盖默认构建参数
+            search_params: 覆盖默认检索参数
+            vector_dtype: 向量存储精度（FLOAT32/FLOAT16/BFLOAT16）
+            vector_dim: Matryoshka 截断维度
+            
+        Returns:
+            bool: 配置是否发生变化
+        """
+        # 校验索引类型、参数与存储格式
+        profile = build_index_profile(index_type, 0, index_params, search_params)
+        check_index_vector_format(profile["index_type"], build_vector_format(vector_dtype, vector_dim))
+        
+        config = {
+            "index_type": index_type.upper() if index_type else None,
+            "index_params": index_params or None,
+            "search_params": search_params or None,
+            "vector_dtype": vector_dtype.upper() if vector_dtype else None,
+            "vector_dim": vector_dim or None
+        }
+        if self._index_configs.get(agent_name, {}) == config:
+            return False
+        
+        self._index_configs[agent_name] = config
+        self.invalidate_vector_store(agent_name)
+        return True
+    
+    # ==================== 一致性策略 ====================
+    
+    def configure_consistency(self, agent_name: str, overrides: Optional[Dict[str, str]] = None) -> bool:
+        """
+        设置智能体各操作类别的一致性级别
+        
+        Args:
+            agent_name: 智能体名称
+            overrides: 覆盖全局默认，如 {"search": "Strong"}（search 对话检索 / stats 管理端统计 / verify 入库后校验）
+            
+        Returns:
+            bool: 配置是否发生变化
+        """
+        policy = build_consistency_policy(overrides)
+        if self.get_consistency_policy(agent_name) == policy:
+            return False
+        if policy == self._default_consistency:
+            self._consistency_policies.pop(agent_name, None)
+        else:
+            self._consistency_policies[agent_name] = policy
+        return True
+    
+    def get_consistency_policy(self, agent_name: str) -> Dict[str, str]:
+        """获取智能体的一致性策略"""
+        return dict(self._consistency_policies.get(agent_name, self._default_consistency))
+    
+    def consistency_level(self, agent_name: str, operation: str) -> str:
+        """获取智能体某一操作类别的一致性级别（检索热路径：仅字典查找）"""
+        return self._consistency_policies.get(agent_name, self._default_consistency)[operation]
+    
+    def get_vector_format(self, agent_name: str) -> Dict:
+        """
+        获取智能体配置的向量存储格式（共享布局下所有智能体使用全局默认）
+        
+        Returns:
+            dict: {"vector_dtype", "vector_dim"}
+        """
+        config = {} if self.shared_layout else self.get_index_config(agent_name)
+        return build_vector_format(config.get("vector_dtype"), config.get("vector_dim"))
+    
+    @staticmethod
+    def _vector_format_of(schema: CollectionSchema) -> Dict:
+        """从 schema 读取向量字段的存储格式"""
+        field = next(f for f in schema.fields if f.name == "vector")
+        return {"vector_dtype": dtype_name(field.dtype), "vector_dim": int(field.params["dim"])}
+    
+    def describe_vector_format(self, agent_name: str) -> Optional[Dict]:
+        """
+        获取 Collection 实际的向量存储格式
+        
+        Returns:
+            Optional[Dict]: {"vector_dtype", "vector_dim"}；Collection 不存在返回 None
+        """
+        if not self.collection_exists(agent_name):
+            return None
+        collection = Collection(self.get_collection_name(agent_name), using=self.pool.alias())
+        return self._vector_format_of(collection.schema)
+    
+    def _convert_vectors(self, agent_name: str, rows: List[Dict], source_format: Dict, target_format: Dict) -> List:
+        """
+        将一批实体的向量从源存储格式转换为目标格式
+        
+        目标维度不大于源维度时直接截断并重新归一化；更大时（源数据已被截断）按 text 重新向量化。
+        
+        Args:
+            agent_name: 智能体名称（重新向量化时使用其 Embedding 后端）
+            rows: 实体列表（含 text 与 vector 字段）
+            source_format: 源格式 {"vector_dtype", "vector_dim"}
+            target_format: 目标格式（vector_dim 为空表示模型完整维度）
+            
+        Returns:
+            list: 可直接写入目标 Collection 的向量列表
+        """
+        target_dim = target_format["vector_dim"] or self.get_embedding_dim(agent_name)
+        if target_dim > source_format["vector_dim"]:
+            document_embeddings = self.embedding_backend_for(agent_name).document_embeddings
+            matrix = np.asarray(document_embeddings.embed_documents([row["text"] for row in rows]), dtype=np.float32)
+        else:
+            matrix = decode_vectors([row["vector"] for row in rows], source_format["vector_dtype"])
+        return encode_vectors(truncate_vectors(matrix, target_dim), target_format["vector_dtype"])
+    
+    @staticmethod
+    def _with_vector_format(schema: CollectionSchema, vector_format: Dict) -> CollectionSchema:
+        """替换 schema 中向量字段的类型与维度（其余字段与函数保持不变）"""
+        fields = [
+            FieldSchema("vector", VECTOR_DATA_TYPES[vector_format["vector_dtype"]], dim=vector_format["vector_dim"])
+            if field.name == "vector" else field
+            for field in schema.fields
+        ]
+        return CollectionSchema(
+            fields,
+            description=schema.description,
+            enable_dynamic_field=schema.enable_dynamic_field,
+            functions=list(schema.functions)
         )
+    
+    @staticmethod
+    def _normalize_index_params(raw: Dict) -> Dict:
+        """将服务端返回的索引参数整理为 {"index_type", "metric_type", "params"}"""
+        raw = dict(raw)
+        params = raw.pop("params", {}) or {}
+        if isinstance(params, str):
+            params = json.loads(params)
+        index_type = raw.pop("index_type", None)
+        metric_type = raw.pop("metric_type", None)
+        # 部分版本将构建参数平铺在顶层
+        params = {**raw, **params}
+        def parse(value):
+            if isinstance(value, str):
+                if value.isdigit():
+                    return int(value)
+                if value.lower() in ("true", "false"):  # 量化索引的 refine 等布尔参数
+                    return value.lower() == "true"
+            return value
+        params = {key: parse(value) for key, value in params.items()}
+        return {"index_type": index_type, "metric_type": metric_type, "params": params}
+    
+    def describe_vector_index(self, agent_name: str) -> Optional[Dict]:
+        """
+        获取向量字段当前的索引信息
         
-        return vector_store
+        Returns:
+            Optional[Dict]: {"index_type", "metric_type", "params"}；Collection 或索引不存在返回 None
+        """
+        if not self.collection_exists(agent_name):
+            return None
+        
+        collection_name = self.get_collection_name(agent_name)
+        try:
+            collection = Collection(collection_name, using=self.pool.alias())
+            for index in collection.indexes:
+                if index.field_name == "vector":
+                    return self._normalize_index_params(index.params)
+        except Exception as e:
+            print(f"⚠️ 获取索引信息失败: {e}")
+        return None
+    
+    def get_index_profile(self, agent_name: str, num_entities: int = 0) -> Dict:
+        """
+        获取智能体的目标索引配置与当前实际索引
+        
+        Args:
+            agent_name: 智能体名称
+            num_entities: 当前向量数量（AUTO 模式按此选择索引类型）
+            
+        Returns:
+            dict: {"configured", "desired", "current", "vector_format": {"desired", "current"}}
+        """
+        config = self.get_index_config(agent_name)
+        desired = build_index_profile(
+            index_type=config.get("index_type"),
+            num_entities=num_entities,
+            index_params=config.get("index_params"),
+            search_params=config.get("search_params")
+        )
+        return {
+            "configured": config.get("index_type") or milvus_settings.index_type,
+            "desired": desired,
+            "current": self.describe_vector_index(agent_name),
+            "vector_format": {
+                "desired": self.get_vector_format(agent_name),
+                "current": self.describe_vector_format(agent_name)
+            }
+        }
+    
+    def index_needs_rebuild(self, agent_name: str, num_entities: int) -> Optional[Dict]:
+        """
+        判断 AUTO 索引是否因数据增长跨过了规模阈值（如 FLAT → HNSW），需要在线重建
+        
+        只处理 AUTO 模式下、当前索引本身由 AUTO 选出且数据规模升级的情况；
+        显式配置的索引及其参数变更由用户发起的重建处理，不在此自动触发。
+        
+        Args:
+            agent_name: 智能体名称
+            num_entities: 当前向量数量
+            
+        Returns:
+            Optional[Dict]: 需要重建时返回目标索引配置，否则返回 None
+        """
+        if self.shared_layout:
+            return None
+        
+        profile = self.get_index_profile(agent_name, num_entities)
+        current = profile["current"]
+        desired = profile["desired"]
+        if current is None or not desired["auto"] or current["index_type"] not in AUTO_INDEX_TYPES:
+            return None
+        if AUTO_INDEX_TYPES.index(desired["index_type"]) <= AUTO_INDEX_TYPES.index(current["index_type"]):
+            return None
+        return desired
+    
+    # ==================== 在线重建（别名切换） ====================
+    
+    def _physical_collections(self, agent_name: str) -> List[str]:
+        """智能体名下的所有物理 Collection（原始名称及重建产生的 __vN 版本）"""
+        base = self.get_collection_name(agent_name)
+        return [
+            name for name in utility.list_collections(using=self.pool.alias())
+            if name == base or name.startswith(f"{base}__v")
+        ]
+    
+    def resolve_collection(self, agent_name: str) -> Optional[str]:
+        """
+        解析当前提供服务的物理 Collection
+        
+        重建过的智能体通过别名（即 get_collection_name 的返回值）指向 __vN 版本，
+        从未重建过的智能体直接使用同名 Collection。
+        
+        Returns:
+            Optional[str]: 物理 Collection 名称，不存在返回 None
+        """
+        base = self.get_collection_name(agent_name)
+        physical = self._physical_collections(agent_name)
+        using = self.pool.alias()
+        for name in physical:
+            if base in utility.list_aliases(name, using=using):
+                return name
+        if base in physical:
+            return base
+        return self._recover_alias(agent_name, physical)
+    
+    def _recover_alias(self, agent_name: str, physical: List[str]) -> Optional[str]:
+        """
+        恢复中断的旧 Collection 迁移：同名 Collection 已删除而别名未创建时，将别名指向最新版本
+        
+        Returns:
+            Optional[str]: 别名指向的物理 Collection，没有版本化 Collection 时返回 None
+        """
+        versions = [name for name in physical if name.rsplit("__v", 1)[-1].isdigit()]
+        if not versions:
+            return None
+        base = self.get_collection_name(agent_name)
+        latest = max(versions, key=lambda name: int(name.rsplit("__v", 1)[1]))
+        try:
+            utility.create_alias(latest, base, using=self.pool.alias())
+            print(f"🩹 已恢复别名: {base} -> {latest}")
+        except Exception as e:
+            # 其他进程可能已恢复
+            if base not in utility.list_aliases(latest, using=self.pool.alias()):
+                print(f"⚠️ 恢复别名失败: {base} -> {latest}, {e}")
+                return None
+        self.invalidate_vector_store(agent_name)
+        return latest
+    
+    def _next_collection_version(self, agent_name: str) -> str:
+        base = self.get_collection_name(agent_name)
+        versions = [
+            int(name.rsplit("__v", 1)[1])
+            for name in self._physical_collections(agent_name)
+            if name.rsplit("__v", 1)[-1].isdigit()
+        ]
+        return f"{base}__v{max(versions, default=0) + 1}"
+    
+    def rebuild_collection(
+        self,
+        agent_name: str,
+        index_profile: Dict,
+        progress_callback: Optional[Callable[[str, int, int], None]] = None,
+        batch_size: int = 1000,
+        vector_format: Optional[Dict] = None
+    ) -> Dict:
+        """
+        在线重建：复制向量到新 Collection 并按新配置建索引，完成后切换别名
+        
+        重建期间旧 Collection 持续提供检索；调用方需在此期间暂停写入，
+        否则复制开始后写入旧 Collection 的数据会丢失。
+        Collection 均创建在别名之后，切换为 alter_alias 原子操作。早期版本创建的同名物理 Collection
+        （无别名）在首次重建时一次性迁移：删除同名 Collection 后立即创建别名，其间短暂不可用；
+        目标 Collection 在源被删除后不会再被删除，别名创建失败时由 resolve_collection 恢复。
+        指定 vector_format 时同时迁移向量存储格式（精度转换、维度截断）。
+        
+        Args:
+            agent_name: 智能体名称
+            index_profile: 目标索引配置（build_index_profile 的返回值）
+            progress_callback: 进度回调 (stage, copied, total)，stage 为 copying/indexing/swapping
+            batch_size: 每批复制的实体数量
+            vector_format: 目标存储格式 {"vector_dtype", "vector_dim"}（为空沿用源 Collection 的格式）
+            
+        Returns:
+            dict: {"source", "target", "copied", "total"}
+        """
+        if self.shared_layout:
+            raise ValueError("共享存储布局下不支持按智能体重建索引")
+        
+        base = self.get_collection_name(agent_name)
+        source_name = self.resolve_collection(agent_name)
+        if source_name is None:
+            raise ValueError(f"Collection 不存在: {base}")
+        
+        report = progress_callback or (lambda stage, copied, total: None)
+        using = self.pool.alias()  # 重建全程使用同一连接
+        source = Collection(source_name, using=using)
+        source.load()  # 复制需要查询，已加载时为空操作
+        total = self.count_entities(agent_name, OP_VERIFY) or 0
+        
+        # 清理此前中断的重建遗留的物理 Collection
+        for name in self._physical_collections(agent_name):
+            if name != source_name:
+                utility.drop_collection(name, using=using)
+                print(f"🗑️ 已清理遗留 Collection: {name}")
+        
+        target_name = self._next_collection_version(agent_name)
+        print(f"🔁 开始在线重建: {source_name} -> {target_name} (向量数: {total})")
+        source_format = self._vector_format_of(source.schema)
+        target_format = dict(vector_format or source_format)
+        target_format["vector_dim"] = target_format["vector_dim"] or self.get_embedding_dim(agent_name)
+        check_index_vector_format(index_profile["index_type"], target_format)
+        convert = target_format != source_format
+        
+        target_schema = self._with_bm25(source.schema) if milvus_settings.hybrid_search else source.schema
+        if convert:
+            target_schema = self._with_vector_format(target_schema, target_format)
+            print(f"🔄 向量格式迁移: {source_format} -> {target_format}")
+        target = Collection(target_name, schema=target_schema, using=using)
+        source_dropped = False
+        
+        try:
+            # 1. 复制数据（自增主键由新 Collection 重新分配，稀疏向量由 BM25 函数重新生成）
+            skip_fields = self._copy_skip_fields(source.schema)
+            copied = 0
+            report("copying", copied, total)
+            iterator = source.query_iterator(batch_size=batch_size, expr="", output_fields=["*"])
+            try:
+                while True:
+                    rows = iterator.next()
+                    if not rows:
+                        break
+                    batch = [
+                        {key: value for key, value in row.items() if key not in skip_fields}
+                        for row in rows
+                    ]
+                    if convert:
+                        for row, vector in zip(batch, self._convert_vectors(agent_name, rows, source_format, target_format)):
+                            row["vector"] = vector
+                    target.insert(batch)
+                    copied += len(rows)
+                    report("copying", copied, total)
+            finally:
+                iterator.close()
+            target.flush()
+            
+            # 2. 构建索引（标量索引沿用旧 Collection 的配置）并加载
+            report("indexing", copied, total)
+            source_indexed = set()
+            for index in source.indexes:
+                source_indexed.add(index.field_name)
+                if index.field_name != "vector":
+                    target.create_index(index.field_name, index.params)
+            target.create_index("vector", index_profile["index_params"])
+            if SPARSE_FIELD not in source_indexed and \
+                    any(field.name == SPARSE_FIELD for field in target_schema.fields):
+                target.create_index(SPARSE_FIELD, BM25_INDEX_PARAMS)
+            target.load()
+            
+            # 3. 切换别名，旧 Collection 下线
+            report("swapping", copied, total)
+            if source_name == base:
+                # 旧版无别名的同名 Collection：删除后才能创建同名别名（一次性迁移）
+                source.release()
+                utility.drop_collection(source_name, using=using)
+                source_dropped = True
+                self._create_alias_after_drop(target_name, base, using)
+            else:
+                utility.alter_alias(target_name, base, using=using)
+                source.release()
+                utility.drop_collection(source_name, using=using)
+        except Exception:
+            # 源 Collection 已删除时目标是唯一的数据副本，保留（别名由 resolve_collection 恢复）
+            if not source_dropped and utility.has_collection(target_name, using=using) and \
+                    self.resolve_collection(agent_name) != target_name:
+                utility.drop_collection(target_name, using=using)
+            raise
+        finally:
+            self.invalidate_vector_store(agent_name)
+        
+        print(f"✅ 在线重建完成: {base} -> {target_name} ({index_profile['index_type']}, 向量数: {copied})")
+        return {
+            "source": source_name,
+            "target": target_name,
+            "copied": copied,
+            "total": total,
+            "vector_format": target_format
+        }
+    
+    @staticmethod
+    def _create_alias_after_drop(target_name: str, alias: str, using: str, attempts: int = 5):
+        """同名 Collection 删除后创建别名（重试；别名已由其他进程恢复到目标时视为成功）"""
+        for attempt in range(attempts):
+            try:
+                utility.create_alias(target_name, alias, using=using)
+                return
+            except Exception as e:
+                if alias in utility.list_aliases(target_name, using=using):
+                    return
+                if attempt == attempts - 1:
+                    raise RuntimeError(
+                        f"创建别名失败，数据保留在 {target_name}，下次访问时自动恢复别名: {e}"
+                    ) from e
+                time.sleep(min(2 ** attempt, 10))
+    
+    # ==================== 迁移到共享布局 ====================
+    
+    def ensure_shared_collection(self, dim: int, expected_entities: int = 0) -> Collection:
+        """
+        创建（如不存在）共享 Collection，并建索引、加载
+        
+        字段与 LangChain Milvus 在共享布局下自动创建的 schema 一致：
+        pk / text / vector + agent_name 分区键，其余元数据存放在动态字段中。
+        向量字段使用全局默认的存储格式。
+        
+        Args:
+            dim: 向量维度（全局未配置截断维度时使用）
+            expected_entities: 预计的总向量数量（AUTO 索引按此选择类型）
+            
+        Returns:
+            Collection: 共享 Collection
+        """
+        name = milvus_settings.shared_collection
+        using = self.pool.alias()
+        if utility.has_collection(name, using=using):
+            return Collection(name, using=using)
+        
+        vector_format = build_vector_format()
+        fields = [
+            FieldSchema("pk", DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema("text", DataType.VARCHAR, max_length=65_535),
+            FieldSchema("vector", VECTOR_DATA_TYPES[vector_format["vector_dtype"]], dim=vector_format["vector_dim"] or dim),
+            FieldSchema(PARTITION_KEY_FIELD, DataType.VARCHAR, max_length=65_535, is_partition_key=True),
+        ]
+        schema = CollectionSchema(fields, enable_dynamic_field=True)
+        if milvus_settings.hybrid_search:
+            schema = self._with_bm25(schema)
+        collection = Collection(
+            name,
+            schema=schema,
+            num_partitions=milvus_settings.shared_num_partitions,
+            using=using
+        )
+        profile = build_index_profile(num_entities=expected_entities)
+        collection.create_index("vector", profile["index_params"])
+        if milvus_settings.hybrid_search:
+            collection.create_index(SPARSE_FIELD, BM25_INDEX_PARAMS)
+        self._create_file_id_index(collection)
+        collection.load()
+        print(f"✅ 已创建共享 Collection: {name} ({profile['index_type']})")
+        return collection
+    
+    def migrate_agent_to_shared(
+        self,
+        agent_name: str,
+        batch_size: int = 1000,
+        drop_source: bool = False,
+        overwrite: bool = False
+    ) -> Dict:
+        """
+        将智能体的独立 Collection 迁移到共享 Collection
+        
+        Args:
+            agent_name: 智能体名称
+            batch_size: 每批复制的实体数量
+            drop_source: 校验数量一致后删除原 Collection
+            overwrite: 共享 Collection 中已有该智能体数据时先删除再迁移（否则跳过）
+            
+        Returns:
+            dict: {"agent_name", "status", "source", "copied", "verified"}
+        """
+        base = self.get_agent_collection_name(agent_name)
+        using = self.pool.alias()  # 迁移全程使用同一连接
+        physical = [
+            name for name in utility.list_collections(using=using)
+            if name == base or name.startswith(f"{base}__v")
+        ]
+        source_name = next(
+            (name for name in physical if base in utility.list_aliases(name, using=using)),
+            base if base in physical else None
+        )
+        if source_name is None:
+            return {"agent_name": agent_name, "status": "no_source", "source": None, "copied": 0, "verified": True}
+        
+        source = Collection(source_name, using=using)
+        source.load()
+        total = int(source.query(expr="", output_fields=["count(*)"], consistency_level="Strong")[0]["count(*)"])
+        source_format = self._vector_format_of(source.schema)
+        # 源数据可能已截断维度，共享 Collection 以模型完整维度为准（全局配置了截断维度时除外）
+        target = self.ensure_shared_collection(self.get_embedding_dim(agent_name), expected_entities=total)
+        target_format = self._vector_format_of(target.schema)
+        convert = target_format != source_format
+        
+        agent_expr = f'{PARTITION_KEY_FIELD} == "{agent_name}"'
+        existing = int(target.query(expr=agent_expr, output_fields=["count(*)"], consistency_level="Strong")[0]["count(*)"])
+        if existing:
+            if not overwrite:
+                print(f"⏭️ 共享 Collection 中已有 {agent_name} 的 {existing} 条数据，跳过")
+                return {"agent_name": agent_name, "status": "skipped", "source": source_name, "copied": 0, "verified": existing == total}
+            target.delete(agent_expr)
+        
+        print(f"🚚 迁移 {source_name} -> {target.name} (向量数: {total})")
+        skip_fields = self._copy_skip_fields(source.schema)
+        copied = 0
+        iterator = source.query_iterator(batch_size=batch_size, expr="", output_fields=["*"])
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                batch = [
+                    {
+                        **{key: value for key, value in row.items() if key not in skip_fields},
+                        PARTITION_KEY_FIELD: agent_name
+                    }
+                    for row in rows
+                ]
+                if convert:
+                    for row, vector in zip(batch, self._convert_vectors(agent_name, rows, source_format, target_format)):
+                        row["vector"] = vector
+                target.insert(batch)
+                copied += len(rows)
+                print(f"  进度: {copied}/{total}")
+        finally:
+            iterator.close()
+        target.flush()
+        
+        migrated = int(target.query(expr=agent_expr, output_fields=["count(*)"], consistency_level="Strong")[0]["count(*)"])
+        verified = migrated == total
+        if not verified:
+            print(f"⚠️ 数量校验不一致: {agent_name} 源 {total}, 共享 {migrated}")
+        elif drop_source:
+            source.release()
+            for name in physical:
+                for alias in utility.list_aliases(name, using=using):
+                    utility.drop_alias(alias, using=using)
+                utility.drop_collection(name, using=using)
+            print(f"🗑️ 已删除原 Collection: {', '.join(physical)}")
+        
+        self.invalidate_vector_store(agent_name)
+        return {"agent_name": agent_name, "status": "migrated", "source": source_name, "copied": copied, "verified": verified}
     
     def delete_collection(self, agent_name: str) -> bool:
-        """删除 Collection"""
+        """
+        删除 Collection（包括别名及其指向的物理 Collection）
+        
+        共享布局下仅删除该智能体的数据，共享 Collection 保留。
+        """
         collection_name = self.get_collection_name(agent_name)
+        if self.shared_layout:
+            return self._delete_by_expr(agent_name, "")
+        
+        # 先使句柄失效，避免后续请求命中已删除 Collection 的缓存对象
+        self.invalidate_vector_store(agent_name)
         try:
-            if self.collection_exists(agent_name):
-                utility.drop_collection(collection_name, using=self.connection_alias)
+            physical = self._physical_collections(agent_name)
+            using = self.pool.alias()
+            for name in physical:
+                for alias in utility.list_aliases(name, using=using):
+                    utility.drop_alias(alias, using=using)
+                utility.drop_collection(name, using=using)
+            if physical:
                 print(f"✅ 已删除 Collection: {collection_name}")
                 return True
             return False
@@ -143,8 +1082,195 @@ class MilvusVectorStore:
             print(f"❌ 删除 Collection 失败: {e}")
             return False
     
-    def delete_by_file_id(self, agent_name: str, file_id: str) -> bool:
-        """根据 file_id 删除向量"""
+    def get_load_state(self, agent_name: str) -> str:
+        """获取 Collection 在 Milvus 中的加载状态（Loaded/Loading/NotLoad/NotExist）"""
+        collection_name = self.get_collection_name(agent_name)
+        state = utility.load_state(collection_name, using=self.pool.alias())
+        return getattr(state, "name", str(state))
+    
+    def load_collection(self, agent_name: str):
+        """加载 Collection 到 Milvus 查询节点内存"""
+        collection_name = self.get_collection_name(agent_name)
+        Collection(collection_name, using=self.pool.alias()).load()
+        print(f"✅ 已加载 Collection: {collection_name}")
+    
+    def release_collection(self, agent_name: str) -> bool:
+        """
+        从 Milvus 查询节点内存中释放 Collection（共享 Collection 始终保持加载）
+
+        Returns:
+            bool: 是否实际释放（共享布局下不释放，返回 False）
+        """
+        collection_name = self.get_collection_name(agent_name)
+        if self.shared_layout:
+            return False
+        Collection(collection_name, using=self.pool.alias()).release()
+        print(f"💤 已释放 Collection: {collection_name}")
+        return True
+    
+    @staticmethod
+    def _bind_vector_store(vector_store: Milvus, conn: PooledConnection) -> Milvus:
+        """派生绑定到指定连接的轻量句柄（浅拷贝，共享 schema 等状态，不影响缓存的句柄）"""
+        bound = copy.copy(vector_store)
+        bound._milvus_client = conn.client
+        bound.alias = conn.alias
+        return bound
+
+    def add_documents(self, agent_name: str, documents: List) -> List[str]:
+        """
+        写入文档（向量化后经连接池中的连接插入，单批插入受调用截止时间约束）
+
+        Args:
+            agent_name: 智能体名称
+            documents: LangChain Document 列表
+
+        Returns:
+            List[str]: 插入实体的主键
+        """
+        vector_store = self.get_vector_store(agent_name)
+        if vector_store.col is None and not self.shared_layout:
+            return self._create_versioned_collection(agent_name, documents)
+        with self.pool.connection() as conn:
+            return self._bind_vector_store(vector_store, conn).add_documents(
+                documents, timeout=self.pool.call_timeout
+            )
+    
+    def _create_versioned_collection(self, agent_name: str, documents: List) -> List[str]:
+        """
+        以首批文档创建物理 Collection（<base>__vN）并创建指向它的别名 <base>
+        
+        Collection 从一开始就位于别名之后，在线重建只需 alter_alias 原子切换。
+        其他进程并发创建时，别名已指向同一智能体的 Collection 视为成功。
+        
+        Returns:
+            List[str]: 插入实体的主键
+        """
+        base = self.get_collection_name(agent_name)
+        physical_name = self._next_collection_version(agent_name)
+        vector_store = self._build_vector_store(agent_name, collection_name=physical_name)
+        with self.pool.connection() as conn:
+            ids = self._bind_vector_store(vector_store, conn).add_documents(
+                documents, timeout=self.pool.call_timeout
+            )
+            try:
+                utility.create_alias(physical_name, base, using=conn.alias)
+            except Exception:
+                if self.resolve_collection(agent_name) is None:
+                    raise
+        self.invalidate_vector_store(agent_name)
+        print(f"✅ 已创建 Collection: {physical_name}（别名 {base}）")
+        return ids
+
+    @staticmethod
+    def _create_file_id_index(collection: Collection) -> bool:
+        """
+        为 file_id 创建 INVERTED 标量索引（共享布局下 file_id 位于动态字段，按键名建索引）
+        
+        Returns:
+            bool: 是否已建有索引
+        """
+        if any(index.index_name == FILE_ID_INDEX_NAME or index.field_name == FILE_ID_FIELD
+               for index in collection.indexes):
+            return True
+        if any(field.name == FILE_ID_FIELD for field in collection.schema.fields):
+            collection.create_index(FILE_ID_FIELD, FILE_ID_INDEX_PARAMS, index_name=FILE_ID_INDEX_NAME)
+        elif collection.schema.enable_dynamic_field:
+            params = {**FILE_ID_INDEX_PARAMS, "params": {"json_path": FILE_ID_FIELD, "json_cast_type": "varchar"}}
+            collection.create_index(FILE_ID_FIELD, params, index_name=FILE_ID_INDEX_NAME)
+        else:
+            return False
+        print(f"✅ 已创建 file_id 索引: {collection.name}")
+        return True
+    
+    def ensure_file_id_index(self, agent_name: str) -> bool:
+        """
+        确保智能体当前的物理 Collection 建有 file_id 索引（每个 Collection 只检查一次）
+        
+        Returns:
+            bool: 是否已建有索引
+        """
+        physical = self.resolve_collection(agent_name)
+        if physical is None:
+            return False
+        if physical in self._file_id_indexed:
+            return True
+        try:
+            with self.pool.connection() as conn:
+                indexed = self._create_file_id_index(Collection(physical, using=conn.alias))
+        except Exception as e:
+            print(f"⚠️ 创建 file_id 索引失败: {e}")
+            return False
+        if indexed:
+            self._file_id_indexed.add(physical)
+        return indexed
+    
+    def delete_by_file_id(
+        self,
+        agent_name: str,
+        file_id: str,
+        vector_ids: Optional[List[int]] = None,
+        vector_collection: Optional[str] = None
+    ) -> bool:
+        """
+        根据 file_id 删除向量
+        
+        提供入库时记录的主键且其所在物理 Collection 仍在提供服务时按主键删除，
+        否则（旧数据、重建或迁移后主键已变化）按 file_id 表达式删除。
+        
+        Args:
+            agent_name: 智能体名称
+            file_id: 文件 ID
+            vector_ids: 入库时记录的主键
+            vector_collection: 主键所在的物理 Collection
+        """
+        if vector_ids and vector_collection and vector_collection == self.resolve_collection(agent_name):
+            return self.delete_by_ids(vector_collection, vector_ids)
+        return self._delete_by_expr(agent_name, f'{FILE_ID_FIELD} == "{file_id}"')
+    
+    def delete_by_ids(self, collection_name: str, ids: List[int], batch_size: int = 1000) -> bool:
+        """
+        按主键分批删除向量（不强制 flush，Strong 一致性的查询与统计可立即看到删除）
+        
+        Args:
+            collection_name: 物理 Collection 名称
+            ids: 主键列表
+            batch_size: 每批删除的主键数量
+        """
+        try:
+            deleted = 0
+            with self.pool.connection() as conn:
+                for i in range(0, len(ids), batch_size):
+                    result = conn.client.delete(
+                        collection_name, ids=ids[i:i + batch_size], timeout=self.pool.call_timeout
+                    )
+                    deleted += result.get("delete_count", 0)
+            print(f"✅ 已按主键删除向量: {collection_name}, 删除数量: {deleted}")
+            return True
+        except Exception as e:
+            print(f"❌ 按主键删除向量失败: {e}")
+            return False
+    
+    def compact(self, agent_name: str) -> bool:
+        """
+        触发 Collection 压缩（服务端异步执行，清理已删除的实体）
+        
+        Returns:
+            bool: 是否已提交压缩
+        """
+        collection_name = self.resolve_collection(agent_name)
+        if collection_name is None:
+            return False
+        try:
+            with self.pool.connection() as conn:
+                Collection(collection_name, using=conn.alias).compact(timeout=self.pool.call_timeout)
+            print(f"🗜️ 已提交压缩: {collection_name}")
+            return True
+        except Exception as e:
+            print(f"⚠️ 提交压缩失败: {e}")
+            return False
+    
+    def _delete_by_expr(self, agent_name: str, expr: str) -> bool:
+        """按表达式删除智能体范围内的向量"""
         collection_name = self.get_collection_name(agent_name)
         
         if not self.collection_exists(agent_name):
@@ -152,15 +1278,12 @@ class MilvusVectorStore:
             return False
         
         try:
-            collection = Collection(collection_name, using=self.connection_alias)
-            collection.load()
-            
-            # 使用表达式删除：file_id == "xxx"
-            expr = f'file_id == "{file_id}"'
-            result = collection.delete(expr)
-            collection.flush()
+            # 删除不要求 Collection 处于加载状态，也无需 flush
+            with self.pool.connection() as conn:
+                collection = Collection(collection_name, using=conn.alias)
+                result = collection.delete(self._scope_expr(agent_name, expr), timeout=self.pool.call_timeout)
             
-            print(f"✅ 已删除文件向量: {file_id}, 删除数量: {result.delete_count}")
+            print(f"✅ 已删除向量: {agent_name} [{expr or '全部'}], 删除数量: {result.delete_count}")
             return True
         except Exception as e:
             print(f"❌ 删除向量失败: {e}")
@@ -178,14 +1301,14 @@ class MilvusVectorStore:
             }
         
         try:
-            collection = Collection(collection_name, using=self.connection_alias)
-            # 刷新数据以确保统计准确
-            collection.flush()
-            collection.load()
+            # count(*) 按 stats 一致性级别读取，不需要 flush（num_entities 只统计已落盘数据，且包含已删除实体）
+            total_vectors = self.count_entities(agent_name)
+            if total_vectors is None:
+                raise RuntimeError("统计实体数量失败")
             
             stats = {
                 "collection_name": collection_name,
-                "total_vectors": collection.num_entities,
+                "total_vectors": total_vectors,
                 "exists": True
             }
             
@@ -199,29 +1322,529 @@ class MilvusVectorStore:
                 "error": str(e)
             }
     
+    def count_entities(self, agent_name: str, operation: str = OP_STATS) -> Optional[int]:
+        """
+        统计 Collection 中的有效实体数量（count(*) 查询，不触发 flush）
+        
+        与 num_entities 不同，已删除的实体不会被计入。
+        
+        Args:
+            agent_name: 智能体名称
+            operation: 一致性策略中的操作类别（默认 stats；重建等需要看到全部写入时用 verify）
+        
+        Returns:
+            Optional[int]: 实体数量；Collection 不存在返回 0，查询失败返回 None
+        """
+        collection_name = self.get_collection_name(agent_name)
+        
+        if not self.collection_exists(agent_name):
+            return 0
+        
+        try:
+            with self.pool.connection() as conn:
+                collection = Collection(collection_name, using=conn.alias)
+                result = collection.query(
+                    expr=self._scope_expr(agent_name),
+                    output_fields=["count(*)"],
+                    consistency_level=self.consistency_level(agent_name, operation),
+                    timeout=self.pool.call_timeout
+                )
+            return int(result[0]["count(*)"]) if result else 0
+        except Exception as e:
+            print(f"⚠️ 统计实体数量失败: {e}")
+            return None
+
+    def iter_entities(self, agent_name: str, expr: str = "", batch_size: int = 1000):
+        """
+        分批遍历智能体范围内的实体（含稠密向量，统一解码为 float32；不含 BM25 稀疏向量）
+
+        用于入库后同步副本，按 verify 一致性级别读取。
+
+        Args:
+            agent_name: 智能体名称
+            expr: 附加过滤表达式
+            batch_size: 每批数量
+
+        Yields:
+            List[Dict]: 一批实体
+        """
+        if not self.collection_exists(agent_name):
+            return
+
+        collection = Collection(self.get_collection_name(agent_name), using=self.pool.alias())
+        output_fields = [
+            field.name for field in collection.schema.fields
+            if field.name != SPARSE_FIELD and not getattr(field, "is_function_output", False)
+        ]
+        if collection.schema.enable_dynamic_field:
+            output_fields.append("$meta")
+        vector_dtype = self._vector_format_of(collection.schema)["vector_dtype"]
+
+        iterator = collection.query_iterator(
+            batch_size=batch_size,
+            expr=self._scope_expr(agent_name, expr),
+            output_fields=output_fields,
+            consistency_level=self.consistency_level(agent_name, OP_VERIFY)
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                if vector_dtype != "FLOAT32":
+                    matrix = decode_vectors([row["vector"] for row in rows], vector_dtype)
+                    rows = [{**row, "vector": vector} for row, vector in zip(rows, matrix)]
+                yield rows
+        finally:
+            iterator.close()
+
+    def dense_search(self, agent_name: str, query_vectors: List[List[float]], top_k: int) -> List[List[Dict]]:
+        """
+        仅稠密向量一路的原始检索结果（用于与进程内副本做一致性校验）
+
+        Args:
+            agent_name: 智能体名称
+            query_vectors: 查询向量
+            top_k: 每条查询返回数量
+
+        Returns:
+            List[List[Dict]]: 每条查询的命中列表（id, distance）
+        """
+        vector_store = self.get_vector_store(agent_name)
+        if vector_store.col is None:
+            return [[] for _ in query_vectors]
+
+        search_params = vector_store.search_params
+        if isinstance(search_params, list):
+            search_params = search_params[0]
+        with self.pool.connection() as conn:
+            return conn.client.search(
+                collection_name=vector_store.collection_name,
+                data=encode_queries(query_vectors, vector_store.vector_format),
+                anns_field="vector",
+                search_params=search_params,
+                filter=self._scope_expr(agent_name),
+                limit=top_k,
+                output_fields=[],
+                consistency_level=self.consistency_level(agent_name, OP_VERIFY),
+                timeout=self.pool.call_timeout
+            )
+
     def search_similar(
         self, 
         agent_name: str, 
         query: str, 
         top_k: int = 3
     ) -> List[Dict]:
-        """相似度搜索"""
+        """相似度搜索（单条查询，语义同 search_similar_batch）"""
+        return self.search_similar_batch(agent_name, [query], top_k)
+    
+    def search_similar_batch(
+        self,
+        agent_name: str,
+        queries: List[str],
+        top_k: int = 3,
+        exclude_file_ids: Optional[Iterable[str]] = None,
+        min_similarity: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        批量相似度搜索：一次 Embedding 请求 + 一次 nq=N 的 Milvus 搜索
+        
+        Collection 含 BM25 稀疏向量字段时执行混合检索：稠密与稀疏两路在同一次
+        hybrid_search 请求中完成，服务端以 RRF 融合排序。
+        多条查询的命中结果按主键合并去重（保留最优分数），并按相似度排序。
+        
+        Args:
+            agent_name: 智能体名称
+            queries: 查询文本列表
+            top_k: 每条查询返回的结果数量，也是合并后的最大返回数量
+            exclude_file_ids: 需要排除的文件 ID（已软删除、尚未清除）
+            min_similarity: 相似度阈值（范围检索，低于阈值的文本块不返回）
+            
+        Returns:
+            List[Dict]: 合并去重后的结果，最相似的在前
+        """
+        queries = [q for q in queries if q and q.strip()]
+        if not queries:
+            return []
+        
         try:
             vector_store = self.get_vector_store(agent_name)
-            results = vector_store.similarity_search_with_score(query, k=top_k)
-            
-            return [
-                {
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "score": float(score)
-                }
-                for doc, score in results
-            ]
+            if vector_store.col is None:
+                return []
+            
+            # 1. 一次请求完成所有查询的向量化（命中缓存的不再请求）
+            query_vectors = self.embed_queries(queries, agent_name)
+            
+            # 2. 一次 nq=N 的检索（混合检索时稠密 + 稀疏两路在同一请求内融合）
+            hybrid = self._is_hybrid(vector_store)
+            request = self._build_search_request(
+                agent_name, vector_store, queries, query_vectors, top_k, exclude_file_ids, min_similarity
+            )
+            with self.pool.connection() as conn:
+                if hybrid:
+                    hits_per_query = conn.client.hybrid_search(**request)
+                else:
+                    hits_per_query = conn.client.search(**request)
+            
+            # 3. 合并去重
+            return self.merge_hits(
+                hits_per_query, top_k, fused=hybrid, min_similarity=min_similarity,
+                query_vectors=query_vectors, vector_format=vector_store.vector_format
+            )
         except Exception as e:
-            print(f"❌ 搜索失败: {e}")
+            print(f"❌ 批量搜索失败: {e}")
+            return []
+    
+    async def asearch_similar_batch(
+        self,
+        agent_name: str,
+        queries: List[str],
+        top_k: int = 3,
+        exclude_file_ids: Optional[Iterable[str]] = None,
+        min_similarity: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        批量相似度搜索（异步版本，不阻塞事件循环）
+        
+        使用异步 Embedding 请求与 AsyncMilvusClient，语义同 search_similar_batch。
+        """
+        queries = [q for q in queries if q and q.strip()]
+        if not queries:
             return []
+        
+        try:
+            collection_name = self.get_collection_name(agent_name)
+            vector_store = self._vector_stores.get(collection_name)
+            if vector_store is None:
+                # 首次构建包装器涉及同步 RPC，放到线程池执行
+                vector_store = await asyncio.to_thread(self.get_vector_store, agent_name)
+                if vector_store.col is None:
+                    return []
+            
+            query_vectors = await self.aembed_queries(queries, agent_name)
+            
+            hybrid = self._is_hybrid(vector_store)
+            request = self._build_search_request(
+                agent_name, vector_store, queries, query_vectors, top_k, exclude_file_ids, min_similarity
+            )
+            self.pool.check_available()  # Milvus 不可用时快速失败
+            client = await self._get_async_client()
+            if hybrid:
+                hits_per_query = await client.hybrid_search(**request)
+            else:
+                hits_per_query = await client.search(**request)
+            
+            return self.merge_hits(
+                hits_per_query, top_k, fused=hybrid, min_similarity=min_similarity,
+                query_vectors=query_vectors, vector_format=vector_store.vector_format
+            )
+        except Exception as e:
+            print(f"❌ 异步批量搜索失败: {e}")
+            return []
+    
+    def has_match(
+        self,
+        agent_name: str,
+        queries: List[str],
+        min_similarity: float,
+        exclude_file_ids: Optional[Iterable[str]] = None
+    ) -> bool:
+        """
+        是否有文本块与任一查询匹配（回答前的阈值预检）
+        
+        检索请求与 search_similar_batch 相同（top_k=1）：稠密向量一路为范围检索，达到阈值才返回；
+        混合检索时 BM25 一路的命中（产品编号、条款号等字面匹配）同样算作匹配。
+        与 search_similar_batch 不同，异常直接抛出：Milvus 不可用不能被当作"无匹配"。
+        
+        Args:
+            agent_name: 智能体名称
+            queries: 查询文本列表
+            min_similarity: 相似度阈值
+            exclude_file_ids: 需要排除的文件 ID（已软删除、尚未清除）
+            
+        Returns:
+            bool: 是否有匹配的文本块
+        """
+        queries = [q for q in queries if q and q.strip()]
+        if not queries:
+            return False
+        vector_store = self.get_vector_store(agent_name)
+        if vector_store.col is None:
+            return False
+        query_vectors = self.embed_queries(queries, agent_name)
+        hybrid = self._is_hybrid(vector_store)
+        request = self._build_search_request(
+            agent_name, vector_store, queries, query_vectors, 1, exclude_file_ids, min_similarity
+        )
+        with self.pool.connection() as conn:
+            if hybrid:
+                hits_per_query = conn.client.hybrid_search(**request)
+            else:
+                hits_per_query = conn.client.search(**request)
+        return bool(self.merge_hits(hits_per_query, 1, fused=hybrid, min_similarity=min_similarity))
+    
+    async def ahas_match(
+        self,
+        agent_name: str,
+        queries: List[str],
+        min_similarity: float,
+        exclude_file_ids: Optional[Iterable[str]] = None
+    ) -> bool:
+        """阈值预检（异步版本，语义同 has_match，异常直接抛出）"""
+        queries = [q for q in queries if q and q.strip()]
+        if not queries:
+            return False
+        vector_store = self._vector_stores.get(self.get_collection_name(agent_name))
+        if vector_store is None:
+            vector_store = await asyncio.to_thread(self.get_vector_store, agent_name)
+        if vector_store.col is None:
+            return False
+        query_vectors = await self.aembed_queries(queries, agent_name)
+        hybrid = self._is_hybrid(vector_store)
+        request = self._build_search_request(
+            agent_name, vector_store, queries, query_vectors, 1, exclude_file_ids, min_similarity
+        )
+        self.pool.check_available()
+        client = await self._get_async_client()
+        if hybrid:
+            hits_per_query = await client.hybrid_search(**request)
+        else:
+            hits_per_query = await client.search(**request)
+        return bool(self.merge_hits(hits_per_query, 1, fused=hybrid, min_similarity=min_similarity))
+    
+    async def asearch_similar(
+        self,
+        agent_name: str,
+        query: str,
+        top_k: int = 3
+    ) -> List[Dict]:
+        """相似度搜索（异步版本）"""
+        return await self.asearch_similar_batch(agent_name, [query], top_k)
+    
+    @staticmethod
+    def _is_hybrid(vector_store: Milvus) -> bool:
+        """Collection 是否包含 BM25 稀疏向量字段"""
+        return milvus_settings.hybrid_search and SPARSE_FIELD in vector_store.fields
+
+    def uses_hybrid_search(self, agent_name: str) -> bool:
+        """智能体的检索是否走混合检索（稠密 + BM25）"""
+        if not milvus_settings.hybrid_search:
+            return False
+        return self._is_hybrid(self.get_vector_store(agent_name))
 
+    def _build_search_request(
+        self,
+        agent_name: str,
+        vector_store: Milvus,
+        queries: List[str],
+        query_vectors: List[List[float]],
+        top_k: int,
+        exclude_file_ids: Optional[Iterable[str]] = None,
+        min_similarity: Optional[float] = None
+    ) -> Dict:
+        """
+        根据向量存储句柄构造 search / hybrid_search 参数（同步/异步客户端共用）
+        
+        混合检索时返回 hybrid_search 参数：稠密向量与原始查询文本（由服务端 BM25 分词）各一路，
+        每路召回 top_k 条后以 RRF 融合。排除的文件以 file_id not in [...] 过滤（两路均生效）。
+        一致性级别取智能体策略中的 search（默认 Bounded，不等待最新写入）。
+        设置相似度阈值时稠密向量一路改为范围检索（radius）；BM25 一路只返回含查询词的文本块，不设阈值。
+        """
+        search_params = vector_store.search_params
+        if isinstance(search_params, list):
+            search_params = search_params[0]
+        if min_similarity is not None:
+            search_params = {
+                **search_params,
+                "params": {**search_params.get("params", {}), "radius": similarity_radius(min_similarity)}
+            }
+        output_fields = [f for f in vector_store.fields if f not in ("vector", SPARSE_FIELD)]
+        if vector_store.enable_dynamic_field and "$meta" not in output_fields:
+            output_fields.append("$meta")
+        exclude_expr = f"{FILE_ID_FIELD} not in {json.dumps(sorted(exclude_file_ids))}" if exclude_file_ids else ""
+        expr = self._scope_expr(agent_name, exclude_expr)
+        consistency_level = self.consistency_level(agent_name, OP_SEARCH)
+        query_vectors = encode_queries(query_vectors, vector_store.vector_format)
+        
+        if not self._is_hybrid(vector_store):
+            return {
+                "collection_name": vector_store.collection_name,
+                "data": query_vectors,
+                "anns_field": "vector",
+                "search_params": search_params,
+                "filter": expr,
+                "limit": top_k,
+                "output_fields": output_fields,
+                "consistency_level": consistency_level,
+                "timeout": self.pool.call_timeout
+            }
+        
+        reqs = [
+            AnnSearchRequest(
+                data=query_vectors,
+                anns_field="vector",
+                param=search_params,
+                limit=top_k,
+                expr=expr or None
+            ),
+            AnnSearchRequest(
+                data=queries,
+                anns_field=SPARSE_FIELD,
+                param=BM25_SEARCH_PARAMS,
+                limit=top_k,
+                expr=expr or None
+            )
+        ]
+        return {
+            "collection_name": vector_store.collection_name,
+            "reqs": reqs,
+            "ranker": RRFRanker(milvus_settings.rrf_k),
+            "limit": top_k,
+            # 融合结果只有 RRF 分数，取回稠密向量以计算真实相似度（top_k 条，开销很小）
+            "output_fields": output_fields + ["vector"],
+            "consistency_level": consistency_level,
+            "timeout": self.pool.call_timeout
+        }
+    
+    async def _get_async_client(self) -> AsyncMilvusClient:
+        """获取绑定当前事件循环的 AsyncMilvusClient（懒加载，多个客户端轮转使用）"""
+        loop = asyncio.get_running_loop()
+        if not self._async_clients or self._async_client_loop is not loop:
+            # 旧客户端的通道绑定在已结束的事件循环上：先移除其连接；
+            # 新客户端使用按循环区分的别名（pymilvus 对已存在的别名复用原连接）
+            await self._discard_async_clients()
+            generation = next(self._async_client_generation)
+            conn_params = {"uri": f"http://{milvus_settings.host}:{milvus_settings.port}"}
+            if milvus_settings.user:
+                conn_params["user"] = milvus_settings.user
+            if milvus_settings.password:
+                conn_params["password"] = milvus_settings.password
+            if milvus_settings.db_name:
+                conn_params["db_name"] = milvus_settings.db_name
+            
+            aliases = [f"atlas_async_{generation}_{i}" for i in range(self.pool.size)]
+            self._async_clients = [AsyncMilvusClient(alias=alias, **conn_params) for alias in aliases]
+            self._async_client_aliases = aliases
+            self._async_client_loop = loop
+            print(f"✅ 已创建 Milvus 异步客户端（{len(self._async_clients)} 个）")
+        return self._async_clients[next(self._async_client_counter) % len(self._async_clients)]
+    
+    async def _discard_async_clients(self):
+        """关闭并移除当前的异步客户端（通道属于其他事件循环时无法正常关闭，仅从连接注册表中移除）"""
+        clients, self._async_clients = self._async_clients, []
+        aliases, self._async_client_aliases = self._async_client_aliases, []
+        self._async_client_loop = None
+        for client, alias in zip(clients, aliases):
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"⚠️ 关闭 Milvus 异步客户端失败，直接移除连接 {alias}: {e}")
+                # async_disconnect 已先移除连接句柄，这里移除残留的别名配置；
+                # 单个别名移除失败不影响其余客户端的清理
+                try:
+                    connections.remove_connection(alias)
+                except Exception as e:
+                    print(f"⚠️ 移除 Milvus 连接 {alias} 失败: {e}")
+    
+    async def close_async_client(self):
+        """关闭异步客户端（应用关闭时调用）"""
+        await self._discard_async_clients()
+    
+    @staticmethod
+    def _dense_similarities(
+        hits_per_query: List[List[Dict]],
+        query_vectors: Optional[List[List[float]]],
+        vector_format: Optional[Dict]
+    ) -> np.ndarray:
+        """
+        融合结果中每个命中与其查询的稠密向量相似度（向量已归一化，即余弦相似度）
+        
+        Returns:
+            np.ndarray: 与展开后的命中一一对应；命中不含向量时为 NaN
+        """
+        count = sum(len(query_hits) for query_hits in hits_per_query)
+        if query_vectors is None or vector_format is None:
+            return np.full(count, np.nan)
+        queries = truncate_vectors(np.asarray(query_vectors, dtype=np.float32), vector_format.get("vector_dim"))
+        similarities = []
+        for query, query_hits in zip(queries, hits_per_query):
+            vectors = [hit["entity"].get("vector") for hit in query_hits]
+            if any(vector is None for vector in vectors):
+                similarities.extend([np.nan] * len(vectors))
+            elif vectors:
+                similarities.extend(decode_vectors(vectors, vector_format["vector_dtype"]) @ query)
+        return np.asarray(similarities, dtype=np.float64)
+    
+    def merge_hits(
+        self,
+        hits_per_query: List[List[Dict]],
+        top_k: int,
+        fused: bool = False,
+        min_similarity: Optional[float] = None,
+        query_vectors: Optional[List[List[float]]] = None,
+        vector_format: Optional[Dict] = None
+    ) -> List[Dict]:
+        """
+        按主键合并多条查询的命中结果，保留每个文本块的最优分数
+        
+        融合结果按 RRF 分数排序，RRF 分数以 fused_score 单独返回；score / similarity 始终是
+        稠密向量的距离与相似度（由命中携带的向量与查询向量计算），含义与非融合结果一致。
+        
+        Args:
+            hits_per_query: 每条查询的命中列表
+            top_k: 最大返回数量
+            fused: 是否为 RRF 融合结果
+            min_similarity: 相似度阈值（只过滤非融合结果；融合结果的稠密一路已按阈值范围检索，
+                低于阈值的命中来自 BM25 一路，保留）
+            query_vectors: 查询向量（融合结果计算稠密相似度用）
+            vector_format: Collection 的向量存储格式（融合结果解码命中向量用）
+        
+        Returns:
+            List[Dict]: {"content", "metadata", "score"（稠密向量的原始距离/分数）,
+                         "similarity"（统一相似度，越大越相似）}，融合结果另含
+                         "fused_score"（RRF 分数归一化到 0-1，两路均排第一时为 1）
+        """
+        hits = [hit for query_hits in hits_per_query for hit in query_hits]
+        if not hits:
+            return []
+        
+        distances = np.fromiter((hit["distance"] for hit in hits), dtype=np.float64, count=len(hits))
+        keys = np.array([str(hit["id"]) for hit in hits])
+        
+        fused_scores = None
+        if fused:
+            fused_scores = distances * (milvus_settings.rrf_k + 1) / 2
+            similarities = self._dense_similarities(hits_per_query, query_vectors, vector_format)
+            distances = distance_from_similarity(similarities)
+            higher_is_better = True
+        else:
+            # L2 距离越小越相似；IP/COSINE 分数越大越相似
+            similarities = similarity_from_distance(distances)
+            higher_is_better = milvus_settings.metric_type.upper() != "L2"
+        ranking = fused_scores if fused else distances
+        order = np.argsort(-ranking if higher_is_better else ranking, kind="stable")
+        if min_similarity is not None and not fused:
+            order = order[similarities[order] >= min_similarity]
+        # 排序后每个主键的首次出现即为最优命中
+        _, first_idx = np.unique(keys[order], return_index=True)
+        best = order[np.sort(first_idx)][:top_k]
+        
+        results = []
+        for i in best:
+            entity = dict(hits[i]["entity"])
+            entity.pop("vector", None)
+            entity.pop(SPARSE_FIELD, None)
+            result = {
+                "content": entity.pop("text", ""),
+                "metadata": entity,
+                "score": None if np.isnan(distances[i]) else float(distances[i]),
+                "similarity": None if np.isnan(similarities[i]) else float(similarities[i])
+            }
+            if fused:
+                result["fused_score"] = float(fused_scores[i])
+            results.append(result)
+        return results
 
 # 全局单例
 _milvus_store: Optional[MilvusVectorStore] = None
@@ -4,6 +4,7 @@ RAG Agent - 基于 Milvus 的智能问答代理
 职责：对话管理、Agent 创建、对话历史维护
 """
 import os
+import asyncio
 from typing import Optional, List
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
@@ -12,6 +13,8 @@ from langchain.agents import create_agent
 from langchain_core.tools import tool
 from langchain_core.tools import StructuredTool
 from domain.processors.vector_store_manager import VectorStoreManager
+from config.milvus import milvus_settings
+from config.settings import settings
 
 load_dotenv()
 
@@ -22,7 +25,9 @@ class RAGAgent:
         self, 
         agent_name: str, 
         system_prompt: str,
-        vector_manager: VectorStoreManager
+        vector_manager: VectorStoreManager,
+        similarity_threshold: Optional[float] = None,
+        no_match_response: Optional[str] = None
     ):
         """
         初始化 RAG Agent
@@ -31,6 +36,8 @@ class RAGAgent:
             agent_name: 智能体名称
             system_prompt: 系统提示词（必填）
             vector_manager: 向量存储管理器（依赖注入）
+            similarity_threshold: 相似度阈值（为空使用全局默认，0 表示不启用）
+            no_match_response: 没有文档达到阈值时的预设回复（为空使用全局默认）
         
         Raises:
             ValueError: 如果 system_prompt 为空
@@ -41,6 +48,11 @@ class RAGAgent:
         self.agent_name = agent_name
         self.system_prompt = system_prompt.strip()
         self.vector_manager = vector_manager
+        # 相似度阈值：检索只返回达到阈值的文档；一个都没有时直接返回预设回复，不调用 LLM
+        if similarity_threshold is None:
+            similarity_threshold = settings.SIMILARITY_THRESHOLD
+        self.similarity_threshold = similarity_threshold or None
+        self.no_match_response = no_match_response or settings.NO_MATCH_RESPONSE
         self.vector_store = None
         self.agent = None
         self.chat_history = []
@@ -78,20 +90,11 @@ class RAGAgent:
         # 2. 使用 @tool 装饰器定义工具（LangChain v1.0+ 标准方式）
         agent_name = self.agent_name  # 闭包捕获
         vector_manager = self.vector_manager
+        min_similarity = self.similarity_threshold
 
-        def rewrite_query(query: str) -> str:
-            """改写用户问题为更适合检索的查询语句。
-            
-            将口语化问题转换为3条不同角度的关键词查询。
-            
-            Args:
-                query: 原始用户问题
-                
-            Returns:
-                改写后的3条检索查询（JSON数组格式）
-            """
-            print(f"\n🔧 [rewrite_query] 开始执行 - 原始问题: {query}")
-            messages = [
+        def build_rewrite_messages(query: str) -> list:
+            """构造查询改写的提示消息"""
+            return [
                 SystemMessage(content="你是查询改写专家，擅长将口语化问题转换为适合语义检索的关键词查询。"),
                 HumanMessage(content=f"""请将用户问题改写成3条关键词丰富的检索query。
                 
@@ -104,83 +107,103 @@ class RAGAgent:
                 
                 改写结果（JSON数组）：""")
             ]
-            response = llm_non_streaming.invoke(messages)
-            result = response.content.strip()
-            print(f"✅ [rewrite_query] 执行完成 - 改写结果: {result}")
-            return result
         
-        def retrieve_context(queries: str) -> str:
-            """从知识库检索与查询最相关的文档内容。
+        def rewrite_query(query: str) -> str:
+            """改写用户问题为更适合检索的查询语句。
             
-            使用多条改写后的查询进行检索，合并去重结果。
+            将口语化问题转换为3条不同角度的关键词查询。
             
             Args:
-                queries: 改写后的查询（JSON数组格式，如rewrite_query返回的结果）
+                query: 原始用户问题
                 
             Returns:
-                检索到的文档内容，包含相似度分数
+                改写后的3条检索查询（JSON数组格式）
             """
-            print(f"\n🔧 [retrieve_context] 开始执行 - 收到查询: {queries}")
+            print(f"\n🔧 [rewrite_query] 开始执行 - 原始问题: {query}")
+            response = llm_non_streaming.invoke(build_rewrite_messages(query))
+            result = response.content.strip()
+            print(f"✅ [rewrite_query] 执行完成 - 改写结果: {result}")
+            return result
+        
+        async def arewrite_query(query: str) -> str:
+            """改写用户问题为更适合检索的查询语句（异步版本）。"""
+            print(f"\n🔧 [rewrite_query] 开始执行(async) - 原始问题: {query}")
+            response = await llm_non_streaming.ainvoke(build_rewrite_messages(query))
+            result = response.content.strip()
+            print(f"✅ [rewrite_query] 执行完成 - 改写结果: {result}")
+            return result
+        
+        def parse_queries(queries: str) -> List[str]:
+            """解析改写后的查询列表（最多使用3条）"""
             import json
             
-            # 解析查询列表
             try:
                 query_list = json.loads(queries) if queries.startswith('[') else [queries]
             except:
                 query_list = [queries]  # 如果解析失败，当作单个查询
             
             print(f"📋 [retrieve_context] 解析后的查询列表: {query_list}")
-            
-            # 使用多条查询检索，收集所有结果
-            all_results = {}
-            for query in query_list[:3]:  # 最多使用3条查询
-                print(f"🔍 [retrieve_context] 正在检索: {query}")
-                results = vector_manager.search_similar(agent_name, query, top_k=3)
-                for result in results:
-                    doc_id = result.get('metadata', {}).get('doc_id', result.get('content', '')[:50])
-                    # 保留最高分数的结果（分数越高越相似）
-                    if doc_id not in all_results or result.get('score', 0) > all_results[doc_id].get('score', 0):
-                        all_results[doc_id] = result
-            
-            if not all_results:
+            return [str(q) for q in query_list[:3]]
+        
+        def format_results(sorted_results: List[dict]) -> str:
+            """格式化检索结果"""
+            if not sorted_results:
                 return "知识库中未找到相关内容"
             
-            # 按相似度排序，取前3个
-            sorted_results = sorted(all_results.values(), key=lambda x: x.get('score', 0), reverse=True)[:3]
-            
-            # 格式化返回结果
             formatted_results = []
             for i, result in enumerate(sorted_results, 1):
-                score = result.get('score', 0)
+                score = result.get('similarity')
                 content = result.get('content', '')
-                formatted_results.append(f"[文档{i}] (相似度: {score:.3f})\n{content}")
+                if score is None:
+                    score = result.get('fused_score', result.get('score') or 0)
+                    formatted_results.append(f"[文档{i}] (融合得分: {score:.3f})\n{content}")
+                else:
+                    formatted_results.append(f"[文档{i}] (相似度: {score:.3f})\n{content}")
             
-            result_text = "\n\n".join(formatted_results)
             print(f"✅ [retrieve_context] 执行完成 - 返回 {len(sorted_results)} 个文档")
-            return result_text
-
-        def verify_answer(content: str) -> str:
-            """验证最终答案的准确性。
+            return "\n\n".join(formatted_results)
+        
+        def retrieve_context(queries: str) -> str:
+            """从知识库检索与查询最相关的文档内容。
             
-            检查答案是否有充分的文档证据支撑。
-            注意：需要在生成答案时自己记录使用的文档内容。
+            支持单条查询（如用户原始问题）或多条改写后的查询，多条时合并去重结果。
             
             Args:
-                content: 包含答案和文档的文本（格式：答案|||文档内容）
+                queries: 查询文本，或JSON数组格式的多条查询（如rewrite_query返回的结果）
                 
             Returns:
-                验证结果：VERIFIED 或 UNVERIFIED + 问题说明
+                检索到的文档内容，包含相似度分数
             """
-            print(f"\n🔧 [verify_answer] 开始执行 - 收到内容长度: {len(content)} 字符")
+            print(f"\n🔧 [retrieve_context] 开始执行 - 收到查询: {queries}")
+            query_list = parse_queries(queries)
+            
+            # 多条查询批量检索：一次向量化 + 一次 Milvus 搜索，结果已合并去重并排序
+            print(f"🔍 [retrieve_context] 正在批量检索: {query_list}")
+            sorted_results = vector_manager.search_similar_batch(
+                agent_name, query_list, top_k=3, min_similarity=min_similarity
+            )
+            return format_results(sorted_results)
+        
+        async def aretrieve_context(queries: str) -> str:
+            """从知识库检索与查询最相关的文档内容（异步版本）。"""
+            print(f"\n🔧 [retrieve_context] 开始执行(async) - 收到查询: {queries}")
+            query_list = parse_queries(queries)
+            
+            print(f"🔍 [retrieve_context] 正在批量检索: {query_list}")
+            sorted_results = await vector_manager.asearch_similar_batch(
+                agent_name, query_list, top_k=3, min_similarity=min_similarity
+            )
+            return format_results(sorted_results)
+        
+        def build_verify_messages(content: str) -> Optional[list]:
+            """构造答案验证的提示消息（格式不对时返回 None）"""
             # 尝试分割答案和文档
             parts = content.split('|||')
-            if len(parts) == 2:
-                answer, context = parts[0].strip(), parts[1].strip()
-            else:
-                # 如果格式不对，直接返回无法验证
-                return "VERIFIED（无文档上下文，跳过验证）"
+            if len(parts) != 2:
+                return None
+            answer, context = parts[0].strip(), parts[1].strip()
             
-            messages = [
+            return [
                 SystemMessage(content="你是事实核查专家，负责验证答案是否有充分的文档证据支撑。"),
                 HumanMessage(content=f"""请检查答案是否有充分的文档证据支撑。
                 
@@ -198,36 +221,110 @@ class RAGAgent:
                 
                 验证结果：""")
             ]
+
+        def verify_answer(content: str) -> str:
+            """验证最终答案的准确性。
+            
+            检查答案是否有充分的文档证据支撑。
+            注意：需要在生成答案时自己记录使用的文档内容。
+            
+            Args:
+                content: 包含答案和文档的文本（格式：答案|||文档内容）
+                
+            Returns:
+                验证结果：VERIFIED 或 UNVERIFIED + 问题说明
+            """
+            print(f"\n🔧 [verify_answer] 开始执行 - 收到内容长度: {len(content)} 字符")
+            messages = build_verify_messages(content)
+            if messages is None:
+                # 如果格式不对，直接返回无法验证
+                return "VERIFIED（无文档上下文，跳过验证）"
+            
             response = llm_non_streaming.invoke(messages)
             result = response.content.strip()
             print(f"✅ [verify_answer] 执行完成 - 验证结果: {result}")
             return result
         
+        async def averify_answer(content: str) -> str:
+            """验证最终答案的准确性（异步版本）。"""
+            print(f"\n🔧 [verify_answer] 开始执行(async) - 收到内容长度: {len(content)} 字符")
+            messages = build_verify_messages(content)
+            if messages is None:
+                return "VERIFIED（无文档上下文，跳过验证）"
+            
+            response = await llm_non_streaming.ainvoke(messages)
+            result = response.content.strip()
+            print(f"✅ [verify_answer] 执行完成 - 验证结果: {result}")
+            return result
+        
+        # 混合检索（稠密 + BM25）对产品编号、条款号、人名等精确词召回良好，
+        # 可直接用原始问题检索，仅在结果不相关时再改写查询，省去多数轮次的改写调用
+        hybrid = milvus_settings.hybrid_search
+        
         # 创建工具（清晰的描述和调用顺序）
         rewrite_query_tool = StructuredTool.from_function(
             func=rewrite_query,
+            coroutine=arewrite_query,  # ainvoke/astream_events 时使用异步实现
             name="rewrite_query",
-            description="【第1步-必须】改写用户问题为3条适合检索的关键词查询。返回JSON数组格式。必须最先调用此工具以提高检索召回率。"
+            description=(
+                "【可选】改写用户问题为3条适合检索的关键词查询。返回JSON数组格式。"
+                "仅在直接检索结果不相关或为空时调用。"
+                if hybrid else
+                "【第1步-必须】改写用户问题为3条适合检索的关键词查询。返回JSON数组格式。必须最先调用此工具以提高检索召回率。"
+            )
         )
         
         retrieve_tool = StructuredTool.from_function(
             func=retrieve_context,
+            coroutine=aretrieve_context,
             name="retrieve_context",
-            description="【第2步-必须】使用改写后的查询（JSON数组）从知识库检索文档。会自动合并多条查询的结果并去重。返回前3个最相关的文档片段及相似度分数。"
+            description=(
+                "【第1步-必须】从知识库检索文档（语义 + 关键词混合检索）。参数可以是用户原始问题，"
+                "也可以是rewrite_query返回的JSON数组。会自动合并多条查询的结果并去重。返回前3个最相关的文档片段及相似度分数。"
+                if hybrid else
+                "【第2步-必须】使用改写后的查询（JSON数组）从知识库检索文档。会自动合并多条查询的结果并去重。返回前3个最相关的文档片段及相似度分数。"
+            )
         )
 
         verify_answer_tool = StructuredTool.from_function(
             func=verify_answer,
+            coroutine=averify_answer,
             name="verify_answer",
             description="【第3步-可选】验证答案准确性。传入格式：'答案|||文档内容'。返回VERIFIED或UNVERIFIED+问题说明。仅用于重要事实验证。"
         )
         
         tools = [rewrite_query_tool, retrieve_tool, verify_answer_tool]
         
-        # 增强系统提示词，指导 Agent 如何使用工具
-        enhanced_system_prompt = f"""{self.system_prompt}
+        if hybrid:
+            workflow = """【RAG工作流程 - 严格顺序执行】
+        你必须按照以下步骤**顺序执行**，不可并行调用工具：
+        
+        1. **文档检索**（第1步-必须先执行）
+           直接调用 retrieve_context(用户问题)
+           - 检索同时匹配语义与关键词（产品编号、条款号、名称等可原样传入）
+           - 返回前3个最相关文档及相似度分数
+        
+        2. **查询改写**（可选-仅在第1步结果不相关或为空时执行）
+           调用 rewrite_query(用户问题)，再用其返回的JSON数组调用 retrieve_context
+           - 每轮对话最多改写一次
+        
+        3. **生成答案**（基于检索到的文档）
+           - 仅使用文档中的信息
+           - 如果文档无关（相似度<0.5），告知"抱歉，知识库中暂无相关信息"
+           - 自然引用，如"根据资料显示..."而非"文档1说..."
         
-        【RAG工作流程 - 严格顺序执行】
+        4. **验证答案**（可选）
+           如果涉及重要事实，调用 verify_answer("答案|||文档内容")
+           - 检查答案是否有证据支撑
+           - 如果UNVERIFIED，说明缺乏依据或需调整
+        
+        【关键规则】
+        ⚠️ 禁止并行调用工具！必须等待前一个工具返回结果后再调用下一个
+        - 严格基于文档回答，不编造信息
+        - 找不到内容就明确告知，不要臆测
+        - 引用要自然流畅，避免生硬的标注"""
+        else:
+            workflow = """【RAG工作流程 - 严格顺序执行】
         你必须按照以下步骤**顺序执行**，不可并行调用工具：
         
         1. **查询改写**（第1步-必须先执行）
@@ -259,6 +356,11 @@ class RAGAgent:
         - 找不到内容就明确告知，不要臆测
         - 引用要自然流畅，避免生硬的标注"""
         
+        # 增强系统提示词，指导 Agent 如何使用工具
+        enhanced_system_prompt = f"""{self.system_prompt}
+        
+        {workflow}"""
+        
         # 3. 使用 create_agent（LangChain v1.0+ 官方推荐 API）
         self.agent = create_agent(
             model=llm_streaming,
@@ -267,6 +369,50 @@ class RAGAgent:
         )
         print(f"✅ LangChain v1.0+ Agent 创建成功 (create_agent): {self.agent_name} and system_prompt ({self.system_prompt})")
     
+    def _match_queries(self, question: str) -> List[str]:
+        """阈值预检的查询：当前问题 + 上一轮用户问题（追问往往依赖上文，单独检索会误判为无关）"""
+        queries = [question]
+        for message in reversed(self.chat_history):
+            if isinstance(message, HumanMessage):
+                queries.append(message.content)
+                break
+        return queries
+    
+    def _has_match(self, question: str) -> bool:
+        """
+        是否有文档达到相似度阈值（未启用阈值时恒为 True）
+        
+        稠密向量达到阈值或 BM25 字面命中即算匹配；检索异常向上抛出，不当作无匹配
+        """
+        if not self.similarity_threshold:
+            return True
+        return self.vector_manager.has_match(
+            self.agent_name, self._match_queries(question), self.similarity_threshold
+        )
+    
+    async def _ahas_match(self, question: str) -> bool:
+        """是否有文档达到相似度阈值（异步版本）"""
+        if not self.similarity_threshold:
+            return True
+        return await self.vector_manager.ahas_match(
+            self.agent_name, self._match_queries(question), self.similarity_threshold
+        )
+    
+    def _no_match(self, question: str) -> str:
+        """未命中：记录对话并返回预设回复"""
+        print(f"ℹ️ 没有文档达到相似度阈值 {self.similarity_threshold}，直接返回预设回复: {self.agent_name}")
+        import time
+        timestamp = int(time.time())  # Unix 时间戳（秒）
+        self.chat_history.append(HumanMessage(
+            content=question,
+            additional_kwargs={"timestamp": timestamp}
+        ))
+        self.chat_history.append(AIMessage(
+            content=self.no_match_response,
+            additional_kwargs={"timestamp": timestamp}
+        ))
+        return self.no_match_response
+    
     def ask(self, question: str) -> str:
         """
         向 Agent 提问（使用 LangChain v1.0+ create_agent）
@@ -278,12 +424,15 @@ class RAGAgent:
             str: Agent 回答
         """
         try:
-            # 检查知识库是否为空
-            stats = self.vector_manager.get_statistics(self.agent_name)
-            if stats and stats.get("total_vectors", 0) == 0:
+            # 检查知识库是否为空（内存统计，不访问 Milvus）
+            if self.vector_manager.get_vector_count(self.agent_name) == 0:
                 empty_kb_msg = "您好！我是智能客服助手。目前我的知识库还是空的，请管理员先上传相关文档，我才能更好地为您服务。"
                 return empty_kb_msg
             
+            # 没有文档达到相似度阈值：一次检索即返回，不运行 Agent
+            if not self._has_match(question):
+                return self._no_match(question)
+            
             # 构建消息历史（LangGraph State 格式）
             messages = []
             # 添加历史消息（保留最近10轮）
@@ -322,6 +471,58 @@ class RAGAgent:
             traceback.print_exc()
             return "抱歉，处理您的问题时出现了错误。"
     
+    async def aask(self, question: str) -> str:
+        """
+        向 Agent 提问（异步版本，检索与 LLM 调用均不阻塞事件循环）
+        
+        Args:
+            question: 用户问题
+            
+        Returns:
+            str: Agent 回答
+        """
+        try:
+            # 检查知识库是否为空（首次访问可能查询数据库，放到线程池执行）
+            if await asyncio.to_thread(self.vector_manager.get_vector_count, self.agent_name) == 0:
+                empty_kb_msg = "您好！我是智能客服助手。目前我的知识库还是空的，请管理员先上传相关文档，我才能更好地为您服务。"
+                return empty_kb_msg
+            
+            if not await self._ahas_match(question):
+                return self._no_match(question)
+            
+            messages = []
+            messages.extend(self.chat_history[-10:])
+            messages.append({"role": "user", "content": question})
+            
+            result = await self.agent.ainvoke({"messages": messages})
+            
+            final_messages = result.get("messages", [])
+            if final_messages:
+                answer = final_messages[-1].content
+            else:
+                answer = "抱歉，我无法回答这个问题。"
+            
+            # 更新对话历史（添加时间戳）
+            import time
+            timestamp = int(time.time())  # Unix 时间戳（秒）
+            
+            self.chat_history.append(HumanMessage(
+                content=question,
+                additional_kwargs={"timestamp": timestamp}
+            ))
+            self.chat_history.append(AIMessage(
+                content=answer,
+                additional_kwargs={"timestamp": timestamp}
+            ))
+            
+            return answer
+            
+        except Exception as e:
+            print(f"❌ Agent 处理错误: {e}")
+            import traceback
+            traceback.print_exc()
+            return "抱歉，处理您的问题时出现了错误。"
+    
     async def ask_stream(self, question: str):
         """
         向 Agent 提问（流式响应，LangChain v1.0+ create_agent）
@@ -333,19 +534,23 @@ class RAGAgent:
             str: 逐块返回的回答内容
         """
         try:
-            # 检查知识库是否为空
-            stats = self.vector_manager.get_statistics(self.agent_name)
-            if stats and stats.get("total_vectors", 0) == 0:
+            # 检查知识库是否为空（首次访问可能查询数据库，放到线程池执行）
+            if await asyncio.to_thread(self.vector_manager.get_vector_count, self.agent_name) == 0:
                 empty_kb_msg = "您好！我是智能客服助手。目前我的知识库还是空的，请管理员先上传相关文档，我才能更好地为您服务。"
                 yield empty_kb_msg
                 return
             
+            if not await self._ahas_match(question):
+                yield self._no_match(question)
+                return
+            
             # 构建消息历史
             messages = []
             messages.extend(self.chat_history[-10:])
             messages.append({"role": "user", "content": question})
             
-            # Agent 流式响应（使用 astream_events 获取真正的 token 级流式输出）
+            # Agent 流式响应（使用 astream_events 获取真正的 token 级流式输出；
+            # 工具走异步实现，检索 I/O 不阻塞事件循环）
             full_response = ""
             
             async for event in self.agent.astream_events(
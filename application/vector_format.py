@@ -0,0 +1,171 @@
+"""
+向量存储格式转换
+职责：Matryoshka 维度截断、FLOAT16/BFLOAT16 编解码，以及按智能体存储格式包装 Embedding
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from pymilvus import DataType
+
+
+VECTOR_DATA_TYPES = {
+    "FLOAT32": DataType.FLOAT_VECTOR,
+    "FLOAT16": DataType.FLOAT16_VECTOR,
+    "BFLOAT16": DataType.BFLOAT16_VECTOR,
+}
+
+
+def dtype_name(data_type: DataType) -> Optional[str]:
+    """将 Milvus 向量字段类型转换为存储精度名称"""
+    for name, value in VECTOR_DATA_TYPES.items():
+        if value == data_type:
+            return name
+    return None
+
+
+def truncate_vectors(matrix: np.ndarray, dim: Optional[int]) -> np.ndarray:
+    """
+    Matryoshka 截断：保留前 dim 维并重新做 L2 归一化
+
+    Args:
+        matrix: 向量矩阵 (n, full_dim)
+        dim: 目标维度（为空或不小于原维度时原样返回）
+
+    Returns:
+        np.ndarray: float32 向量矩阵 (n, dim)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if not dim or matrix.ndim != 2 or matrix.shape[1] <= dim:
+        return matrix
+    truncated = matrix[:, :dim]
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    return truncated / np.maximum(norms, 1e-12)
+
+
+def _bfloat16_bytes(matrix: np.ndarray) -> List[bytes]:
+    """float32 -> bfloat16（就近舍入到偶数），每行编码为字节串"""
+    bits = np.ascontiguousarray(matrix, dtype=np.float32).view(np.uint32)
+    rounded = (bits + 0x7FFF + ((bits >> 16) & 1)) >> 16
+    rows = rounded.astype("<u2")
+    return [row.tobytes() for row in rows]
+
+
+def _bfloat16_decode(values: Sequence[bytes]) -> np.ndarray:
+    raw = np.frombuffer(b"".join(values), dtype="<u2").astype(np.uint32) << 16
+    return raw.view(np.float32).reshape(len(values), -1)
+
+
+def decode_vectors(values: Sequence[Any], vector_dtype: str) -> np.ndarray:
+    """
+    将从 Milvus 读出的向量解码为 float32 矩阵
+
+    Args:
+        values: 向量列表（FLOAT32 为浮点列表，FLOAT16/BFLOAT16 为字节串）
+        vector_dtype: 存储精度
+
+    Returns:
+        np.ndarray: float32 矩阵 (n, dim)
+    """
+    if not len(values):
+        return np.zeros((0, 0), dtype=np.float32)
+    # 查询结果中的半精度向量为 [bytes]（单元素列表）
+    if isinstance(values[0], list) and len(values[0]) == 1 and isinstance(values[0][0], (bytes, bytearray)):
+        values = [value[0] for value in values]
+    first = values[0]
+    if isinstance(first, (bytes, bytearray)):
+        if vector_dtype == "BFLOAT16":
+            return _bfloat16_decode(values)
+        return np.frombuffer(b"".join(values), dtype="<f2").astype(np.float32).reshape(len(values), -1)
+    return np.asarray(values, dtype=np.float32)
+
+
+def encode_vectors(matrix: np.ndarray, vector_dtype: str) -> List[Any]:
+    """
+    将 float32 矩阵编码为可写入 Milvus 的向量列表
+
+    Args:
+        matrix: float32 向量矩阵
+        vector_dtype: 目标存储精度
+
+    Returns:
+        list: FLOAT32 为浮点列表，FLOAT16 为 float16 数组，BFLOAT16 为字节串
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if vector_dtype == "FLOAT16":
+        return list(matrix.astype(np.float16))
+    if vector_dtype == "BFLOAT16":
+        return _bfloat16_bytes(matrix)
+    return matrix.tolist()
+
+
+def encode_vector_column(matrix: np.ndarray, vector_dtype: str) -> List[Any]:
+    """
+    将 float32 矩阵编码为按列插入（Collection.insert 传入列列表）时的向量列
+
+    按列插入要求半精度向量为每行一个字节串（按字节长度推算维度），与按行插入不同。
+
+    Args:
+        matrix: float32 向量矩阵
+        vector_dtype: 目标存储精度
+
+    Returns:
+        list: FLOAT32 为浮点列表，FLOAT16/BFLOAT16 为字节串
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if vector_dtype == "FLOAT16":
+        return [row.tobytes() for row in matrix.astype("<f2")]
+    if vector_dtype == "BFLOAT16":
+        return _bfloat16_bytes(matrix)
+    return matrix.tolist()
+
+
+def encode_queries(vectors: List[List[float]], vector_format: Dict[str, Any]) -> List[Any]:
+    """
+    按 Collection 的存储格式准备查询向量
+
+    FLOAT16 字段以 float16 数组检索；BFLOAT16 字段以 float32 检索（服务端转换精度）。
+
+    Args:
+        vectors: 完整维度的查询向量
+        vector_format: {"vector_dtype", "vector_dim"}
+
+    Returns:
+        list: 可直接作为 search 的 data 参数
+    """
+    dim = vector_format.get("vector_dim")
+    if vector_format["vector_dtype"] == "FLOAT32" and (not dim or len(vectors[0]) <= dim):
+        return vectors
+    matrix = truncate_vectors(np.asarray(vectors, dtype=np.float32), dim)
+    if vector_format["vector_dtype"] == "FLOAT16":
+        return list(matrix.astype(np.float16))
+    return matrix.tolist()
+
+
+class FormattedEmbeddings(Embeddings):
+    """按存储格式输出向量的 Embedding 包装器（截断维度 + 精度编码，供入库使用）"""
+
+    def __init__(self, embeddings: Embeddings, vector_format: Dict[str, Any]):
+        """
+        Args:
+            embeddings: 底层 Embedding（输出完整维度的 float 向量）
+            vector_format: {"vector_dtype", "vector_dim"}
+        """
+        self.embeddings = embeddings
+        self.vector_format = vector_format
+
+    def _encode(self, vectors: List[List[float]]) -> List[Any]:
+        matrix = truncate_vectors(np.asarray(vectors, dtype=np.float32), self.vector_format.get("vector_dim"))
+        return encode_vectors(matrix, self.vector_format["vector_dtype"])
+
+    def embed_documents(self, texts: List[str]) -> List[Any]:
+        return self._encode(self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> Any:
+        return self._encode([self.embeddings.embed_query(text)])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[Any]:
+        return self._encode(await self.embeddings.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> Any:
+        return self._encode([await self.embeddings.aembed_query(text)])[0]
@@ -0,0 +1,339 @@
+"""
+列式向量写入
+职责：入库时绕过 LangChain Milvus 包装器——批量向量化为连续的 NumPy 矩阵，按列经 pymilvus
+直接插入（插入与下一批向量化并行）；超大文档在配置了对象存储时写成 Parquet 文件由 Milvus 批量导入
+"""
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from pymilvus import Collection, CollectionSchema, DataType, BulkInsertState, utility
+
+from application.vector_format import truncate_vectors, encode_vectors, encode_vector_column
+from config.milvus import milvus_settings
+
+
+# 导入任务的终态
+BULK_IMPORT_DONE_STATES = (
+    BulkInsertState.ImportCompleted, BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned
+)
+
+
+class BulkImportTimeout(RuntimeError):
+    """等待批量导入超时：任务仍在 Milvus 中执行，之后可能提交数据"""
+
+    def __init__(self, task_id: int, object_name: str):
+        super().__init__(f"批量导入超时（task={task_id}），文档入库失败")
+        self.task_id = task_id
+        self.object_name = object_name
+
+
+def _bulk_modules():
+    """
+    导入批量导入的可选依赖（echo[bulk]）
+
+    Raises:
+        ValueError: 配置了对象存储但未安装依赖
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from minio import Minio
+    except ImportError as e:
+        raise ValueError(
+            f"已配置 MILVUS_BULK_STORAGE_ENDPOINT，但批量导入依赖 {e.name} 未安装，"
+            f"请安装可选依赖 echo[bulk]（pip install -e '.[bulk]'）或清空该配置"
+        ) from e
+    return pa, pq, Minio
+
+
+def _arrow_type(pa, field):
+    """Milvus 字段类型对应的 Arrow 类型（各批次的 Parquet 行组须使用同一 schema）"""
+    types = {
+        DataType.BOOL: pa.bool_(),
+        DataType.INT8: pa.int8(),
+        DataType.INT16: pa.int16(),
+        DataType.INT32: pa.int32(),
+        DataType.INT64: pa.int64(),
+        DataType.FLOAT: pa.float32(),
+        DataType.DOUBLE: pa.float64(),
+        DataType.VARCHAR: pa.string(),
+        DataType.JSON: pa.string(),
+        DataType.FLOAT_VECTOR: pa.list_(pa.float32())
+    }
+    if field.dtype not in types:
+        raise ValueError(f"批量导入不支持的字段类型: {field.name} ({field.dtype.name})")
+    return types[field.dtype]
+
+
+class ColumnarVectorWriter:
+    """列式向量写入器"""
+
+    def __init__(self, milvus_store, batch_size: int = 1000):
+        """
+        初始化写入器
+
+        Args:
+            milvus_store: Milvus 服务实例（提供连接池、智能体的 Embedding 后端与 Collection 解析）
+            batch_size: 每批向量化并插入的文本块数量
+        """
+        self.milvus_store = milvus_store
+        self.batch_size = batch_size
+
+    @staticmethod
+    def _insert_fields(schema: CollectionSchema) -> List:
+        """需要写入的字段（排除自增主键与 BM25 函数输出字段），顺序即按列插入的列顺序"""
+        return [
+            field for field in schema.fields
+            if not (field.is_primary and field.auto_id) and not getattr(field, "is_function_output", False)
+        ]
+
+    def _embed(self, agent_name: str, texts: List[str], vector_format: dict) -> np.ndarray:
+        """
+        向量化（经持久化缓存），返回按 Collection 维度截断后的连续 float32 矩阵
+
+        Raises:
+            ValueError: 模型输出维度小于 Collection 维度（Collection 由其他 Embedding 模型创建）
+        """
+        backend = self.milvus_store.embedding_backend_for(agent_name)
+        matrix = np.asarray(backend.document_embeddings.embed_documents(texts), dtype=np.float32)
+        if matrix.shape[1] < vector_format["vector_dim"]:
+            raise ValueError(
+                f"Embedding 模型 {backend.model} 的向量维度（{matrix.shape[1]}）小于 Collection 的维度"
+                f"（{vector_format['vector_dim']}）"
+            )
+        return truncate_vectors(matrix, vector_format["vector_dim"])
+
+    def _insert(self, collection_name: str, schema: CollectionSchema, documents: List[Document],
+                matrix: np.ndarray, vector_format: dict) -> List:
+        """插入一批：静态 schema 按列插入；含动态字段（共享布局）时按行插入"""
+        pool = self.milvus_store.pool
+        if schema.enable_dynamic_field:
+            vectors = encode_vectors(matrix, vector_format["vector_dtype"])
+            rows = [
+                {**doc.metadata, "text": doc.page_content, "vector": vector}
+                for doc, vector in zip(documents, vectors)
+            ]
+            with pool.connection() as conn:
+                return list(conn.client.insert(collection_name, rows, timeout=pool.call_timeout)["ids"])
+
+        columns = []
+        for field in self._insert_fields(schema):
+            if field.name == "text":
+                columns.append([doc.page_content for doc in documents])
+            elif field.name == "vector":
+                columns.append(encode_vector_column(matrix, vector_format["vector_dtype"]))
+            else:
+                columns.append([doc.metadata.get(field.name) for doc in documents])
+        with pool.connection() as conn:
+            result = Collection(collection_name, using=conn.alias).insert(columns, timeout=pool.call_timeout)
+        return list(result.primary_keys)
+
+    def insert_batches(
+        self,
+        agent_name: str,
+        documents: List[Document]
+    ) -> Iterator[Tuple[List[Document], Optional[List], Optional[Exception]]]:
+        """按 batch_size 分批向量化并插入（语义同 insert_stream）"""
+        return self.insert_stream(
+            agent_name, (documents[i:i + self.batch_size] for i in range(0, len(documents), self.batch_size))
+        )
+
+    def insert_stream(
+        self,
+        agent_name: str,
+        batches: Iterable[List[Document]]
+    ) -> Iterator[Tuple[List[Document], Optional[List], Optional[Exception]]]:
+        """
+        逐批向量化并插入（第 k 批插入时同时向量化第 k+1 批，耗时由向量化吞吐决定）
+
+        批次按需从 batches 中读取，可以是上游仍在解析、分割的数据流；上游抛出的异常直接向上传播。
+        Collection 尚不存在时，第一批经 LangChain 包装器写入以按元数据创建 schema 与索引。
+
+        Args:
+            agent_name: 智能体名称
+            batches: 文本块批次
+
+        Yields:
+            (batch, ids, error): 每批的文本块、插入的主键（失败为 None）与异常
+        """
+        batches = iter(batches)
+        if not self.milvus_store.collection_exists(agent_name):
+            batch = next(batches, None)
+            if batch is None:
+                return
+            try:
+                yield batch, self.milvus_store.add_documents(agent_name, batch), None
+            except Exception as e:
+                yield batch, None, e
+                return
+
+        collection_name, schema, vector_format = None, None, None
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"vector-insert-{agent_name}") as executor:
+            pending = None
+            for batch in batches:
+                if schema is None:
+                    collection_name = self.milvus_store.get_collection_name(agent_name)  # 别名同样可写入
+                    schema = Collection(collection_name, using=self.milvus_store.pool.alias()).schema
+                    vector_format = self.milvus_store._vector_format_of(schema)
+                future, error = None, None
+                try:
+                    matrix = self._embed(agent_name, [doc.page_content for doc in batch], vector_format)
+                    future = executor.submit(self._insert, collection_name, schema, batch, matrix, vector_format)
+                except Exception as e:
+                    error = e
+                if pending is not None:
+                    yield self._result(*pending)
+                pending = (batch, future, error)
+            if pending is not None:
+                yield self._result(*pending)
+
+    @staticmethod
+    def _result(batch: List[Document], future, error: Optional[Exception]):
+        if future is None:
+            return batch, None, error
+        try:
+            return batch, future.result(), None
+        except Exception as e:
+            return batch, None, e
+
+    # ==================== 批量导入 ====================
+
+    def bulk_import_enabled(self, agent_name: str) -> bool:
+        """
+        是否可走批量导入：配置了对象存储，Collection 已存在（导入不能创建 schema），
+        且为静态 schema 的 FLOAT32 向量 Collection
+
+        文本块数是否达到 bulk_insert_min_rows 由调用方判断。
+
+        Raises:
+            ValueError: 配置了对象存储但未安装批量导入依赖
+        """
+        if not milvus_settings.bulk_storage_endpoint:
+            return False
+        _bulk_modules()
+        if not self.milvus_store.collection_exists(agent_name):
+            return False
+        schema = Collection(self.milvus_store.get_collection_name(agent_name), using=self.milvus_store.pool.alias()).schema
+        return not schema.enable_dynamic_field and self.milvus_store._vector_format_of(schema)["vector_dtype"] == "FLOAT32"
+
+    def bulk_import(self, agent_name: str, batches: Iterable[List[Document]]) -> int:
+        """
+        逐批向量化、追加写入 Parquet 文件（每批一个行组），上传到 Milvus 的对象存储后由 Milvus 批量导入
+
+        内存占用以批为界（整个文档只落在本地临时文件中）。导入全部成功或整体失败，
+        失败时不回退到按列插入（文本块已被消费），由调用方按 file_id 清理后标记失败。
+        导入不返回与行对应的主键，删除时按 file_id 过滤。
+
+        Args:
+            agent_name: 智能体名称
+            batches: 文本块批次（可以是上游仍在解析、分割的数据流）
+
+        Returns:
+            int: 导入的行数
+
+        Raises:
+            ValueError: 未安装批量导入依赖，或 Collection 不支持批量导入（动态字段或半精度向量）
+            BulkImportTimeout: 等待导入超时（任务仍在执行，由调用方过滤并在任务结束后清理迟到的行）
+            RuntimeError: 导入失败
+        """
+        pa, pq, Minio = _bulk_modules()
+
+        pool = self.milvus_store.pool
+        using = pool.alias()
+        collection_name = self.milvus_store.resolve_collection(agent_name)
+        schema = Collection(collection_name, using=using).schema
+        vector_format = self.milvus_store._vector_format_of(schema)
+        if schema.enable_dynamic_field or vector_format["vector_dtype"] != "FLOAT32":
+            raise ValueError("批量导入仅支持静态 schema 的 FLOAT32 向量 Collection")
+        fields = self._insert_fields(schema)
+        arrow_schema = pa.schema([(field.name, _arrow_type(pa, field)) for field in fields])
+
+        object_name = f"atlas-import/{collection_name}/{uuid.uuid4().hex}.parquet"
+        fd, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+        storage = self._storage(Minio)
+        rows = 0
+        try:
+            # 1. 逐批向量化并按列写入一个行组（向量列直接引用矩阵内存，不逐行转换）
+            with pq.ParquetWriter(path, arrow_schema) as writer:
+                for documents in batches:
+                    matrix = self._embed(agent_name, [doc.page_content for doc in documents], vector_format)
+                    columns = []
+                    for field in fields:
+                        if field.name == "text":
+                            columns.append(pa.array([doc.page_content for doc in documents], pa.string()))
+                        elif field.name == "vector":
+                            offsets = np.arange(0, matrix.size + 1, matrix.shape[1], dtype=np.int32)
+                            columns.append(pa.ListArray.from_arrays(pa.array(offsets), pa.array(matrix.ravel())))
+                        else:
+                            values = [doc.metadata.get(field.name) for doc in documents]
+                            if field.dtype == DataType.JSON:
+                                values = [json.dumps(value, ensure_ascii=False) for value in values]
+                            columns.append(pa.array(values, arrow_schema.field(field.name).type))
+                    writer.write_table(pa.Table.from_arrays(columns, schema=arrow_schema))
+                    rows += len(documents)
+            if rows == 0:
+                return 0
+            # 2. 上传到 Milvus 所用的存储桶
+            storage.fput_object(milvus_settings.bulk_storage_bucket, object_name, path)
+        finally:
+            os.remove(path)
+
+        # 3. 提交导入任务并等待完成（超时时保留上传的文件，导入任务可能仍在执行）
+        task_id = utility.do_bulk_insert(collection_name, files=[object_name], using=using)
+        print(f"📦 已提交批量导入: {collection_name} ({rows} 行, task={task_id})")
+        state = self.wait_bulk_import(task_id, milvus_settings.bulk_insert_timeout)
+        if state is None:
+            # 不回退到按列插入：任务仍可能完成，回退会重复写入
+            raise BulkImportTimeout(task_id, object_name)
+
+        self.remove_import_file(object_name, storage)
+        if state.state != BulkInsertState.ImportCompleted:
+            raise RuntimeError(f"批量导入失败: {state.failed_reason}")
+        return state.row_count
+
+    @staticmethod
+    def _storage(Minio):
+        return Minio(
+            milvus_settings.bulk_storage_endpoint,
+            access_key=milvus_settings.bulk_storage_access_key,
+            secret_key=milvus_settings.bulk_storage_secret_key,
+            secure=milvus_settings.bulk_storage_secure
+        )
+
+    def wait_bulk_import(self, task_id: int, timeout: Optional[float] = None):
+        """
+        轮询导入任务直到终态
+
+        Args:
+            task_id: 导入任务 ID
+            timeout: 最长等待时间（秒，为空一直等待）
+
+        Returns:
+            BulkInsertState: 终态；超时返回 None
+        """
+        pool = self.milvus_store.pool
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = utility.get_bulk_insert_state(task_id, timeout=pool.call_timeout, using=pool.alias())
+            if state.state in BULK_IMPORT_DONE_STATES:
+                return state
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(1)
+
+    def remove_import_file(self, object_name: str, storage=None):
+        """删除已导入（或已放弃）的 Parquet 文件"""
+        try:
+            if storage is None:
+                storage = self._storage(_bulk_modules()[2])
+            storage.remove_object(milvus_settings.bulk_storage_bucket, object_name)
+        except Exception as e:
+            print(f"⚠️ 清理导入文件失败: {e}")
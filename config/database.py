@@ -35,9 +35,35 @@ def init_db():
     """初始化数据库表"""
     from domain.entities import Base
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns(Base.metadata)
     print("✅ 数据库表已初始化")
 
 
+def _add_missing_columns(metadata):
+    """
+    为已存在的表补充新增的可空列
+    
+    create_all 只会创建缺失的表，不会修改已有表结构；
+    这里仅处理"新增可空列"这一种向后兼容的变更。
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"  已新增列: {table.name}.{column.name}")
+
+
 def get_db() -> Generator[Session, None, None]:
     """获取数据库会话（FastAPI 依赖注入）"""
     db = SessionLocal()
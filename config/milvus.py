@@ -2,7 +2,9 @@
 Milvus 向量数据库配置
 """
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, Dict, Any
+import copy
+import math
 import os
 
 
@@ -13,11 +15,62 @@ class MilvusSettings(BaseSettings):
     user: Optional[str] = None
     password: Optional[str] = None
     db_name: str = "default"
-    
+
+    # 连接池：多个连接别名（独立 gRPC 通道）分担并发检索与后台入库
+    pool_size: int = 4
+    connect_timeout: float = 5.0         # 建立连接 / 健康检查超时（秒）
+    call_timeout: float = 10.0           # 检索、写入、删除、统计单次调用的截止时间（秒）
+    health_check_interval: float = 15.0  # 后台健康检查间隔（秒）
+    reconnect_max_backoff: float = 60.0  # 重连指数退避的最大间隔（秒）
+
     # Collection 配置
+    # 智能体未指定索引配置时的默认值；AUTO（按规模自动选择）需显式启用，
+    # 已有 Collection 均按 IVF_FLAT 创建，默认值不变以免存量数据被自动重建
     index_type: str = "IVF_FLAT"
     metric_type: str = "L2"
-    nlist: int = 128
+    nlist: int = 128          # IVF_FLAT 默认 nlist
+    
+    # AUTO 索引选择阈值（按向量数量）
+    auto_flat_max_entities: int = 20_000       # 少于该数量使用 FLAT（精确检索）
+    auto_hnsw_max_entities: int = 1_000_000    # 少于该数量使用 HNSW，否则使用 IVF_PQ
+    
+    # 向量存储格式（智能体未单独配置时的默认值）
+    # vector_dtype：FLOAT32 / FLOAT16 / BFLOAT16，半精度存储内存减半
+    # vector_dim：为空使用 Embedding 模型的完整维度；设置后截断到该维度并重新归一化
+    # （Matryoshka 表示，要求模型支持，如 text-embedding-3 系列、text-embedding-v3）
+    vector_dtype: str = "FLOAT32"
+    vector_dim: Optional[int] = None
+    
+    # 存储布局：collection（每个智能体一个 Collection）/ shared（所有智能体共用一个 Collection，
+    # 以 agent_name 作为 partition key 隔离，适合大量小型智能体）
+    storage_layout: str = "collection"
+    shared_collection: str = "atlas_knowledge"
+    shared_num_partitions: int = 64
+    
+    # 混合检索：稠密向量 + BM25 稀疏向量（Milvus 内置 BM25 函数，入库时由服务端分词计算），
+    # 两路结果以 RRF 融合；需要 Milvus 2.5+
+    hybrid_search: bool = True
+    bm25_analyzer: str = "chinese"  # Milvus 内置分析器（chinese 基于 jieba 分词，兼容中英文混排）
+    rrf_k: int = 60
+    
+    # 入库写入：向量化后按列直接插入（绕过 LangChain 包装器），每批行数
+    insert_batch_size: int = 1000
+    # 超大文档批量导入（bulk insert）：文本块数不少于阈值且配置了 Milvus 所用的对象存储时，
+    # 写成 Parquet 文件上传后由 Milvus 导入（需安装可选依赖 echo[bulk]），否则按列插入
+    bulk_insert_min_rows: int = 5000
+    bulk_storage_endpoint: Optional[str] = None  # MinIO / S3 地址，如 minio:9000，为空不启用
+    bulk_storage_bucket: str = "a-bucket"        # Milvus 配置的存储桶（minio.bucketName）
+    bulk_storage_access_key: Optional[str] = None
+    bulk_storage_secret_key: Optional[str] = None
+    bulk_storage_secure: bool = False
+    bulk_insert_timeout: float = 600.0           # 等待导入完成的最长时间（秒）
+    
+    # 一致性级别（按操作类别，智能体可单独覆盖）：Strong / Session / Bounded / Eventually
+    # 对话检索允许有界延迟；管理端统计用 Session（本进程刚写入的数据立即可见）；
+    # 入库后校验（副本同步、一致性校验）需要看到所有进程的写入，使用 Strong
+    search_consistency: str = "Bounded"
+    stats_consistency: str = "Session"
+    verify_consistency: str = "Strong"
     
     class Config:
         env_prefix = "MILVUS_"
@@ -26,6 +79,257 @@ class MilvusSettings(BaseSettings):
         extra = "ignore"  # 忽略额外字段
 
 
+# 存储布局
+LAYOUT_COLLECTION = "collection"
+LAYOUT_SHARED = "shared"
+
+# 共享布局下的分区键字段（即文档元数据中的 agent_name）
+PARTITION_KEY_FIELD = "agent_name"
+
+# 混合检索的稀疏向量字段（由 text 字段经 BM25 函数生成）
+SPARSE_FIELD = "sparse"
+BM25_INDEX_PARAMS: Dict[str, Any] = {
+    "metric_type": "BM25",
+    "index_type": "SPARSE_INVERTED_INDEX",
+    "params": {}
+}
+BM25_SEARCH_PARAMS: Dict[str, Any] = {
+    "metric_type": "BM25",
+    "params": {}
+}
+
+# file_id 标量索引（按文件删除、副本同步的过滤条件）
+FILE_ID_FIELD = "file_id"
+FILE_ID_INDEX_NAME = "file_id_index"
+FILE_ID_INDEX_PARAMS: Dict[str, Any] = {"index_type": "INVERTED"}
+
+# 一致性级别与操作类别
+CONSISTENCY_LEVELS = ("Strong", "Session", "Bounded", "Eventually")
+OP_SEARCH = "search"   # 对话检索
+OP_STATS = "stats"     # 管理端统计
+OP_VERIFY = "verify"   # 入库后校验
+CONSISTENCY_OPERATIONS = (OP_SEARCH, OP_STATS, OP_VERIFY)
+
+# 向量存储精度
+VECTOR_DTYPES = ("FLOAT32", "FLOAT16", "BFLOAT16")
+
+# 索引类型：构建参数与检索参数的默认值
+AUTO_INDEX = "AUTO"
+# AUTO 模式按数据规模依次选择的索引类型
+AUTO_INDEX_TYPES = ("FLAT", "HNSW", "IVF_PQ")
+
+INDEX_PROFILES: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "FLAT": {
+        "build": {},
+        "search": {},
+    },
+    "IVF_FLAT": {
+        "build": {"nlist": 128},  # 实际默认值取 milvus_settings.nlist
+        "search": {"nprobe": 16},
+    },
+    "IVF_PQ": {
+        "build": {"nlist": 1024, "m": 16, "nbits": 8},
+        "search": {"nprobe": 32},
+    },
+    "HNSW": {
+        "build": {"M": 16, "efConstruction": 200},
+        "search": {"ef": 64},
+    },
+    "SCANN": {
+        "build": {"nlist": 1024, "with_raw_data": True},
+        "search": {"nprobe": 32, "reorder_k": 64},
+    },
+    "DISKANN": {
+        "build": {},
+        "search": {"search_list": 64},
+    },
+    # 量化索引：以量化向量完成第一轮检索，再用保留的高精度数据重排（refine）
+    "IVF_SQ8": {
+        "build": {"nlist": 1024},
+        "search": {"nprobe": 32},
+    },
+    "HNSW_SQ": {
+        "build": {"M": 16, "efConstruction": 200, "sq_type": "SQ8", "refine": True, "refine_type": "FP32"},
+        "search": {"ef": 64, "refine_k": 2},
+    },
+    "IVF_RABITQ": {  # 1-bit 二值量化，内存约为 FLOAT32 的 1/32（不含重排数据）
+        "build": {"nlist": 1024, "refine": True, "refine_type": "SQ8"},
+        "search": {"nprobe": 32, "rbq_query_bits": 0, "refine_k": 2},
+    },
+}
+
+# 仅支持 FLOAT32 向量字段的索引类型
+FLOAT32_ONLY_INDEXES = {"IVF_RABITQ"}
+
+
+def select_auto_index_type(num_entities: int) -> str:
+    """根据向量数量选择索引类型"""
+    flat, hnsw, ivf_pq = AUTO_INDEX_TYPES
+    if num_entities < milvus_settings.auto_flat_max_entities:
+        return flat
+    if num_entities < milvus_settings.auto_hnsw_max_entities:
+        return hnsw
+    return ivf_pq
+
+
+def build_index_profile(
+    index_type: Optional[str] = None,
+    num_entities: int = 0,
+    index_params: Optional[Dict[str, Any]] = None,
+    search_params: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    生成索引配置（构建参数 + 检索参数）
+    
+    Args:
+        index_type: 索引类型（AUTO 表示按向量数量自动选择，None 使用全局默认）
+        num_entities: 当前向量数量（AUTO 模式与 IVF 类索引的 nlist 调优使用）
+        index_params: 覆盖默认构建参数
+        search_params: 覆盖默认检索参数
+        
+    Returns:
+        dict: {"index_type", "auto", "index_params", "search_params"}，
+              其中 index_params / search_params 可直接传给 Milvus
+    """
+    index_type = index_type or milvus_settings.index_type
+    auto = index_type.upper() == AUTO_INDEX
+    resolved_type = select_auto_index_type(num_entities) if auto else index_type.upper()
+    if resolved_type not in INDEX_PROFILES:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+    
+    defaults = INDEX_PROFILES[resolved_type]
+    build = copy.deepcopy(defaults["build"])
+    if resolved_type == "IVF_FLAT":
+        build["nlist"] = milvus_settings.nlist
+    
+    # AUTO 模式下 IVF 类索引按数据规模调优：nlist ≈ 4 * sqrt(n)
+    if auto and "nlist" in build and num_entities > 0:
+        build["nlist"] = int(min(65536, max(128, 4 * math.sqrt(num_entities))))
+    build.update(index_params or {})
+    
+    return {
+        "index_type": resolved_type,
+        "auto": auto,
+        "index_params": {
+            "metric_type": milvus_settings.metric_type,
+            "index_type": resolved_type,
+            "params": build
+        },
+        "search_params": build_search_params(resolved_type, build, search_params)
+    }
+
+
+def build_vector_format(
+    vector_dtype: Optional[str] = None,
+    vector_dim: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    生成向量存储格式
+    
+    Args:
+        vector_dtype: 存储精度（FLOAT32/FLOAT16/BFLOAT16，None 使用全局默认）
+        vector_dim: 截断维度（None 使用全局默认，仍为空则保留完整维度）
+        
+    Returns:
+        dict: {"vector_dtype", "vector_dim"}
+    """
+    vector_dtype = (vector_dtype or milvus_settings.vector_dtype).upper()
+    if vector_dtype not in VECTOR_DTYPES:
+        raise ValueError(f"不支持的向量精度: {vector_dtype}")
+    vector_dim = vector_dim or milvus_settings.vector_dim
+    if vector_dim is not None and vector_dim < 32:
+        raise ValueError(f"向量维度过小: {vector_dim}")
+    return {"vector_dtype": vector_dtype, "vector_dim": vector_dim}
+
+
+def build_consistency_policy(overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    生成各操作类别的一致性级别
+    
+    Args:
+        overrides: 覆盖全局默认，如 {"search": "Strong"}
+        
+    Returns:
+        dict: {"search", "stats", "verify"} -> 一致性级别
+    """
+    policy = {
+        OP_SEARCH: milvus_settings.search_consistency,
+        OP_STATS: milvus_settings.stats_consistency,
+        OP_VERIFY: milvus_settings.verify_consistency,
+    }
+    for operation, level in (overrides or {}).items():
+        if operation not in CONSISTENCY_OPERATIONS:
+            raise ValueError(f"不支持的操作类别: {operation}")
+        policy[operation] = level
+    
+    levels = {level.lower(): level for level in CONSISTENCY_LEVELS}
+    for operation, level in policy.items():
+        if not level or level.lower() not in levels:
+            raise ValueError(f"不支持的一致性级别: {level}")
+        policy[operation] = levels[level.lower()]
+    return policy
+
+
+def check_index_vector_format(index_type: str, vector_format: Dict[str, Any]):
+    """校验索引类型与向量精度是否兼容（不兼容时抛出 ValueError）"""
+    if index_type in FLOAT32_ONLY_INDEXES and vector_format["vector_dtype"] != "FLOAT32":
+        raise ValueError(f"{index_type} 索引仅支持 FLOAT32 向量")
+
+
+def build_search_params(
+    index_type: str,
+    build_params: Optional[Dict[str, Any]] = None,
+    overrides: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    根据索引类型及其构建参数生成检索参数
+    
+    IVF 类索引的 nprobe 随 nlist 放大（≈ nlist / 32），保证召回率不随数据规模下降。
+    """
+    search = copy.deepcopy(INDEX_PROFILES.get(index_type, {}).get("search", {}))
+    nlist = (build_params or {}).get("nlist")
+    if nlist and "nprobe" in search:
+        search["nprobe"] = max(search["nprobe"], int(nlist) // 32)
+    search.update(overrides or {})
+    return {
+        "metric_type": milvus_settings.metric_type,
+        "params": search
+    }
+
+
+def similarity_from_distance(distance, metric_type: Optional[str] = None):
+    """
+    将 Milvus 返回的距离/分数换算为统一的相似度（越大越相似，归一化向量下即余弦相似度）
+    
+    L2 返回平方欧氏距离，单位向量满足 d² = 2 - 2·cos，故 cos = 1 - d² / 2；
+    IP / COSINE 直接返回内积或余弦。支持标量与 numpy 数组。
+    """
+    metric_type = (metric_type or milvus_settings.metric_type).upper()
+    if metric_type == "L2":
+        return 1 - distance / 2
+    return distance
+
+
+def distance_from_similarity(similarity, metric_type: Optional[str] = None):
+    """similarity_from_distance 的逆运算（由相似度换算回 Milvus 的距离/分数）"""
+    metric_type = (metric_type or milvus_settings.metric_type).upper()
+    if metric_type == "L2":
+        return 2 * (1 - similarity)
+    return similarity
+
+
+def similarity_radius(threshold: float, metric_type: Optional[str] = None) -> float:
+    """
+    将相似度阈值换算为范围检索的 radius
+    
+    L2 返回距离小于 radius 的结果，IP / COSINE 返回分数大于 radius 的结果。
+    """
+    metric_type = (metric_type or milvus_settings.metric_type).upper()
+    if metric_type == "L2":
+        return 2 * (1 - threshold)
+    return threshold
+
+
 def get_milvus_settings() -> MilvusSettings:
     """获取 Milvus 配置"""
     from config.settings import settings
@@ -25,13 +25,58 @@ class Settings:
     OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
     CHAT_MODEL: str = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_MAX_TOKENS: int = int(os.getenv("EMBEDDING_MAX_TOKENS", "8191"))  # 远程模型单条输入 token 上限
+    
+    # Embedding 后端（智能体可单独配置）：openai 远程 API / onnx 本地 CPU 推理
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "openai")
+    # 本地 ONNX 模型（如 multilingual-e5-small 的量化导出）：目录下需有 tokenizer.json 与 ONNX 文件
+    ONNX_EMBEDDING_MODEL_DIR: str = os.getenv("ONNX_EMBEDDING_MODEL_DIR", "")
+    ONNX_EMBEDDING_WORKERS: int = int(os.getenv("ONNX_EMBEDDING_WORKERS", "2"))  # 并行推理的批次数
+    ONNX_EMBEDDING_MAX_BATCH_SIZE: int = int(os.getenv("ONNX_EMBEDDING_MAX_BATCH_SIZE", "32"))
+    ONNX_EMBEDDING_MAX_BATCH_TOKENS: int = int(os.getenv("ONNX_EMBEDDING_MAX_BATCH_TOKENS", "8192"))
+    ONNX_EMBEDDING_MAX_LENGTH: int = int(os.getenv("ONNX_EMBEDDING_MAX_LENGTH", "512"))
+    ONNX_EMBEDDING_POOLING: str = os.getenv("ONNX_EMBEDDING_POOLING", "mean")  # mean / cls
+    ONNX_EMBEDDING_QUERY_PREFIX: str = os.getenv("ONNX_EMBEDDING_QUERY_PREFIX", "query: ")
+    ONNX_EMBEDDING_DOCUMENT_PREFIX: str = os.getenv("ONNX_EMBEDDING_DOCUMENT_PREFIX", "passage: ")
+    
+    # 入库向量化调度（进程内所有智能体共享）：并发请求数、服务商限速与自适应批大小
+    EMBEDDING_CONCURRENCY: int = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    EMBEDDING_RPM_LIMIT: int = int(os.getenv("EMBEDDING_RPM_LIMIT", "0"))  # 每分钟请求数，0 不限
+    EMBEDDING_TPM_LIMIT: int = int(os.getenv("EMBEDDING_TPM_LIMIT", "0"))  # 每分钟 token 数，0 不限
+    EMBEDDING_MIN_BATCH_SIZE: int = int(os.getenv("EMBEDDING_MIN_BATCH_SIZE", "1"))
+    EMBEDDING_MAX_BATCH_SIZE: int = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "10"))  # 服务商单次请求条数上限
+    EMBEDDING_TARGET_LATENCY: float = float(os.getenv("EMBEDDING_TARGET_LATENCY", "5"))  # 秒
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+    
+    # 文本分块：按 Embedding 模型的 token 数切分（不超过模型输入上限，入库文本不截断）
+    CHUNK_TOKENS: int = int(os.getenv("CHUNK_TOKENS", "512"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+    
+    # 流式入库：解析/分割领先向量化与插入的最大批数（内存占用约为 队列深度 × MILVUS_INSERT_BATCH_SIZE 个文本块）
+    INGEST_QUEUE_DEPTH: int = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
+    
+    # 查询向量缓存配置
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+    QUERY_EMBEDDING_CACHE_TTL: int = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))  # 秒
+    
+    # 文本块向量持久化缓存（入库时复用，可多进程共享）
+    CHUNK_EMBEDDING_CACHE_ENABLED: bool = os.getenv("CHUNK_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    CHUNK_EMBEDDING_CACHE_PATH: str = os.getenv(
+        "CHUNK_EMBEDDING_CACHE_PATH",
+        os.path.join(os.getenv("METADATA_DIR", "metadata_store"), "embedding_cache.db")
+    )
     
     # 文件配置
     UPLOAD_DIR: str = "uploads"
     METADATA_DIR: str = os.getenv("METADATA_DIR", "metadata_store")
-    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE_MB", "300")) * 1024 * 1024
     ALLOWED_EXTENSIONS: list = [".pdf", ".txt", ".md"]
     
+    # PDF 解析：按页范围分发到进程池并行提取（页数少于阈值时在当前进程内提取）
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", "0"))  # 0 表示 CPU 核数，1 表示不使用进程池
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+    
     # 数据库配置
     DATABASE_URL: str = os.getenv(
         "DATABASE_URL",
@@ -42,6 +87,29 @@ class Settings:
     MILVUS_HOST: str = os.getenv("MILVUS_HOST", "117.72.204.201")
     MILVUS_PORT: int = int(os.getenv("MILVUS_PORT", "19530"))
     
+    # 知识库统计与 Milvus 对账间隔（秒）
+    KB_STATS_RECONCILE_INTERVAL: int = int(os.getenv("KB_STATS_RECONCILE_INTERVAL", "60"))
+    
+    # Collection 加载管理：空闲超过该时长（秒）的 Collection 将被释放，0 表示不释放
+    MILVUS_IDLE_RELEASE_SECONDS: int = int(os.getenv("MILVUS_IDLE_RELEASE_SECONDS", "1800"))
+    MILVUS_IDLE_CHECK_INTERVAL: int = int(os.getenv("MILVUS_IDLE_CHECK_INTERVAL", "60"))
+
+    # 进程内向量副本：小规模知识库（向量数不超过阈值）在进程内做精确检索，超过阈值回退到 Milvus
+    # 混合检索（BM25）的知识库始终走 Milvus
+    LOCAL_REPLICA_ENABLED: bool = os.getenv("LOCAL_REPLICA_ENABLED", "false").lower() == "true"
+    LOCAL_REPLICA_MAX_VECTORS: int = int(os.getenv("LOCAL_REPLICA_MAX_VECTORS", "20000"))
+    LOCAL_REPLICA_DTYPE: str = os.getenv("LOCAL_REPLICA_DTYPE", "float32")  # float32 / float16
+    LOCAL_REPLICA_MMAP_DIR: str = os.getenv("LOCAL_REPLICA_MMAP_DIR", "")  # 为空则副本常驻内存
+
+    # 相似度阈值（归一化到余弦相似度，智能体可单独配置）：没有文本块达到阈值时直接返回预设回复，不调用 LLM
+    # 0 表示不启用
+    SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0"))
+    NO_MATCH_RESPONSE: str = os.getenv("NO_MATCH_RESPONSE", "抱歉，知识库中暂无相关信息。")
+
+    # 软删除：删除文档/清空知识库只做标记并立即返回，后台按间隔批量清除 Milvus 中的向量
+    VECTOR_PURGE_INTERVAL: int = int(os.getenv("VECTOR_PURGE_INTERVAL", "5"))  # 秒
+    VECTOR_PURGE_BATCH_SIZE: int = int(os.getenv("VECTOR_PURGE_BATCH_SIZE", "200"))  # 每批清除的文档数
+
     # JWT 认证配置
     JWT_SECRET_KEY: str = os.getenv(
         "JWT_SECRET_KEY",
@@ -4,7 +4,7 @@ ORM 数据实体
 """
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Integer, Text, ForeignKey, Boolean
+from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Integer, Text, ForeignKey, Boolean, JSON, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -26,6 +26,16 @@ class DocumentStatus(str, Enum):
     FAILED = "failed"          # 失败
 
 
+class IndexRebuildStatus(str, Enum):
+    """索引重建状态"""
+    PENDING = "pending"      # 等待执行
+    COPYING = "copying"      # 复制向量到新 Collection
+    INDEXING = "indexing"    # 构建索引并加载
+    SWAPPING = "swapping"    # 切换别名
+    COMPLETED = "completed"  # 完成
+    FAILED = "failed"        # 失败
+
+
 class AgentType(str, Enum):
     """智能体类型"""
     GENERAL = "general"      # 通用
@@ -53,6 +63,23 @@ class Agent(Base):
     # 知识库配置
     milvus_collection = Column(String(200))  # Milvus Collection 名称
     embedding_model = Column(String(100))
+    embedding_provider = Column(String(20))  # openai / onnx（为空使用全局默认，知识库非空时不可切换）
+    
+    # 向量索引配置（新建智能体默认 AUTO，按向量规模自动选择并调优；为空使用全局默认）
+    index_type = Column(String(30), default="AUTO")  # AUTO/FLAT/HNSW/IVF_FLAT/IVF_PQ/SCANN/DISKANN/IVF_SQ8/HNSW_SQ/IVF_RABITQ
+    index_params = Column(JSON)   # 覆盖默认构建参数，如 {"M": 32}
+    search_params = Column(JSON)  # 覆盖默认检索参数，如 {"ef": 128} / {"nprobe": 32}
+    
+    # 向量存储格式（为空时使用全局默认；变更后需在线重建迁移已有数据）
+    vector_dtype = Column(String(20))  # FLOAT32/FLOAT16/BFLOAT16
+    vector_dim = Column(Integer)       # Matryoshka 截断维度，为空保留模型完整维度
+    
+    # 一致性级别（覆盖全局默认），如 {"search": "Bounded", "stats": "Session", "verify": "Strong"}
+    consistency_levels = Column(JSON)
+    
+    # 相似度阈值与未命中时的预设回复（为空时使用全局默认）
+    similarity_threshold = Column(Float)  # 归一化相似度（余弦），0 表示不启用
+    no_match_response = Column(Text)
     
     # 元数据
     description = Column(Text)
@@ -62,6 +89,7 @@ class Agent(Base):
     # 关联关系
     conversations = relationship("Conversation", back_populates="agent")
     documents = relationship("Document", back_populates="agent", cascade="all, delete-orphan")
+    index_rebuilds = relationship("IndexRebuild", back_populates="agent", cascade="all, delete-orphan")
 
 
 class Document(Base):
@@ -82,6 +110,13 @@ class Document(Base):
     processing_progress = Column(Integer, default=0)  # 0-100
     error_message = Column(Text)
     
+    # 向量主键（删除时按主键删除；Collection 重建或迁移后主键失效，回退到按 file_id 删除）
+    vector_ids = Column(JSON)                 # 文本块在 Milvus 中的主键列表
+    vector_collection = Column(String(200))   # 写入时的物理 Collection
+    
+    # 软删除：非空表示已删除、等待后台清除向量（检索时按 file_id 排除）
+    deleted_at = Column(DateTime)
+    
     # 元数据
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     processed_at = Column(DateTime)  # 处理完成时间
@@ -90,6 +125,37 @@ class Document(Base):
     agent = relationship("Agent", back_populates="documents")
 
 
+class IndexRebuild(Base):
+    """索引重建记录（在线重建：新 Collection 构建完成后切换别名）"""
+    __tablename__ = "index_rebuilds"
+    
+    id = Column(String(36), primary_key=True)
+    agent_id = Column(String(36), ForeignKey("agents.id", ondelete="CASCADE"), nullable=False, index=True)
+    
+    # 重建配置
+    source_collection = Column(String(200))  # 重建前提供服务的物理 Collection
+    target_collection = Column(String(200))  # 新建的物理 Collection
+    index_type = Column(String(30))
+    index_params = Column(JSON)
+    search_params = Column(JSON)
+    vector_dtype = Column(String(20))
+    vector_dim = Column(Integer)
+    
+    # 进度
+    status = Column(SQLEnum(IndexRebuildStatus), default=IndexRebuildStatus.PENDING)
+    progress = Column(Integer, default=0)  # 0-100
+    total_vectors = Column(Integer, default=0)
+    copied_vectors = Column(Integer, default=0)
+    error_message = Column(Text)
+    
+    # 元数据
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    
+    # 关联关系
+    agent = relationship("Agent", back_populates="index_rebuilds")
+
+
 class ConversationStatus(str, Enum):
     """客服状态"""
     ONLINE = "online"
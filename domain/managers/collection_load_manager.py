@@ -0,0 +1,276 @@
+"""
+Collection 加载状态管理器
+职责：跟踪智能体 Collection 的加载状态（load/release），启动预热、空闲释放
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Iterable, List, Optional
+
+
+class LoadState(str, Enum):
+    """Collection 加载状态"""
+    LOADED = "loaded"
+    LOADING = "loading"
+    RELEASED = "released"
+    NOT_EXIST = "not_exist"
+    ERROR = "error"
+
+
+class CollectionLoadManager:
+    """Collection 加载状态管理器"""
+
+    def __init__(
+        self,
+        milvus_store,
+        idle_release_seconds: float = 1800,
+        check_interval: float = 60
+    ):
+        """
+        初始化管理器
+
+        Args:
+            milvus_store: Milvus 服务实例
+            idle_release_seconds: 空闲超过该时长的 Collection 将被释放（<= 0 表示不释放）
+            check_interval: 空闲检查间隔（秒）
+        """
+        self.milvus_store = milvus_store
+        self.idle_release_seconds = idle_release_seconds
+        self.check_interval = check_interval
+
+        # agent_name -> {"state": LoadState, "last_used": float, "loaded_at": float, "error": str}
+        self._states: Dict[str, dict] = {}
+        self._agent_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._transitions = deque(maxlen=200)
+
+        self._reaper: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    # ==================== 状态查询与转换 ====================
+
+    def _agent_lock(self, agent_name: str) -> threading.Lock:
+        with self._lock:
+            return self._agent_locks.setdefault(agent_name, threading.Lock())
+
+    def _set_state(self, agent_name: str, state: LoadState, reason: str, error: Optional[str] = None):
+        with self._lock:
+            self._set_state_locked(agent_name, state, reason, error)
+
+    def _set_state_locked(self, agent_name: str, state: LoadState, reason: str, error: Optional[str] = None):
+        """状态转换（调用方已持有 self._lock）"""
+        now = time.monotonic()
+        entry = self._states.setdefault(agent_name, {"state": None, "last_used": now, "loaded_at": None})
+        old_state = entry["state"]
+        entry["state"] = state
+        entry["error"] = error
+        if state == LoadState.LOADED:
+            entry["loaded_at"] = now
+            entry["last_used"] = now
+        if old_state != state:
+            self._transitions.append({
+                "agent_name": agent_name,
+                "from": old_state.value if old_state else None,
+                "to": state.value,
+                "reason": reason,
+                "at": datetime.utcnow().isoformat()
+            })
+
+    def _claim_idle(self, agent_name: str, idle_seconds: float, reason: str) -> bool:
+        """
+        若仍处于空闲超时状态，原子地标记为已释放
+
+        标记后检索不再走已加载的快速路径，而是在智能体锁上等待释放完成后重新加载；
+        判断与标记之间有检索使用过（last_used 更新）则放弃释放。
+        """
+        with self._lock:
+            entry = self._states.get(agent_name)
+            if (
+                entry is None
+                or entry["state"] != LoadState.LOADED
+                or time.monotonic() - entry["last_used"] <= idle_seconds
+            ):
+                return False
+            self._set_state_locked(agent_name, LoadState.RELEASED, reason)
+            return True
+
+    def get_state(self, agent_name: str) -> Optional[LoadState]:
+        """获取已跟踪的状态（未跟踪返回 None）"""
+        with self._lock:
+            entry = self._states.get(agent_name)
+            return entry["state"] if entry else None
+
+    def touch(self, agent_name: str):
+        """记录一次使用（延后空闲释放）"""
+        with self._lock:
+            entry = self._states.get(agent_name)
+            if entry is not None:
+                entry["last_used"] = time.monotonic()
+
+    def ensure_loaded(self, agent_name: str, reason: str = "search") -> bool:
+        """
+        确保 Collection 已加载（已加载时仅更新使用时间，不访问 Milvus）
+
+        Args:
+            agent_name: 智能体名称
+            reason: 触发原因（记录在状态转换日志中）
+
+        Returns:
+            bool: Collection 是否处于已加载状态
+        """
+        if self.get_state(agent_name) == LoadState.LOADED:
+            self.touch(agent_name)
+            return True
+
+        with self._agent_lock(agent_name):
+            # 等锁期间可能已被其他线程加载
+            if self.get_state(agent_name) == LoadState.LOADED:
+                self.touch(agent_name)
+                return True
+
+            if not self.milvus_store.collection_exists(agent_name):
+                self._set_state(agent_name, LoadState.NOT_EXIST, reason)
+                return False
+
+            try:
+                if self.milvus_store.get_load_state(agent_name) == "Loaded":
+                    self._set_state(agent_name, LoadState.LOADED, f"{reason} (already loaded)")
+                    return True
+
+                self._set_state(agent_name, LoadState.LOADING, reason)
+                self.milvus_store.load_collection(agent_name)
+                self._set_state(agent_name, LoadState.LOADED, reason)
+                return True
+            except Exception as e:
+                print(f"⚠️ 加载 Collection 失败: {agent_name}, {e}")
+                self._set_state(agent_name, LoadState.ERROR, reason, error=str(e))
+                return False
+
+    def release(self, agent_name: str, reason: str = "manual", idle_seconds: Optional[float] = None) -> bool:
+        """
+        释放 Collection（从 Milvus 查询节点内存中卸载）
+
+        Args:
+            agent_name: 智能体名称
+            reason: 触发原因
+            idle_seconds: 仅在空闲超过该时长时释放（在锁内重新判断，为空不判断）
+
+        Returns:
+            bool: 是否成功（空闲判断不成立时返回 False）
+        """
+        with self._agent_lock(agent_name):
+            if idle_seconds is not None and not self._claim_idle(agent_name, idle_seconds, reason):
+                return False
+            try:
+                if self.milvus_store.collection_exists(agent_name):
+                    if self.milvus_store.release_collection(agent_name):
+                        self._set_state(agent_name, LoadState.RELEASED, reason)
+                    else:
+                        # 共享 Collection 不释放，记录实际状态
+                        self._set_state(agent_name, LoadState.LOADED, f"{reason} (shared, kept loaded)")
+                else:
+                    self._set_state(agent_name, LoadState.NOT_EXIST, reason)
+                return True
+            except Exception as e:
+                print(f"⚠️ 释放 Collection 失败: {agent_name}, {e}")
+                self._set_state(agent_name, LoadState.ERROR, reason, error=str(e))
+                return False
+
+    def forget(self, agent_name: str):
+        """停止跟踪（Collection 被删除或智能体被删除时）"""
+        with self._lock:
+            self._states.pop(agent_name, None)
+            self._agent_locks.pop(agent_name, None)
+
+    # ==================== 预热与空闲释放 ====================
+
+    def warm_up(self, agent_names: Iterable[str]) -> Dict[str, bool]:
+        """
+        预热加载一组智能体的 Collection
+
+        Args:
+            agent_names: 智能体名称列表
+
+        Returns:
+            dict: {agent_name: 是否已加载}
+        """
+        results = {}
+        for agent_name in agent_names:
+            results[agent_name] = self.ensure_loaded(agent_name, reason="warm_up")
+        loaded = sum(1 for ok in results.values() if ok)
+        print(f"🔥 Collection 预热完成: {loaded}/{len(results)}")
+        return results
+
+    def release_idle(self) -> List[str]:
+        """释放空闲超时的 Collection"""
+        # 共享 Collection 始终保持加载，不做空闲释放
+        if self.idle_release_seconds <= 0 or self.milvus_store.shared_layout:
+            return []
+
+        now = time.monotonic()
+        with self._lock:
+            idle_agents = [
+                name for name, entry in self._states.items()
+                if entry["state"] == LoadState.LOADED
+                and now - entry["last_used"] > self.idle_release_seconds
+            ]
+
+        released = [
+            name for name in idle_agents
+            if self.release(name, reason="idle", idle_seconds=self.idle_release_seconds)
+        ]
+        if released:
+            print(f"💤 已释放空闲 Collection: {released}")
+        return released
+
+    def start(self):
+        """启动后台空闲释放线程"""
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        if self.idle_release_seconds <= 0:
+            return
+
+        self._stop_event.clear()
+        self._reaper = threading.Thread(target=self._run_reaper, name="collection-idle-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop_event.set()
+        if self._reaper is not None:
+            self._reaper.join(timeout=5)
+            self._reaper = None
+
+    def _run_reaper(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.release_idle()
+            except Exception as e:
+                print(f"⚠️ 空闲释放检查失败: {e}")
+
+    def get_status(self) -> dict:
+        """获取所有 Collection 的加载状态与最近的状态转换"""
+        now = time.monotonic()
+        with self._lock:
+            collections = [
+                {
+                    "agent_name": name,
+                    "collection_name": self.milvus_store.get_collection_name(name),
+                    "state": entry["state"].value if entry["state"] else None,
+                    "idle_seconds": round(now - entry["last_used"], 1),
+                    "loaded_seconds": round(now - entry["loaded_at"], 1) if entry.get("loaded_at") else None,
+                    "error": entry.get("error")
+                }
+                for name, entry in self._states.items()
+            ]
+            transitions = list(self._transitions)
+
+        return {
+            "idle_release_seconds": self.idle_release_seconds,
+            "reaper_running": self._reaper is not None and self._reaper.is_alive(),
+            "loaded": sum(1 for c in collections if c["state"] == LoadState.LOADED),
+            "collections": collections,
+            "transitions": transitions[-50:]
+        }
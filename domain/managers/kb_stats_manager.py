@@ -0,0 +1,154 @@
+"""
+知识库统计管理器
+职责：在内存中维护每个智能体的向量数量，入库/删除时增量更新，后台与 Milvus 懒对账
+"""
+import threading
+import time
+from typing import Dict, Optional
+from config.database import SessionLocal
+from repository.agent_repository import DocumentRepository
+
+
+class KnowledgeBaseStatsManager:
+    """知识库统计管理器"""
+
+    def __init__(self, milvus_store, reconcile_interval: float = 60):
+        """
+        初始化管理器
+
+        Args:
+            milvus_store: Milvus 服务实例（用于后台对账）
+            reconcile_interval: 与 Milvus 对账的最小间隔（秒）
+        """
+        self.milvus_store = milvus_store
+        self.reconcile_interval = reconcile_interval
+        self.doc_repo = DocumentRepository()
+
+        # agent_name -> {"total_vectors": int, "reconciled_at": float}
+        self._counts: Dict[str, dict] = {}
+        self._reconciling: set = set()
+        self._lock = threading.Lock()
+
+    def get_vector_count(self, agent_name: str) -> int:
+        """
+        获取向量数量（内存读取，不访问 Milvus）
+
+        首次访问时从数据库文档记录（chunks_count 之和）初始化；
+        超过对账间隔后在后台线程与 Milvus 对账。
+
+        Args:
+            agent_name: 智能体名称
+
+        Returns:
+            int: 向量数量
+        """
+        with self._lock:
+            entry = self._counts.get(agent_name)
+
+        if entry is None:
+            count = self._load_from_db(agent_name)
+            with self._lock:
+                entry = self._counts.setdefault(
+                    agent_name,
+                    {"total_vectors": count, "reconciled_at": 0.0}
+                )
+
+        if time.monotonic() - entry["reconciled_at"] > self.reconcile_interval:
+            self.reconcile_async(agent_name)
+
+        return entry["total_vectors"]
+
+    def is_empty(self, agent_name: str) -> bool:
+        """知识库是否为空"""
+        return self.get_vector_count(agent_name) == 0
+
+    def record_added(self, agent_name: str, count: int):
+        """记录新增向量"""
+        with self._lock:
+            entry = self._counts.get(agent_name)
+            if entry is not None:
+                entry["total_vectors"] += count
+        # 未初始化的智能体在下次读取时从数据库加载，无需处理
+
+    def record_deleted(self, agent_name: str, count: Optional[int] = None):
+        """
+        记录删除向量
+
+        Args:
+            agent_name: 智能体名称
+            count: 删除数量（未知时标记为待对账）
+        """
+        with self._lock:
+            entry = self._counts.get(agent_name)
+            if entry is None:
+                return
+            if count is None:
+                entry["reconciled_at"] = 0.0
+            else:
+                entry["total_vectors"] = max(0, entry["total_vectors"] - count)
+
+    def reset(self, agent_name: str):
+        """知识库被清空后重置为 0"""
+        with self._lock:
+            self._counts[agent_name] = {"total_vectors": 0, "reconciled_at": time.monotonic()}
+
+    def remove(self, agent_name: str):
+        """移除智能体的统计（智能体被删除时）"""
+        with self._lock:
+            self._counts.pop(agent_name, None)
+
+    def reconcile_async(self, agent_name: str):
+        """在后台线程中与 Milvus 对账（同一智能体同时只运行一个）"""
+        with self._lock:
+            if agent_name in self._reconciling:
+                return
+            self._reconciling.add(agent_name)
+
+        thread = threading.Thread(
+            target=self._reconcile,
+            args=(agent_name,),
+            name=f"kb-stats-reconcile-{agent_name}",
+            daemon=True
+        )
+        thread.start()
+
+    def _reconcile(self, agent_name: str):
+        """读取 Milvus 中的实际数量并覆盖内存值"""
+        try:
+            count = self.milvus_store.count_entities(agent_name)
+            with self._lock:
+                if count is None:
+                    # Milvus 暂不可用，推迟到下个间隔再试
+                    entry = self._counts.get(agent_name)
+                    if entry is not None:
+                        entry["reconciled_at"] = time.monotonic()
+                    return
+
+                entry = self._counts.get(agent_name)
+                if entry is not None and entry["total_vectors"] != count:
+                    print(f"ℹ️ 知识库统计已对账: {agent_name} {entry['total_vectors']} -> {count}")
+                self._counts[agent_name] = {"total_vectors": count, "reconciled_at": time.monotonic()}
+        except Exception as e:
+            print(f"⚠️ 知识库统计对账失败: {e}")
+        finally:
+            with self._lock:
+                self._reconciling.discard(agent_name)
+
+    def _load_from_db(self, agent_name: str) -> int:
+        """从数据库文档记录汇总向量数量"""
+        db = SessionLocal()
+        try:
+            return self.doc_repo.sum_chunks_by_agent_name(db, agent_name)
+        except Exception as e:
+            print(f"⚠️ 读取文档统计失败: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def get_stats(self) -> dict:
+        """获取管理器统计信息"""
+        with self._lock:
+            return {
+                "tracked_agents": len(self._counts),
+                "counts": {name: entry["total_vectors"] for name, entry in self._counts.items()}
+            }
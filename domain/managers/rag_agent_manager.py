@@ -20,13 +20,21 @@ class RAGAgentManager:
         self.vector_manager = vector_manager
         self.rag_agents: Dict[str, RAGAgent] = {}
     
-    def get_or_create(self, agent_name: str, system_prompt: str) -> RAGAgent:
+    def get_or_create(
+        self,
+        agent_name: str,
+        system_prompt: str,
+        similarity_threshold: Optional[float] = None,
+        no_match_response: Optional[str] = None
+    ) -> RAGAgent:
         """
         获取或创建 RAG Agent 实例
         
         Args:
             agent_name: 智能体名称
             system_prompt: 系统提示词
+            similarity_threshold: 相似度阈值（为空使用全局默认）
+            no_match_response: 未命中时的预设回复（为空使用全局默认）
             
         Returns:
             RAGAgent 实例
@@ -40,7 +48,9 @@ class RAGAgentManager:
         rag_agent = RAGAgent(
             agent_name=agent_name,
             system_prompt=system_prompt,
-            vector_manager=self.vector_manager
+            vector_manager=self.vector_manager,
+            similarity_threshold=similarity_threshold,
+            no_match_response=no_match_response
         )
         
         # 缓存
@@ -75,19 +85,27 @@ class RAGAgentManager:
             return True
         return False
     
-    def reload(self, agent_name: str, system_prompt: str) -> RAGAgent:
+    def reload(
+        self,
+        agent_name: str,
+        system_prompt: str,
+        similarity_threshold: Optional[float] = None,
+        no_match_response: Optional[str] = None
+    ) -> RAGAgent:
         """
         重新加载 RAG Agent 实例（先移除再创建）
         
         Args:
             agent_name: 智能体名称
             system_prompt: 新的系统提示词
+            similarity_threshold: 相似度阈值（为空使用全局默认）
+            no_match_response: 未命中时的预设回复（为空使用全局默认）
             
         Returns:
             新的 RAGAgent 实例
         """
         self.remove(agent_name)
-        return self.get_or_create(agent_name, system_prompt)
+        return self.get_or_create(agent_name, system_prompt, similarity_threshold, no_match_response)
     
     def update_system_prompt(self, agent_name: str, new_prompt: str) -> bool:
         """
@@ -0,0 +1,254 @@
+"""
+向量软删除管理器
+职责：维护每个智能体已软删除的 file_id（墓碑），供检索时过滤；
+后台线程按批清除 Milvus 中的向量、触发压缩并删除文档记录
+"""
+import threading
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, List, Optional
+from config.database import SessionLocal
+from domain.entities import DocumentStatus
+from repository.agent_repository import DocumentRepository
+
+
+class VectorPurgeManager:
+    """向量软删除管理器"""
+
+    def __init__(self, vector_manager, interval: float = 5, batch_size: int = 200):
+        """
+        初始化管理器
+
+        Args:
+            vector_manager: 向量存储管理器（执行实际删除、同步副本与统计）
+            interval: 后台清除间隔（秒）
+            batch_size: 每批清除的文档数量
+        """
+        self.vector_manager = vector_manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.doc_repo = DocumentRepository()
+
+        # agent_name -> 已软删除的 file_id
+        self._tombstones: Dict[str, FrozenSet[str]] = {}
+        # 本轮刷新开始后新登记的墓碑（刷新时合并，避免被数据库快照覆盖）
+        self._recent: Dict[str, set] = {}
+        # agent_name -> 仍可能有迟到写入的失败文件（批量导入超时），刷新墓碑时保留，直到导入任务结束后清理
+        self._held: Dict[str, set] = {}
+        # 已请求清空、但可能没有文档记录可标记的智能体（如修复元数据与向量不一致）
+        self._clear_requests: set = set()
+        # agent_name -> {"purged_files", "purged_vectors", "last_purge_at", "last_error"}
+        self._progress: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        self._thread: Optional[threading.Thread] = None
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    # ==================== 墓碑 ====================
+
+    def get_tombstones(self, agent_name: str) -> FrozenSet[str]:
+        """
+        获取智能体已软删除的 file_id（检索热路径：内存读取，首次访问时从数据库加载）
+
+        Args:
+            agent_name: 智能体名称
+
+        Returns:
+            FrozenSet[str]: 待清除的 file_id
+        """
+        tombstones = self._tombstones.get(agent_name)
+        if tombstones is not None:
+            return tombstones
+
+        db = SessionLocal()
+        try:
+            loaded = frozenset(self.doc_repo.list_deleted_ids_by_agent_name(db, agent_name))
+        except Exception as e:
+            print(f"⚠️ 读取软删除记录失败: {e}")
+            return frozenset()
+        finally:
+            db.close()
+        with self._lock:
+            return self._tombstones.setdefault(agent_name, loaded)
+
+    def mark_deleted(self, agent_name: str, file_ids: Iterable[str], clear: bool = False):
+        """
+        登记已软删除的文件（数据库标记由调用方完成），唤醒后台清除
+
+        Args:
+            agent_name: 智能体名称
+            file_ids: 已软删除的文件 ID
+            clear: 是否为清空知识库（清除时没有存活文档则直接删除整个 Collection）
+        """
+        file_ids = set(file_ids)
+        with self._lock:
+            if file_ids:
+                self._tombstones[agent_name] = self._tombstones.get(agent_name, frozenset()) | file_ids
+                self._recent.setdefault(agent_name, set()).update(file_ids)
+            if clear:
+                self._clear_requests.add(agent_name)
+        self.start()
+        self._wake_event.set()
+
+    def hold(self, agent_name: str, file_ids: Iterable[str]):
+        """
+        将失败文件加入墓碑并保持（文档未软删除，但之后仍可能有向量写入，检索时须过滤）
+
+        Args:
+            agent_name: 智能体名称
+            file_ids: 文件 ID
+        """
+        file_ids = set(file_ids)
+        with self._lock:
+            self._held.setdefault(agent_name, set()).update(file_ids)
+            self._tombstones[agent_name] = self._tombstones.get(agent_name, frozenset()) | file_ids
+
+    def release(self, agent_name: str, file_ids: Iterable[str]):
+        """解除保持（向量已清理），下一轮刷新时移出墓碑"""
+        with self._lock:
+            held = self._held.get(agent_name)
+            if held is not None:
+                held.difference_update(file_ids)
+                if not held:
+                    del self._held[agent_name]
+
+    # ==================== 后台清除 ====================
+
+    def start(self):
+        """启动后台清除线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="vector-purger", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.purge_once()
+            except Exception as e:
+                print(f"⚠️ 向量清除失败: {e}")
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+
+    def purge_once(self) -> int:
+        """
+        执行一轮清除：按智能体分批删除向量，成功后删除文档记录
+
+        每轮先从数据库刷新墓碑（多进程部署时同步其他进程的删除）；
+        已清除的文件在下一轮刷新时才移出墓碑，给 Milvus 删除可见性留出时间。
+
+        Returns:
+            int: 本轮清除的文档数量
+        """
+        with self._lock:
+            self._recent = {}
+        db = SessionLocal()
+        try:
+            pending: Dict[str, List] = {}
+            processing = set()
+            for agent_name, document in self.doc_repo.list_deleted(db):
+                pending.setdefault(agent_name, []).append(document)
+                if document.status == DocumentStatus.PROCESSING:
+                    processing.add(agent_name)
+
+            with self._lock:
+                tombstones = {
+                    name: frozenset(doc.id for doc in docs) for name, docs in pending.items()
+                }
+                for name in self._tombstones:
+                    tombstones.setdefault(name, frozenset())
+                for name, file_ids in self._recent.items():
+                    tombstones[name] = tombstones.get(name, frozenset()) | file_ids
+                for name, file_ids in self._held.items():
+                    tombstones[name] = tombstones.get(name, frozenset()) | file_ids
+                self._tombstones = tombstones
+                clear_requests = set(self._clear_requests)
+
+            purged = 0
+            for agent_name in set(pending) | clear_requests:
+                # 有文档仍在入库时该智能体整体推迟清除（墓碑照常过滤），
+                # 否则入库结束前写入的向量会成为孤立数据
+                if agent_name in processing:
+                    continue
+                documents = pending.get(agent_name, [])
+                try:
+                    purged += self._purge_agent(db, agent_name, documents, agent_name in clear_requests)
+                except Exception as e:
+                    db.rollback()
+                    self._record(agent_name, error=str(e))
+                    print(f"❌ 清除向量失败: {agent_name}: {e}")
+            return purged
+        finally:
+            db.close()
+
+    def _purge_agent(self, db, agent_name: str, documents: List, clear: bool) -> int:
+        # 写入锁内判断是否还有存活文档：没有时直接删除整个 Collection（比逐文件删除快，且清理孤立向量）
+        with self.vector_manager.write_lock(agent_name):
+            if (documents or clear) and self.doc_repo.count_live_by_agent_name(db, agent_name) == 0:
+                if not self.vector_manager.clear_collection(agent_name):
+                    raise RuntimeError("删除 Collection 失败")
+                vectors = sum(doc.chunks_count or 0 for doc in documents)
+                self.doc_repo.delete_many(db, [doc.id for doc in documents])
+                with self._lock:
+                    self._clear_requests.discard(agent_name)
+                self._record(agent_name, files=len(documents), vectors=vectors)
+                print(f"🧹 知识库已清除: {agent_name}（{len(documents)} 个文档）")
+                return len(documents)
+
+            with self._lock:
+                self._clear_requests.discard(agent_name)
+
+            purged = 0
+            for i in range(0, len(documents), self.batch_size):
+                batch = documents[i:i + self.batch_size]
+                done = self.vector_manager.purge_documents(agent_name, batch)
+                vectors = sum(doc.chunks_count or 0 for doc in done)
+                self.doc_repo.delete_many(db, [doc.id for doc in done])
+                self._record(agent_name, files=len(done), vectors=vectors)
+                purged += len(done)
+                if len(done) < len(batch):
+                    raise RuntimeError(f"{len(batch) - len(done)} 个文档的向量删除失败，下一轮重试")
+
+        if purged:
+            print(f"🧹 已清除软删除文档: {agent_name}（{purged} 个）")
+        return purged
+
+    def _record(self, agent_name: str, files: int = 0, vectors: int = 0, error: Optional[str] = None):
+        with self._lock:
+            entry = self._progress.setdefault(agent_name, {
+                "purged_files": 0, "purged_vectors": 0, "last_purge_at": None, "last_error": None
+            })
+            entry["purged_files"] += files
+            entry["purged_vectors"] += vectors
+            if error is None:
+                entry["last_purge_at"] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            entry["last_error"] = error
+
+    def get_status(self, agent_name: str) -> dict:
+        """
+        获取智能体的清除进度
+
+        Returns:
+            dict: 待清除文件数、是否等待清空、本进程已清除的文件/向量数、最近一次清除时间与错误
+        """
+        pending = self.get_tombstones(agent_name)
+        with self._lock:
+            progress = dict(self._progress.get(agent_name, {
+                "purged_files": 0, "purged_vectors": 0, "last_purge_at": None, "last_error": None
+            }))
+            clearing = agent_name in self._clear_requests
+        return {
+            "pending_files": len(pending),
+            "clearing": clearing,
+            "purger_running": self._thread is not None and self._thread.is_alive(),
+            **progress
+        }
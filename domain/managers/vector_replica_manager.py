@@ -0,0 +1,521 @@
+"""
+进程内向量副本管理器
+职责：为小规模知识库在进程内保存连续的向量矩阵（float32/float16，可内存映射到磁盘），
+以一次矩阵运算完成 top-k 精确检索；入库、删除时增量同步，超过规模阈值时回退到 Milvus。
+混合检索的知识库同样加载副本，但只服务于稠密向量的阈值预检（BM25 一路无法在进程内等价复现），
+检索仍走 Milvus
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config.milvus import milvus_settings
+
+
+class ReplicaState(str, Enum):
+    """副本状态"""
+    LOADING = "loading"
+    READY = "ready"
+    TOO_LARGE = "too_large"        # 超过规模阈值，检索走 Milvus
+    ERROR = "error"
+
+
+class VectorReplica:
+    """单个智能体的向量副本：行号对齐的主键、向量矩阵、文件 ID 与实体字段"""
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        matrix: np.ndarray,
+        file_ids: np.ndarray,
+        entities: List[Dict],
+        metric_type: str = "L2",
+        mmap_path: Optional[str] = None,
+        dense_only: bool = False
+    ):
+        """
+        初始化副本
+
+        Args:
+            ids: 主键数组
+            matrix: 向量矩阵 (n, dim)
+            file_ids: 每行所属的文件 ID
+            entities: 每行的实体字段（不含向量）
+            metric_type: 距离度量（L2/IP/COSINE，与 Milvus 索引一致）
+            mmap_path: 内存映射文件路径（为空则常驻内存）
+            dense_only: 知识库走混合检索，副本只用于稠密向量的阈值预检
+        """
+        self.metric_type = metric_type.upper()
+        self.mmap_path = mmap_path
+        self.dense_only = dense_only
+        self.ids = ids
+        self.file_ids = file_ids
+        self.entities = entities
+        self._set_matrix(matrix)
+
+    def _set_matrix(self, matrix: np.ndarray):
+        if self.mmap_path:
+            # 写入新文件后原子替换，仍在使用旧副本的检索继续读取旧文件内容
+            tmp_path = f"{self.mmap_path}.tmp.npy"
+            np.save(tmp_path, matrix)
+            os.replace(tmp_path, self.mmap_path)
+            matrix = np.load(self.mmap_path, mmap_mode="r")
+        self.matrix = matrix
+        # 预计算每行的平方范数（L2）或范数（COSINE），检索时只需一次矩阵乘法
+        squared = np.einsum("ij,ij->i", matrix, matrix, dtype=np.float32)
+        self._row_norms = squared if self.metric_type == "L2" else np.sqrt(squared)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.matrix.nbytes)
+
+    def with_rows(self, ids: np.ndarray, matrix: np.ndarray, file_ids: np.ndarray, entities: List[Dict]) -> "VectorReplica":
+        """
+        返回追加了新行的副本（已存在的主键跳过；副本不可变，检索线程不受影响）
+        """
+        keep = np.flatnonzero(~np.isin(ids, self.ids))
+        if not len(keep):
+            return self
+        if not len(self.ids):
+            merged = matrix[keep]
+        else:
+            merged = np.concatenate([np.asarray(self.matrix), matrix[keep]])
+        return VectorReplica(
+            np.concatenate([self.ids, ids[keep]]),
+            merged,
+            np.concatenate([self.file_ids, file_ids[keep]]),
+            self.entities + [entities[i] for i in keep],
+            metric_type=self.metric_type,
+            mmap_path=self.mmap_path,
+            dense_only=self.dense_only
+        )
+
+    def without_file(self, file_id: str) -> "VectorReplica":
+        """
+        返回删除了某个文件全部行的副本
+        """
+        keep = np.flatnonzero(self.file_ids != file_id)
+        if len(keep) == len(self.ids):
+            return self
+        return VectorReplica(
+            self.ids[keep],
+            np.asarray(self.matrix)[keep],
+            self.file_ids[keep],
+            [self.entities[i] for i in keep],
+            metric_type=self.metric_type,
+            mmap_path=self.mmap_path,
+            dense_only=self.dense_only
+        )
+
+    def search(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int,
+        exclude_file_ids: Optional[Iterable[str]] = None
+    ) -> List[List[Dict]]:
+        """
+        精确 top-k 检索（一次矩阵乘法），返回格式与 Milvus 搜索结果一致
+
+        Args:
+            query_vectors: 查询向量
+            top_k: 每条查询返回数量
+            exclude_file_ids: 需要排除的文件 ID（已软删除、尚未清除）
+
+        Returns:
+            List[List[Dict]]: 每条查询的命中列表 {"id", "distance", "entity"}
+        """
+        n = len(self.ids)
+        if n == 0 or top_k <= 0:
+            return [[] for _ in query_vectors]
+
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        dim = self.matrix.shape[1]
+        if queries.shape[1] > dim:
+            # Collection 存储的是截断维度（Matryoshka）的向量，查询向量同样截断并重新归一化
+            queries = queries[:, :dim]
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        # float16 矩阵在乘法中提升为 float32 计算，结果精度与 float32 副本一致到约 1e-3
+        dots = queries @ self.matrix.T
+        if self.metric_type == "L2":
+            # Milvus 的 L2 距离为平方欧氏距离：|x|^2 - 2x·q + |q|^2
+            scores = self._row_norms[None, :] - 2 * dots + np.einsum("ij,ij->i", queries, queries)[:, None]
+            scores = np.maximum(scores, 0)
+            order_scores = scores
+        else:
+            if self.metric_type == "COSINE":
+                query_norms = np.linalg.norm(queries, axis=1)
+                scores = dots / np.maximum(self._row_norms[None, :] * query_norms[:, None], 1e-12)
+            else:
+                scores = dots
+            order_scores = -scores
+
+        if exclude_file_ids:
+            excluded = np.isin(self.file_ids, list(exclude_file_ids))
+            if excluded.any():
+                order_scores = np.where(excluded[None, :], np.inf, order_scores)
+                n = n - int(excluded.sum())
+                if n == 0:
+                    return [[] for _ in query_vectors]
+
+        # 排除的行分数为 inf，k 不超过剩余行数时不会被选中
+        k = min(top_k, n)
+        if k < len(self.ids):
+            candidates = np.argpartition(order_scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(k), (len(queries), k))
+        results = []
+        for row, cand in enumerate(candidates):
+            best = cand[np.argsort(order_scores[row, cand], kind="stable")]
+            results.append([
+                {"id": int(self.ids[i]), "distance": float(scores[row, i]), "entity": self.entities[i]}
+                for i in best
+            ])
+        return results
+
+    def close(self):
+        """删除内存映射文件（已映射的内容在引用释放前仍可读取）"""
+        if self.mmap_path and os.path.exists(self.mmap_path):
+            try:
+                os.remove(self.mmap_path)
+            except OSError:
+                pass
+
+
+class VectorReplicaManager:
+    """进程内向量副本管理器"""
+
+    def __init__(
+        self,
+        milvus_store,
+        enabled: bool = False,
+        max_vectors: int = 20000,
+        dtype: str = "float32",
+        mmap_dir: str = "",
+        load_batch_size: int = 1000
+    ):
+        """
+        初始化管理器
+
+        Args:
+            milvus_store: Milvus 服务实例
+            enabled: 是否启用进程内副本
+            max_vectors: 副本允许的最大向量数，超过则回退到 Milvus
+            dtype: 矩阵存储精度（float32/float16）
+            mmap_dir: 内存映射文件目录（为空则副本常驻内存）
+            load_batch_size: 从 Milvus 加载时的每批数量
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"不支持的副本精度: {dtype}")
+        self.milvus_store = milvus_store
+        self.enabled = enabled
+        self.max_vectors = max_vectors
+        self.dtype = np.dtype(dtype)
+        self.mmap_dir = mmap_dir
+        self.load_batch_size = load_batch_size
+
+        # agent_name -> VectorReplica
+        self._replicas: Dict[str, VectorReplica] = {}
+        # agent_name -> {"state": ReplicaState, "error": str, "loaded_at": float, "hits": int}
+        self._states: Dict[str, dict] = {}
+        self._agent_locks: Dict[str, threading.RLock] = {}
+        self._lock = threading.Lock()
+
+        if self.enabled and self.mmap_dir:
+            os.makedirs(self.mmap_dir, exist_ok=True)
+
+    # ==================== 状态 ====================
+
+    def _agent_lock(self, agent_name: str) -> threading.RLock:
+        with self._lock:
+            return self._agent_locks.setdefault(agent_name, threading.RLock())
+
+    def _set_state(self, agent_name: str, state: ReplicaState, error: Optional[str] = None):
+        with self._lock:
+            entry = self._states.setdefault(agent_name, {"state": None, "loaded_at": None, "hits": 0})
+            entry["state"] = state
+            entry["error"] = error
+            if state == ReplicaState.READY:
+                entry["loaded_at"] = time.monotonic()
+
+    def get_state(self, agent_name: str) -> Optional[ReplicaState]:
+        """获取副本状态（未跟踪返回 None）"""
+        with self._lock:
+            entry = self._states.get(agent_name)
+            return entry["state"] if entry else None
+
+    def _mmap_path(self, agent_name: str) -> Optional[str]:
+        if not self.mmap_dir:
+            return None
+        return os.path.join(self.mmap_dir, f"{self.milvus_store.get_agent_collection_name(agent_name)}.npy")
+
+    # ==================== 加载与同步 ====================
+
+    def _fetch(self, agent_name: str, expr: str = "", limit: Optional[int] = None):
+        """
+        从 Milvus 拉取实体并转换为副本所需的数组
+
+        Returns:
+            tuple: (ids, matrix, file_ids, entities)；超过 limit 时返回 None
+        """
+        ids, vectors, file_ids, entities = [], [], [], []
+        for rows in self.milvus_store.iter_entities(agent_name, expr, batch_size=self.load_batch_size):
+            for row in rows:
+                row = dict(row)
+                vectors.append(row.pop("vector"))
+                ids.append(row.get("pk"))
+                file_ids.append(row.get("file_id"))
+                entities.append(row)
+            if limit is not None and len(ids) > limit:
+                return None
+
+        dim = len(vectors[0]) if vectors else 0
+        return (
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(vectors, dtype=self.dtype).reshape(len(vectors), dim),
+            np.asarray(file_ids, dtype=object),
+            entities
+        )
+
+    def load(self, agent_name: str) -> Optional[VectorReplica]:
+        """
+        从 Milvus 全量加载智能体的副本
+
+        Args:
+            agent_name: 智能体名称
+
+        Returns:
+            Optional[VectorReplica]: 副本；不适用（超限、失败）时返回 None
+        """
+        with self._agent_lock(agent_name):
+            self._drop(agent_name)
+            self._set_state(agent_name, ReplicaState.LOADING)
+            try:
+                dense_only = self.milvus_store.uses_hybrid_search(agent_name)
+                index = self.milvus_store.describe_vector_index(agent_name) or {}
+                fetched = self._fetch(agent_name, limit=self.max_vectors)
+                if fetched is None:
+                    self._set_state(agent_name, ReplicaState.TOO_LARGE)
+                    return None
+
+                replica = VectorReplica(
+                    *fetched,
+                    metric_type=index.get("metric_type") or milvus_settings.metric_type,
+                    mmap_path=self._mmap_path(agent_name),
+                    dense_only=dense_only
+                )
+                with self._lock:
+                    self._replicas[agent_name] = replica
+                self._set_state(agent_name, ReplicaState.READY)
+                print(f"🧮 已加载进程内向量副本: {agent_name} (向量数: {len(replica)}, {replica.nbytes / 1024 / 1024:.1f}MB)")
+                return replica
+            except Exception as e:
+                print(f"⚠️ 加载进程内向量副本失败: {agent_name}, {e}")
+                self._set_state(agent_name, ReplicaState.ERROR, error=str(e))
+                return None
+
+    def load_async(self, agent_name: str):
+        """在后台线程加载副本（加载完成前检索走 Milvus）"""
+        threading.Thread(
+            target=self.load,
+            args=(agent_name,),
+            name=f"vector-replica-{agent_name}",
+            daemon=True
+        ).start()
+
+    def acquire(
+        self,
+        agent_name: str,
+        vector_count: Optional[int] = None,
+        dense_only: bool = False
+    ) -> Optional[VectorReplica]:
+        """
+        获取可用于检索的副本（热路径，不访问 Milvus）
+
+        未跟踪的智能体在后台开始加载，本次返回 None（由调用方回退到 Milvus）。
+        混合检索知识库的副本只返回给稠密向量检索（阈值预检）。
+
+        Args:
+            agent_name: 智能体名称
+            vector_count: 当前向量数（来自内存统计，超过阈值时直接回退）
+            dense_only: 调用方只需要稠密向量检索
+
+        Returns:
+            Optional[VectorReplica]: 副本或 None
+        """
+        if not self.enabled:
+            return None
+        if vector_count is not None and vector_count > self.max_vectors:
+            if self.get_state(agent_name) != ReplicaState.TOO_LARGE:
+                with self._agent_lock(agent_name):
+                    self._drop(agent_name)
+                    self._set_state(agent_name, ReplicaState.TOO_LARGE)
+            return None
+
+        with self._lock:
+            entry = self._states.get(agent_name)
+            if entry is not None:
+                replica = self._replicas.get(agent_name)
+                if replica is not None and entry["state"] == ReplicaState.READY:
+                    if replica.dense_only and not dense_only:
+                        return None
+                    entry["hits"] += 1
+                    return replica
+                return None
+            # 首次访问：占位后在后台加载，避免并发请求重复加载
+            self._states[agent_name] = {"state": ReplicaState.LOADING, "loaded_at": None, "hits": 0, "error": None}
+
+        self.load_async(agent_name)
+        return None
+
+    def sync_files(self, agent_name: str, file_ids: Iterable[str]):
+        """
+        入库后增量同步：从 Milvus 拉取新写入文件的向量追加到副本
+
+        Args:
+            agent_name: 智能体名称
+            file_ids: 新写入的文件 ID
+        """
+        if not self.enabled:
+            return
+        with self._agent_lock(agent_name):
+            replica = self._replicas.get(agent_name)
+            if replica is None:
+                if self.get_state(agent_name) != ReplicaState.TOO_LARGE:
+                    # 尚未加载或此前不可用：下次检索时重新加载
+                    self.invalidate(agent_name)
+                return
+            try:
+                for file_id in file_ids:
+                    fetched = self._fetch(agent_name, f'file_id == "{file_id}"')
+                    if not len(fetched[0]):
+                        # 尚不可见或未写入任何行（矩阵为 0x0，不能与副本拼接）
+                        continue
+                    replica = replica.with_rows(*fetched)
+                    if len(replica) > self.max_vectors:
+                        replica.close()
+                        self._drop(agent_name)
+                        self._set_state(agent_name, ReplicaState.TOO_LARGE)
+                        print(f"↪️ 知识库超过副本阈值，检索回退到 Milvus: {agent_name}")
+                        return
+                with self._lock:
+                    self._replicas[agent_name] = replica
+                print(f"🧮 副本已同步: {agent_name} (向量数: {len(replica)})")
+            except Exception as e:
+                print(f"⚠️ 同步进程内向量副本失败: {agent_name}, {e}")
+                self.invalidate(agent_name)
+
+    def remove_file(self, agent_name: str, file_id: str):
+        """
+        删除文件后同步副本
+
+        Args:
+            agent_name: 智能体名称
+            file_id: 已删除的文件 ID
+        """
+        if not self.enabled:
+            return
+        with self._agent_lock(agent_name):
+            replica = self._replicas.get(agent_name)
+            if replica is not None:
+                replica = replica.without_file(file_id)
+                with self._lock:
+                    self._replicas[agent_name] = replica
+            elif self.get_state(agent_name) == ReplicaState.TOO_LARGE:
+                # 规模可能已回落到阈值以下，下次检索时重新评估
+                self.invalidate(agent_name)
+
+    def _drop(self, agent_name: str):
+        with self._lock:
+            replica = self._replicas.pop(agent_name, None)
+        if replica is not None:
+            replica.close()
+
+    def invalidate(self, agent_name: str):
+        """丢弃副本（清空、重建、删除智能体时），下次检索时重新加载"""
+        with self._agent_lock(agent_name):
+            self._drop(agent_name)
+            with self._lock:
+                self._states.pop(agent_name, None)
+
+    # ==================== 一致性校验 ====================
+
+    def check_parity(self, agent_name: str, queries: List[str], top_k: int = 10) -> Dict:
+        """
+        对比副本与 Milvus 稠密检索的 top-k 结果
+
+        Args:
+            agent_name: 智能体名称
+            queries: 查询文本
+            top_k: 对比的结果数量
+
+        Returns:
+            dict: {"recall": 副本结果对 Milvus 结果的平均召回, "max_score_diff": 共同命中的最大分数差, "queries": [...]}
+        """
+        replica = self._replicas.get(agent_name) or self.load(agent_name)
+        if replica is None:
+            state = self.get_state(agent_name)
+            raise ValueError(f"副本不可用: {state.value if state else 'disabled'}")
+
+        query_vectors = self.milvus_store.embed_queries(queries, agent_name)
+        local_hits = replica.search(query_vectors, top_k)
+        remote_hits = self.milvus_store.dense_search(agent_name, query_vectors, top_k)
+
+        details = []
+        for query, local, remote in zip(queries, local_hits, remote_hits):
+            local_scores = {hit["id"]: hit["distance"] for hit in local}
+            remote_scores = {hit["id"]: hit["distance"] for hit in remote}
+            common = local_scores.keys() & remote_scores.keys()
+            details.append({
+                "query": query,
+                "recall": len(common) / len(remote_scores) if remote_scores else 1.0,
+                "max_score_diff": max((abs(local_scores[i] - remote_scores[i]) for i in common), default=0.0),
+                "local_ids": list(local_scores),
+                "milvus_ids": list(remote_scores)
+            })
+
+        return {
+            "agent_name": agent_name,
+            "top_k": top_k,
+            "vectors": len(replica),
+            "dtype": str(replica.matrix.dtype),
+            "recall": float(np.mean([d["recall"] for d in details])) if details else 1.0,
+            "max_score_diff": max((d["max_score_diff"] for d in details), default=0.0),
+            "queries": details,
+            "checked_at": datetime.utcnow().isoformat()
+        }
+
+    def get_status(self) -> dict:
+        """获取所有副本的状态"""
+        now = time.monotonic()
+        with self._lock:
+            replicas = []
+            for name, entry in self._states.items():
+                replica = self._replicas.get(name)
+                replicas.append({
+                    "agent_name": name,
+                    "state": entry["state"].value if entry["state"] else None,
+                    "vectors": len(replica) if replica is not None else None,
+                    "memory_mb": round(replica.nbytes / 1024 / 1024, 2) if replica is not None else None,
+                    "mmap": bool(replica.mmap_path) if replica is not None else None,
+                    "dense_only": replica.dense_only if replica is not None else None,
+                    "hits": entry["hits"],
+                    "loaded_seconds": round(now - entry["loaded_at"], 1) if entry.get("loaded_at") else None,
+                    "error": entry.get("error")
+                })
+
+        return {
+            "enabled": self.enabled,
+            "max_vectors": self.max_vectors,
+            "dtype": self.dtype.name,
+            "mmap_dir": self.mmap_dir or None,
+            "ready": sum(1 for r in replicas if r["state"] == ReplicaState.READY),
+            "replicas": replicas
+        }
@@ -1,43 +1,81 @@
 """
 文档处理服务 - 负责文档加载、分割和预处理
-职责：文档格式转换、文本分割、内容过滤
+职责：文档格式转换、按 Embedding 模型 token 数分割文本（文本块不超过模型输入上限，不截断）
 """
 import os
-from typing import List, Tuple
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from config.settings import settings
+from domain.processors.pdf_loader import iter_pdf_pages
+from domain.processors.text_loader import detect_encoding, iter_text_blocks
+
+# 分隔符优先级：段落、换行、句末标点、句内标点、空格，最后按字符切分（保证任何片段都能切到上限以内）；
+# 标点保留在前一句末尾
+SEPARATORS = ["\n\n", "\n", "。", "！", "？", "!", "?", "；", ";", "…", "，", "、", ",", " ", ""]
 
 
 class DocumentProcessor:
     """文档处理服务"""
     
-    def __init__(
-        self,
-        chunk_size: int = 800,
-        chunk_overlap: int = 120,
-        max_chunk_length: int = 250
-    ):
+    def __init__(self, chunk_tokens: int = 512, chunk_overlap_tokens: int = 64):
         """
         初始化文档处理器
         
         Args:
-            chunk_size: 文本分块大小
-            chunk_overlap: 文本块重叠大小
-            max_chunk_length: 单个文本块最大长度（字符数）
+            chunk_tokens: 文本块目标大小（token 数，实际取与模型输入上限的较小值）
+            chunk_overlap_tokens: 相邻文本块重叠大小（token 数）
+        """
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        
+        # 默认分割器按字符数计长（未指定 Embedding 模型的计数方式时使用）
+        self.text_splitter = self.build_splitter()
+    
+    def build_splitter(
+        self,
+        length_function: Callable[[str], int] = len,
+        max_tokens: Optional[int] = None
+    ) -> RecursiveCharacterTextSplitter:
         """
-        self.chunk_size = chunk_size
-        self.chunk_overlap = chunk_overlap
-        self.max_chunk_length = max_chunk_length
+        构建按给定计数方式切分的分割器
+        
+        计数函数对空串的结果（如模型前缀、特殊 token）是每条输入的固定开销，
+        片段计长时扣除，块大小上限相应减去，避免按片段累加时重复计入。
         
-        # 文本分割器
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        Args:
+            length_function: 文本长度计数（Embedding 模型的 token 计数）
+            max_tokens: 模型单条输入 token 上限（为空不限制）
+            
+        Returns:
+            RecursiveCharacterTextSplitter: 分割器
+        """
+        overhead = length_function("")
+        chunk_size = self.chunk_tokens
+        if max_tokens is not None:
+            chunk_size = min(chunk_size, max_tokens - overhead)
+        chunk_size = max(1, chunk_size)
+        return RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            add_start_index=True,
-            separators=["\n\n", "\n", "。", "！", "？", "；", "，", " "]
+            chunk_overlap=min(self.chunk_overlap_tokens, chunk_size // 2),
+            length_function=lambda text: length_function(text) - overhead,
+            keep_separator="end",
+            separators=SEPARATORS
         )
     
+    def _split(self, splitter: RecursiveCharacterTextSplitter, doc: Document) -> List[Document]:
+        """
+        分割单个文档，metadata 记录文本块在文档中的起始位置 start_index
+        
+        重叠按 token 计，无法换算为字符数回退查找；文本块按顺序产出、起始位置严格递增，
+        因此从上一块起始位置之后查找。
+        """
+        chunks, index = [], -1
+        for text in splitter.split_text(doc.page_content):
+            index = doc.page_content.find(text, index + 1)
+            chunks.append(Document(page_content=text, metadata={**doc.metadata, 'start_index': index}))
+        return chunks
+    
     def load_document(self, file_path: str) -> List[Document]:
         """
         加载文档
@@ -52,52 +90,55 @@ class DocumentProcessor:
             FileNotFoundError: 文件不存在
             ValueError: 不支持的文件类型
         """
+        return list(self.iter_documents(file_path))
+    
+    def iter_documents(self, file_path: str) -> Iterator[Document]:
+        """
+        流式加载文档（PDF 由进程池并行提取、按页序产出；文本文件按段落边界分块读取）
+        
+        Args:
+            file_path: 文件路径
+            
+        Yields:
+            Document: 页面 / 文本块
+            
+        Raises:
+            FileNotFoundError: 文件不存在
+            ValueError: 不支持的文件类型
+        """
+        for doc, _ in self._iter_sections(file_path):
+            yield doc
+    
+    def _iter_sections(self, file_path: str) -> Iterator[Tuple[Document, int]]:
+        """产出 (文档, 文本偏移)：文本文件分块的偏移用于将文本块的 start_index 换算为文件内位置"""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"文件不存在: {file_path}")
         
-        filename = os.path.basename(file_path)
-        
-        # PDF 文件
         if file_path.endswith('.pdf'):
-            loader = PyPDFLoader(file_path)
-            docs = loader.load()
-            print(f"  加载 PDF: {len(docs)} 页")
-            return docs
-        
-        # 文本文件
+            pages = 0
+            for page in iter_pdf_pages(file_path):
+                pages += 1
+                yield page, 0
+            print(f"  加载 PDF: {pages} 页含文字")
         elif file_path.endswith(('.txt', '.md')):
-            docs = self._load_text_file(file_path)
-            print(f"  加载文本文件: {len(docs)} 个文档")
-            return docs
-        
+            yield from self._iter_text_file(file_path)
         else:
-            raise ValueError(f"不支持的文件类型: {filename}")
+            raise ValueError(f"不支持的文件类型: {os.path.basename(file_path)}")
     
-    def _load_text_file(self, file_path: str) -> List[Document]:
+    def _iter_text_file(self, file_path: str) -> Iterator[Tuple[Document, int]]:
         """
-        尝试多种编码加载文本文件
+        流式加载文本文件：按有界样本检测编码，再按段落边界单次严格解码分块读取
         
         Args:
             file_path: 文件路径
             
-        Returns:
-            List[Document]: 加载的文档
-            
-        Raises:
-            ValueError: 所有编码都失败
+        Yields:
+            Tuple[Document, int]: (文本块, 在文件文本中的起始偏移)
         """
-        encodings = ['utf-8', 'gbk', 'gb2312', 'gb18030', 'latin-1']
-        
-        for encoding in encodings:
-            try:
-                loader = TextLoader(file_path, encoding=encoding)
-                docs = loader.load()
-                print(f"  使用 {encoding} 编码加载成功")
-                return docs
-            except Exception:
-                continue
-        
-        raise ValueError(f"无法加载文件，尝试了所有编码: {encodings}")
+        encoding = detect_encoding(file_path)
+        print(f"  检测到 {encoding} 编码")
+        for text, offset in iter_text_blocks(file_path, encoding):
+            yield Document(page_content=text, metadata={"source": file_path}), offset
     
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
@@ -109,29 +150,32 @@ class DocumentProcessor:
         Returns:
             List[Document]: 分割后的文本块列表
         """
-        splits = self.text_splitter.split_documents(documents)
+        splits = [chunk for doc in documents for chunk in self._split(self.text_splitter, doc)]
         print(f"  分割为 {len(splits)} 个文本块")
         return splits
     
-    def filter_and_truncate(self, documents: List[Document]) -> List[Document]:
+    def _fit(
+        self,
+        chunk: Document,
+        length_function: Callable[[str], int],
+        max_tokens: Optional[int]
+    ) -> Iterator[Document]:
         """
-        过滤和截断过长的文本块
+        兜底：片段合并后整体计数仍超过模型上限的文本块（分词在拼接处的计数偏差）对半切分
         
-        Args:
-            documents: 文档列表
-            
-        Returns:
-            List[Document]: 处理后的文档列表
+        Yields:
+            Document: 不超过 max_tokens 的文本块
         """
-        filtered = []
-        for doc in documents:
-            content = doc.page_content
-            if len(content) > self.max_chunk_length:
-                doc.page_content = content[:self.max_chunk_length] + "..."
-            filtered.append(doc)
-        
-        print(f"  过滤后保留 {len(filtered)} 个文本块")
-        return filtered
+        text = chunk.page_content
+        if max_tokens is None or len(text) <= 1 or length_function(text) <= max_tokens:
+            yield chunk
+            return
+        middle = len(text) // 2
+        for part, start in ((text[:middle], 0), (text[middle:], middle)):
+            metadata = dict(chunk.metadata)
+            if 'start_index' in metadata:
+                metadata['start_index'] += start
+            yield from self._fit(Document(page_content=part, metadata=metadata), length_function, max_tokens)
     
     def add_metadata(
         self,
@@ -160,6 +204,68 @@ class DocumentProcessor:
             })
         return documents
     
+    def iter_chunks(
+        self,
+        file_path: str,
+        file_id: str,
+        filename: str,
+        agent_name: str,
+        stats: Optional[Dict[str, int]] = None,
+        length_function: Optional[Callable[[str], int]] = None,
+        max_tokens: Optional[int] = None
+    ) -> Iterator[Document]:
+        """
+        流式文档处理：逐页加载、按 token 数分割并添加元数据，产出文本块
+        
+        文本块按 Embedding 模型的 token 计数切分，不超过模型输入上限，向量化时不会被截断，
+        入库文本即完整原文。
+        
+        Args:
+            file_path: 文件路径
+            file_id: 文件 ID
+            filename: 文件名
+            agent_name: 智能体名称
+            stats: 处理统计（迭代过程中累加 original_docs / splits / filtered / final）
+            length_function: Embedding 模型的 token 计数（为空按字符数切分）
+            max_tokens: 模型单条输入 token 上限（为空不限制）
+            
+        Yields:
+            Document: 处理后的文本块
+            
+        Raises:
+            FileNotFoundError: 文件不存在
+            ValueError: 文件处理错误
+        """
+        print(f"📄 处理文件: {filename}")
+        stats = stats if stats is not None else {}
+        for key in ('original_docs', 'splits', 'filtered', 'final'):
+            stats.setdefault(key, 0)
+        
+        if length_function is None:
+            splitter = self.text_splitter
+        else:
+            splitter = self.build_splitter(length_function, max_tokens)
+            print(f"  按 token 分块: 每块至多 {self.chunk_tokens} tokens（模型输入上限 {max_tokens}）")
+        
+        for doc, offset in self._iter_sections(file_path):
+            stats['original_docs'] += 1
+            # 分割器逐文档独立切分：PDF 逐页处理与整体处理结果一致；
+            # 文本文件在段落边界分块，块内位置加上块偏移即文件内位置
+            splits = self._split(splitter, doc)
+            if offset:
+                for chunk in splits:
+                    chunk.metadata['start_index'] += offset
+            stats['splits'] += len(splits)
+            if length_function is not None:
+                splits = [part for chunk in splits for part in self._fit(chunk, length_function, max_tokens)]
+            kept = [chunk for chunk in splits if chunk.page_content.strip()]
+            stats['filtered'] += len(kept)
+            for chunk in self.add_metadata(kept, file_id, filename, agent_name):
+                stats['final'] += 1
+                yield chunk
+        
+        print(f"  分割为 {stats['splits']} 个文本块")
+    
     def process_file(
         self,
         file_path: str,
@@ -183,28 +289,8 @@ class DocumentProcessor:
             FileNotFoundError: 文件不存在
             ValueError: 文件处理错误
         """
-        print(f"📄 处理文件: {filename}")
-        
-        # 1. 加载文档
-        docs = self.load_document(file_path)
-        
-        # 2. 分割文档
-        splits = self.split_documents(docs)
-        
-        # 3. 过滤和截断
-        filtered = self.filter_and_truncate(splits)
-        
-        # 4. 添加元数据
-        processed = self.add_metadata(filtered, file_id, filename, agent_name)
-        
-        # 统计信息
-        stats = {
-            'original_docs': len(docs),
-            'splits': len(splits),
-            'filtered': len(filtered),
-            'final': len(processed)
-        }
-        
+        stats: Dict[str, int] = {}
+        processed = list(self.iter_chunks(file_path, file_id, filename, agent_name, stats))
         return processed, stats
 
 
@@ -216,5 +302,8 @@ def get_document_processor() -> DocumentProcessor:
     """获取文档处理器单例"""
     global _document_processor
     if _document_processor is None:
-        _document_processor = DocumentProcessor()
+        _document_processor = DocumentProcessor(
+            chunk_tokens=settings.CHUNK_TOKENS,
+            chunk_overlap_tokens=settings.CHUNK_OVERLAP_TOKENS
+        )
     return _document_processor
@@ -0,0 +1,209 @@
+"""
+PDF 加载器
+职责：按页流式产出 PDF 文本——页范围分发到进程池并行提取，按页序产出；
+无文字的页面（纯图片扫描页）不做提取直接跳过。文件以句柄方式按需读取，不整体载入内存
+"""
+import multiprocessing
+import os
+import threading
+from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from pypdf import PdfReader, PageObject
+from pypdf.generic import IndirectObject
+
+from config.settings import settings
+
+# 工作进程内缓存的读取器：(文件路径, 修改时间, 文件句柄, PdfReader)
+# 只在进程池的工作进程中使用（单线程执行任务）；主进程内多个线程并发提取，不能共享句柄
+_worker_reader: Optional[Tuple[str, float, object, PdfReader]] = None
+_in_worker = False
+
+# 与其他 PDF 解析器统一的元数据键名
+METADATA_KEY_ALIASES = {"page_count": "total_pages", "file_path": "source"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _resolve(value):
+    return value.get_object() if isinstance(value, IndirectObject) else value
+
+
+def has_text(page: PageObject) -> bool:
+    """
+    页面是否可能含文字：资源中有字体，或有表单 XObject（其中可能引用字体）
+
+    纯图片扫描页只有图片 XObject，无需运行文字提取。
+    """
+    resources = _resolve(page.get("/Resources"))
+    if not resources:
+        return False
+    if _resolve(resources.get("/Font")):
+        return True
+    xobjects = _resolve(resources.get("/XObject")) or {}
+    return any(_resolve(xobject).get("/Subtype") == "/Form" for xobject in xobjects.values())
+
+
+def _init_worker():
+    """进程池工作进程的初始化：允许缓存读取器"""
+    global _in_worker
+    _in_worker = True
+
+
+def _open_reader(file_path: str) -> PdfReader:
+    """打开（并在工作进程内复用）读取器：以文件句柄按需读取对象（仅在工作进程中调用）"""
+    global _worker_reader
+    mtime = os.path.getmtime(file_path)
+    if _worker_reader is not None and _worker_reader[:2] == (file_path, mtime):
+        return _worker_reader[3]
+    if _worker_reader is not None:
+        _worker_reader[2].close()
+    handle = open(file_path, "rb")
+    reader = PdfReader(handle)
+    _worker_reader = (file_path, mtime, handle, reader)
+    return reader
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    提取页范围 [start, end) 的文本（进程池任务，需为模块级函数）
+
+    工作进程内复用缓存的读取器；在主进程中调用时使用局部句柄，用完即关闭。
+
+    Returns:
+        List[Tuple[int, str]]: (页码, 文本)，无文字的页面不返回
+    """
+    if _in_worker:
+        return _extract_pages(_open_reader(file_path), start, end)
+    with open(file_path, "rb") as handle:
+        return _extract_pages(PdfReader(handle), start, end)
+
+
+def _extract_pages(reader: PdfReader, start: int, end: int) -> List[Tuple[int, str]]:
+    """提取读取器中页范围 [start, end) 的文本"""
+    pages = []
+    for number in range(start, end):
+        page = reader.pages[number]
+        if not has_text(page):
+            continue
+        text = page.extract_text(extraction_mode="plain").strip()
+        if text:
+            pages.append((number, text))
+    return pages
+
+
+def pdf_worker_count() -> int:
+    """PDF 提取进程数"""
+    return settings.PDF_WORKERS or os.cpu_count() or 1
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """获取 PDF 提取进程池（spawn 启动，不继承主进程的连接与线程）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = pdf_worker_count()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+            print(f"✅ PDF 提取进程池已启动（{workers} 个进程）")
+        return _pool
+
+
+def shutdown_pdf_pool():
+    """关闭 PDF 提取进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _document_metadata(reader: PdfReader, file_path: str) -> Dict:
+    """
+    文档级元数据（与 PyPDFLoader 的字段一致，已有 Collection 的 schema 依赖这些字段）
+
+    键去掉前导 "/" 并转小写；值统一为 str / int；creationdate、moddate 由 PDF 日期格式
+    （D:YYYYMMDDHHmmSS+hh'mm'）转换为 ISO 8601，无法解析时保留原值。
+    """
+    raw = (
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": file_path, "total_pages": len(reader.pages)}
+    )
+    metadata = {}
+    for key, value in raw.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = (key[1:] if key.startswith("/") else key).lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                metadata[key] = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                metadata[key] = value
+        elif key in METADATA_KEY_ALIASES:
+            metadata[METADATA_KEY_ALIASES[key]] = value
+            metadata[key] = value
+        elif isinstance(value, str):
+            metadata[key] = value.strip()
+        else:
+            metadata[key] = value
+    return metadata
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Document]:
+    """
+    按页序流式产出 PDF 页面文本
+
+    页数不少于 PDF_PARALLEL_MIN_PAGES 时，每 PDF_PAGES_PER_TASK 页为一个任务分发到进程池，
+    同时在途的任务数为进程数的两倍，已提取但未被消费的页面数量有上限。
+
+    Args:
+        file_path: PDF 文件路径
+
+    Yields:
+        Document: 含文字的页面（metadata 含 page / page_label / total_pages 等）
+    """
+    with open(file_path, "rb") as handle:
+        reader = PdfReader(handle)
+        total = len(reader.pages)
+        metadata = _document_metadata(reader, file_path)
+        labels = reader.page_labels
+
+    def to_document(number: int, text: str) -> Document:
+        return Document(page_content=text, metadata={**metadata, "page": number, "page_label": labels[number]})
+
+    step = max(1, settings.PDF_PAGES_PER_TASK)
+    ranges = [(start, min(start + step, total)) for start in range(0, total, step)]
+    if total < settings.PDF_PARALLEL_MIN_PAGES or settings.PDF_WORKERS == 1:
+        # 进程内提取：每次调用独立的句柄（并发上传的线程互不影响），结束或提前关闭时释放
+        with open(file_path, "rb") as handle:
+            reader = PdfReader(handle)
+            for start, end in ranges:
+                for number, text in _extract_pages(reader, start, end):
+                    yield to_document(number, text)
+        return
+
+    pool = get_pdf_pool()
+    window = pdf_worker_count() * 2
+    pending: List[Future] = []
+    try:
+        for start, end in ranges[:window]:
+            pending.append(pool.submit(extract_page_range, file_path, start, end))
+        next_range = len(pending)
+        while pending:
+            pages = pending.pop(0).result()
+            if next_range < len(ranges):
+                pending.append(pool.submit(extract_page_range, file_path, *ranges[next_range]))
+                next_range += 1
+            for number, text in pages:
+                yield to_document(number, text)
+    finally:
+        # 消费方提前结束（如入库失败）时取消尚未开始的任务
+        for future in pending:
+            future.cancel()
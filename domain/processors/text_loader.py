@@ -0,0 +1,138 @@
+"""
+文本加载器
+职责：从文件开头、中部、结尾各取一段有界样本检测编码，再按段落边界单次流式严格解码读取
+TXT / MD，不整体载入内存；不以替换字符掩盖解码错误
+"""
+import codecs
+import os
+from typing import Iterator, List, Tuple
+
+# 检测顺序：GB 系列统一按 GB18030 解码（GBK、GB2312 的超集，相同字节解码结果一致）
+CANDIDATE_ENCODINGS = ("utf-8", "gb18030")
+FALLBACK_ENCODING = "latin-1"  # 任意字节都可解码
+
+SAMPLE_BYTES = 256 * 1024
+BLOCK_CHARS = 64 * 1024
+
+
+def _read_samples(file_path: str, sample_bytes: int) -> List[Tuple[bytes, bool, bool]]:
+    """
+    读取编码检测样本
+
+    文件不超过三个样本大小时整体作为一个样本；否则取开头、中部、结尾各一段（只看开头会把
+    开头大段 ASCII 的 GBK 文件误判为 UTF-8）。
+
+    Returns:
+        List[Tuple[bytes, bool, bool]]: (样本字节, 是否从文件开头开始, 是否读到文件结尾)
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        if size <= sample_bytes * 3:
+            return [(f.read(), True, True)]
+        samples = []
+        for offset in (0, (size - sample_bytes) // 2, size - sample_bytes):
+            f.seek(offset)
+            samples.append((f.read(sample_bytes), offset == 0, offset + sample_bytes >= size))
+        return samples
+
+
+def _decodes(sample: bytes, encoding: str, at_start: bool, at_end: bool) -> bool:
+    """
+    样本能否按 encoding 严格解码
+
+    样本不在文件开头时可能从多字节字符中间开始：跳到第一个换行之后（UTF-8、GB18030 的
+    多字节字符都不含 0x0A）；样本不在文件结尾时允许末尾残留不完整的字符。
+    """
+    if not at_start:
+        newline = sample.find(b"\n")
+        if newline == -1:
+            # 整段没有换行：依次尝试跳过可能的残缺字节（多字节字符最长 4 字节）
+            return any(_decodes(sample[skip:], encoding, True, at_end) for skip in range(4))
+        sample = sample[newline + 1:]
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        decoder.decode(sample, final=at_end)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def detect_encoding(file_path: str, sample_bytes: int = SAMPLE_BYTES) -> str:
+    """
+    检测文件编码
+
+    有 BOM 时按 BOM 判断；否则依次尝试候选编码严格解码全部样本，都失败时使用 latin-1。
+    只读取有界的样本，样本之外的非法字节由 iter_text_blocks 在读取时发现。
+
+    Args:
+        file_path: 文件路径
+        sample_bytes: 每个样本的字节数
+
+    Returns:
+        str: 编码名称
+    """
+    samples = _read_samples(file_path, sample_bytes)
+    head = samples[0][0]
+
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    for encoding in CANDIDATE_ENCODINGS:
+        if all(_decodes(sample, encoding, at_start, at_end) for sample, at_start, at_end in samples):
+            return encoding
+    return FALLBACK_ENCODING
+
+
+def _cut_point(buffer: str, min_size: int) -> int:
+    """分块位置：优先段落边界（空行），其次换行，都没有时整体作为一块"""
+    for separator in ("\n\n", "\n"):
+        index = buffer.rfind(separator, min_size)
+        if index != -1:
+            return index + len(separator)
+    return len(buffer)
+
+
+def iter_text_blocks(
+    file_path: str,
+    encoding: str,
+    block_chars: int = BLOCK_CHARS
+) -> Iterator[Tuple[str, int]]:
+    """
+    按段落边界分块流式读取文本
+
+    每次读取 block_chars 个字符，在后半段内最后一个段落边界处切分，剩余部分并入下一块。
+    严格解码：编码只根据样本检测，已产出的文本块可能已经入库，不能换编码重读，遇到非法字节
+    （样本之外的内容不符合检测出的编码）时抛出异常，由调用方将文档标记为失败。
+
+    Args:
+        file_path: 文件路径
+        encoding: 文件编码
+        block_chars: 每块的目标字符数
+
+    Yields:
+        Tuple[str, int]: (文本块, 该块在文件文本中的起始偏移)
+
+    Raises:
+        ValueError: 文件内容不能按 encoding 解码
+    """
+    offset = 0
+    buffer = ""
+    with open(file_path, "r", encoding=encoding) as f:
+        while True:
+            try:
+                data = f.read(block_chars)
+            except UnicodeDecodeError as e:
+                raise ValueError(f"文件无法按 {encoding} 编码完整解码: {e}") from e
+            buffer += data
+            if not data:
+                break
+            if len(buffer) < block_chars:
+                continue
+            cut = _cut_point(buffer, block_chars // 2)
+            yield buffer[:cut], offset
+            offset += cut
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer, offset
@@ -2,24 +2,66 @@
 向量存储管理服务 - 负责向量数据的增删改查
 职责：向量数据库操作、批量处理、错误重试
 """
-from typing import List, Dict, Any
+import asyncio
+import itertools
+import threading
+import time
+from typing import Callable, Iterable, List, Dict, Any, Optional
 from langchain_core.documents import Document
 from langchain_core.vectorstores import VectorStore
+from config.settings import settings
+from config.milvus import build_index_profile, milvus_settings
+from application.vector_writer import BulkImportTimeout, ColumnarVectorWriter
+from application.ingestion_pipeline import batched, prefetch
+from domain.managers.kb_stats_manager import KnowledgeBaseStatsManager
+from domain.managers.collection_load_manager import CollectionLoadManager, LoadState
+from domain.managers.vector_replica_manager import VectorReplicaManager
+from domain.managers.vector_purge_manager import VectorPurgeManager
 
 
 class VectorStoreManager:
     """向量存储管理服务"""
     
-    def __init__(self, milvus_store, batch_size: int = 32):
+    def __init__(self, milvus_store, batch_size: int = milvus_settings.insert_batch_size):
         """
         初始化向量存储管理器
         
         Args:
             milvus_store: Milvus 服务实例
-            batch_size: 批处理大小（默认 32，适配大多数 Embedding API 限制）
+            batch_size: 入库时每批向量化并插入的文本块数量（Embedding 客户端内部按 API 限制再分批）
         """
         self.milvus_store = milvus_store
         self.batch_size = batch_size
+        self.writer = ColumnarVectorWriter(milvus_store, batch_size=batch_size)
+        self.stats = KnowledgeBaseStatsManager(
+            milvus_store,
+            reconcile_interval=settings.KB_STATS_RECONCILE_INTERVAL
+        )
+        self.load_manager = CollectionLoadManager(
+            milvus_store,
+            idle_release_seconds=settings.MILVUS_IDLE_RELEASE_SECONDS,
+            check_interval=settings.MILVUS_IDLE_CHECK_INTERVAL
+        )
+        self.replicas = VectorReplicaManager(
+            milvus_store,
+            enabled=settings.LOCAL_REPLICA_ENABLED,
+            max_vectors=settings.LOCAL_REPLICA_MAX_VECTORS,
+            dtype=settings.LOCAL_REPLICA_DTYPE,
+            mmap_dir=settings.LOCAL_REPLICA_MMAP_DIR
+        )
+        self.purger = VectorPurgeManager(
+            self,
+            interval=settings.VECTOR_PURGE_INTERVAL,
+            batch_size=settings.VECTOR_PURGE_BATCH_SIZE
+        )
+        # 写入锁：在线重建期间暂停该智能体的写入（检索不受影响）
+        self._write_locks: Dict[str, threading.RLock] = {}
+        self._write_locks_lock = threading.Lock()
+    
+    def write_lock(self, agent_name: str) -> threading.RLock:
+        """智能体的写入锁（入库、删除、重建、后台清除互斥）"""
+        with self._write_locks_lock:
+            return self._write_locks.setdefault(agent_name, threading.RLock())
     
     def get_vector_store(self, agent_name: str) -> VectorStore:
         """
@@ -33,45 +75,240 @@ class VectorStoreManager:
         """
         return self.milvus_store.get_vector_store(agent_name)
     
+    def invalidate_vector_store(self, agent_name: str) -> bool:
+        """
+        使指定智能体的向量存储句柄缓存失效
+        
+        Args:
+            agent_name: 智能体名称
+            
+        Returns:
+            bool: 是否移除了缓存句柄
+        """
+        return self.milvus_store.invalidate_vector_store(agent_name)
+    
+    def release_agent(self, agent_name: str):
+        """
+        释放智能体相关的进程内资源（向量存储句柄、统计）
+        
+        Args:
+            agent_name: 智能体名称
+        """
+        self.invalidate_vector_store(agent_name)
+        self.stats.remove(agent_name)
+        self.load_manager.forget(agent_name)
+        self.replicas.invalidate(agent_name)
+    
+    def configure_index(
+        self,
+        agent_name: str,
+        index_type: Optional[str] = None,
+        index_params: Optional[Dict[str, Any]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        vector_dtype: Optional[str] = None,
+        vector_dim: Optional[int] = None
+    ) -> bool:
+        """
+        设置智能体的索引配置与向量存储格式
+        
+        Args:
+            agent_name: 智能体名称
+            index_type: 索引类型（AUTO 表示按数据规模自动选择）
+            index_params: 覆盖默认构建参数
+            search_params: 覆盖默认检索参数
+            vector_dtype: 向量存储精度（FLOAT32/FLOAT16/BFLOAT16）
+            vector_dim: Matryoshka 截断维度
+            
+        Returns:
+            bool: 配置是否发生变化
+        """
+        return self.milvus_store.configure_index(
+            agent_name, index_type, index_params, search_params, vector_dtype, vector_dim
+        )
+    
+    def configure_consistency(self, agent_name: str, overrides: Optional[Dict[str, str]] = None) -> bool:
+        """
+        设置智能体各操作类别的一致性级别
+        
+        Args:
+            agent_name: 智能体名称
+            overrides: 覆盖全局默认，如 {"search": "Strong"}
+            
+        Returns:
+            bool: 配置是否发生变化
+        """
+        return self.milvus_store.configure_consistency(agent_name, overrides)
+    
+    def configure_embedding(self, agent_name: str, provider: Optional[str] = None) -> bool:
+        """
+        设置智能体使用的 Embedding 后端
+        
+        Args:
+            agent_name: 智能体名称
+            provider: 后端名称（openai / onnx，为空使用全局默认）
+            
+        Returns:
+            bool: 配置是否发生变化
+            
+        Raises:
+            ValueError: 不支持的后端或向量维度与已有 Collection 不兼容
+        """
+        return self.milvus_store.configure_embedding(agent_name, provider)
+    
+    def get_index_profile(self, agent_name: str) -> Dict[str, Any]:
+        """
+        获取智能体的目标索引与当前实际索引
+        
+        Args:
+            agent_name: 智能体名称
+            
+        Returns:
+            dict: {"configured", "desired", "current"}
+        """
+        return self.milvus_store.get_index_profile(agent_name, self.get_vector_count(agent_name))
+    
+    def index_needs_rebuild(self, agent_name: str) -> Optional[Dict[str, Any]]:
+        """
+        AUTO 索引是否因数据增长跨过规模阈值（重建由 KnowledgeBaseService 登记并执行）
+        
+        Args:
+            agent_name: 智能体名称
+            
+        Returns:
+            Optional[Dict]: 需要重建时返回目标索引配置，否则返回 None
+        """
+        return self.milvus_store.index_needs_rebuild(agent_name, self.get_vector_count(agent_name))
+    
+    def rebuild_index(
+        self,
+        agent_name: str,
+        index_profile: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[[str, int, int], None]] = None,
+        vector_format: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        在线重建向量索引（新 Collection 构建完成后切换别名，期间旧 Collection 持续提供检索）
+        
+        重建期间该智能体的写入（上传、删除文档）会等待重建完成。
+        
+        Args:
+            agent_name: 智能体名称
+            index_profile: 目标索引配置（为空则按当前配置与数据规模生成）
+            progress_callback: 进度回调 (stage, copied, total)
+            vector_format: 目标向量存储格式（为空则沿用现有格式）
+            
+        Returns:
+            dict: {"source", "target", "copied", "total", "vector_format"}
+        """
+        with self.write_lock(agent_name):
+            if index_profile is None:
+                config = self.milvus_store.get_index_config(agent_name)
+                index_profile = build_index_profile(
+                    index_type=config.get("index_type"),
+                    num_entities=self.get_vector_count(agent_name),
+                    index_params=config.get("index_params"),
+                    search_params=config.get("search_params")
+                )
+            
+            result = self.milvus_store.rebuild_collection(
+                agent_name, index_profile, progress_callback, vector_format=vector_format
+            )
+            
+            # 新 Collection 已加载，刷新加载状态与统计；主键已重新分配，副本需重新加载
+            self.load_manager.forget(agent_name)
+            self.replicas.invalidate(agent_name)
+            self.load_manager.ensure_loaded(agent_name, reason="rebuild")
+            self.stats.reconcile_async(agent_name)
+            return result
+    
     def add_documents(
         self,
         agent_name: str,
-        documents: List[Document]
+        documents: Iterable[Document]
     ) -> Dict[str, Any]:
         """
         批量添加文档到向量数据库
         
+        documents 可以是流式生成器（如 DocumentProcessor.iter_chunks）：解析、分割在后台线程中
+        领先至多 INGEST_QUEUE_DEPTH 批，与向量化、插入并行，内存占用不随文件大小增长。
+        上游解析失败时异常直接抛出，已写入的批次由调用方清理。
+        
         Args:
             agent_name: 智能体名称
-            documents: 文档列表
+            documents: 文本块（列表或迭代器）
             
         Returns:
-            dict: 处理结果 {success: bool, added: int, failed: int, errors: List}
+            dict: 处理结果 {success: bool, added: int, failed: int, errors: List,
+                  vector_ids: {file_id: [主键]}, vector_collection: 写入的物理 Collection}
             
         Raises:
             Exception: 所有批次都失败时抛出异常
         """
-        vector_store = self.get_vector_store(agent_name)
-        
+        with self.write_lock(agent_name):
+            return self._add_documents(agent_name, documents)
+    
+    def _add_documents(self, agent_name: str, documents: Iterable[Document]) -> Dict[str, Any]:
+        documents = iter(documents)
         total_added = 0
+        total = 0
         failed_batches = []
+        vector_ids: Dict[str, List] = {}
+        file_ids = set()
+        
+        # 超大文档：前 bulk_insert_min_rows 个文本块达到阈值时，其余文本块继续流式分批，
+        # 逐批写入 Parquet 由 Milvus 批量导入（没有与行对应的主键，删除时按 file_id 过滤）。
+        # 导入整体成功或失败，失败时异常向上抛出（文本块已被消费，不回退到按列插入）
+        head: List[Document] = []
+        bulk = False
+        if self.writer.bulk_import_enabled(agent_name):
+            head = list(itertools.islice(documents, milvus_settings.bulk_insert_min_rows))
+            bulk = len(head) >= milvus_settings.bulk_insert_min_rows
         
-        # 批量处理
-        for i in range(0, len(documents), self.batch_size):
-            batch = documents[i:i + self.batch_size]
-            batch_num = i // self.batch_size + 1
+        # 流式分批：上游在后台线程中领先至多 INGEST_QUEUE_DEPTH 批；
+        # 每批向量化并按列插入（插入与下一批向量化并行）
+        stream = prefetch(
+            batched(itertools.chain(head, documents), self.batch_size),
+            depth=settings.INGEST_QUEUE_DEPTH,
+            name=f"ingest-{agent_name}"
+        )
+        if bulk:
+            def counted(batches):
+                nonlocal total
+                for batch in batches:
+                    total += len(batch)
+                    file_ids.update(doc.metadata["file_id"] for doc in batch if doc.metadata.get("file_id"))
+                    yield batch
             
             try:
-                vector_store.add_documents(batch)
+                total_added = self.writer.bulk_import(agent_name, counted(stream))
+            except BulkImportTimeout as e:
+                self._watch_bulk_import(agent_name, e, file_ids)
+                raise
+            finally:
+                stream.close()
+            print(f"  批量导入完成: {total_added}/{total}")
+        
+        batches = [] if bulk else self.writer.insert_stream(agent_name, stream)
+        try:
+            for batch_num, (batch, ids, error) in enumerate(batches, 1):
+                total += len(batch)
+                if error is not None:
+                    error_msg = str(error)
+                    print(f"  ⚠️ 批次 {batch_num} 失败: {error_msg}")
+                    failed_batches.append({
+                        'batch': batch_num,
+                        'error': error_msg
+                    })
+                    continue
+                # 只同步写入成功的文件（失败批次的文件在 Milvus 中可能没有任何行）
+                file_ids.update(doc.metadata["file_id"] for doc in batch if doc.metadata.get("file_id"))
+                # 记录每个文件的文本块主键，删除时按主键删除
+                for doc, pk in zip(batch, ids):
+                    vector_ids.setdefault(doc.metadata.get("file_id"), []).append(pk)
                 total_added += len(batch)
-                print(f"  进度: {total_added}/{len(documents)}")
-            except Exception as e:
-                error_msg = str(e)
-                print(f"  ⚠️ 批次 {batch_num} 失败: {error_msg}")
-                failed_batches.append({
-                    'batch': batch_num,
-                    'error': error_msg
-                })
+                print(f"  进度: 已写入 {total_added} 个文本块")
+        finally:
+            stream.close()  # 提前退出时通知上游线程停止
         
         # 检查是否完全失败
         if total_added == 0:
@@ -88,34 +325,84 @@ class VectorStoreManager:
                 f"详细错误：\n{error_details}"
             )
         
+        self.stats.record_added(agent_name, total_added)
+        self.milvus_store.ensure_file_id_index(agent_name)
+        self.replicas.sync_files(agent_name, file_ids)
+        
         # 返回处理结果
         result = {
             'success': True,
             'added': total_added,
             'failed': len(failed_batches),
-            'errors': failed_batches
+            'errors': failed_batches,
+            'vector_ids': vector_ids,
+            'vector_collection': self.milvus_store.resolve_collection(agent_name)
         }
         
-        print(f"✅ 成功添加 {total_added}/{len(documents)} 个向量")
+        print(f"✅ 成功添加 {total_added}/{total} 个向量")
         if failed_batches:
             print(f"⚠️ 失败 {len(failed_batches)} 个批次")
         
         return result
     
-    def delete_by_file_id(self, agent_name: str, file_id: str) -> bool:
+    def _watch_bulk_import(self, agent_name: str, timeout: BulkImportTimeout, file_ids: Iterable[str]):
+        """
+        批量导入超时的善后：文件加入墓碑（迟到的行不会被检索到），后台等待任务进入终态后
+        按 file_id 再次删除，再解除墓碑
+
+        Args:
+            agent_name: 智能体名称
+            timeout: 超时异常（含导入任务 ID 与上传的文件）
+            file_ids: 本次导入的文件 ID
+        """
+        file_ids = set(file_ids)
+        self.purger.hold(agent_name, file_ids)
+        
+        def watch():
+            while True:
+                try:
+                    state = self.writer.wait_bulk_import(timeout.task_id)
+                    break
+                except Exception as e:
+                    print(f"⚠️ 查询批量导入状态失败（task={timeout.task_id}）: {e}")
+                    time.sleep(settings.VECTOR_PURGE_INTERVAL)
+            print(f"📦 超时的批量导入已结束（task={timeout.task_id}, {state.state_name}），清理迟到写入: {agent_name}")
+            for file_id in file_ids:
+                while not self.delete_by_file_id(agent_name, file_id):
+                    time.sleep(settings.VECTOR_PURGE_INTERVAL)
+            self.writer.remove_import_file(timeout.object_name)
+            self.purger.release(agent_name, file_ids)
+        
+        threading.Thread(target=watch, name=f"bulk-import-watch-{agent_name}", daemon=True).start()
+    
+    def delete_by_file_id(
+        self,
+        agent_name: str,
+        file_id: str,
+        chunks_count: Optional[int] = None,
+        vector_ids: Optional[List] = None,
+        vector_collection: Optional[str] = None
+    ) -> bool:
         """
         根据文件 ID 删除向量数据
         
         Args:
             agent_name: 智能体名称
             file_id: 文件 ID
+            chunks_count: 该文件的向量数量（用于增量更新统计，未知时触发对账）
+            vector_ids: 入库时记录的主键（提供时按主键删除）
+            vector_collection: 主键所在的物理 Collection
             
         Returns:
             bool: 删除是否成功
         """
         try:
-            success = self.milvus_service.delete_by_file_id(agent_name, file_id)
+            with self.write_lock(agent_name):
+                success = self.milvus_store.delete_by_file_id(agent_name, file_id, vector_ids, vector_collection)
+                if success:
+                    self.replicas.remove_file(agent_name, file_id)
             if success:
+                self.stats.record_deleted(agent_name, chunks_count)
                 print(f"✅ 向量数据已删除: {file_id}")
             else:
                 print(f"⚠️ 向量数据删除失败或不存在: {file_id}")
@@ -126,6 +413,32 @@ class VectorStoreManager:
             traceback.print_exc()
             return False
     
+    def purge_documents(self, agent_name: str, documents: List) -> List:
+        """
+        清除一批已软删除文档的向量（后台清除调用），完成后触发 Collection 压缩
+        
+        Args:
+            agent_name: 智能体名称
+            documents: 文档记录（domain.entities.Document）
+            
+        Returns:
+            list: 向量已删除的文档记录
+        """
+        purged = []
+        with self.write_lock(agent_name):
+            for document in documents:
+                success = self.milvus_store.delete_by_file_id(
+                    agent_name, document.id, document.vector_ids, document.vector_collection
+                )
+                if not success:
+                    continue
+                self.replicas.remove_file(agent_name, document.id)
+                self.stats.record_deleted(agent_name, document.chunks_count)
+                purged.append(document)
+        if purged:
+            self.milvus_store.compact(agent_name)
+        return purged
+    
     def search_similar(
         self,
         agent_name: str,
@@ -143,7 +456,137 @@ class VectorStoreManager:
         Returns:
             List[dict]: 搜索结果列表
         """
-        return self.milvus_store.search_similar(agent_name, query, top_k)
+        return self.search_similar_batch(agent_name, [query], top_k)
+    
+    def search_similar_batch(
+        self,
+        agent_name: str,
+        queries: List[str],
+        top_k: int = 3,
+        min_similarity: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        批量搜索相似文档（一次向量化 + 一次检索，结果已合并去重）
+        
+        Args:
+            agent_name: 智能体名称
+            queries: 查询文本列表
+            top_k: 返回结果数量
+            min_similarity: 相似度阈值（低于阈值的文本块不返回，为空不过滤）
+            
+        Returns:
+            List[dict]: 合并去重后的搜索结果列表（最相似的在前）
+        """
+        # 已软删除、尚未清除的文件不参与检索
+        tombstones = self.purger.get_tombstones(agent_name)
+        replica = self.replicas.acquire(agent_name, self.get_vector_count(agent_name))
+        if replica is not None:
+            queries = [q for q in queries if q and q.strip()]
+            if not queries:
+                return []
+            query_vectors = self.milvus_store.embed_queries(queries, agent_name)
+            return self.milvus_store.merge_hits(
+                replica.search(query_vectors, top_k, tombstones), top_k, min_similarity=min_similarity
+            )
+        
+        self.load_manager.ensure_loaded(agent_name)
+        return self.milvus_store.search_similar_batch(
+            agent_name, queries, top_k, exclude_file_ids=tombstones, min_similarity=min_similarity
+        )
+    
+    async def asearch_similar_batch(
+        self,
+        agent_name: str,
+        queries: List[str],
+        top_k: int = 3,
+        min_similarity: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        批量搜索相似文档（异步版本，不阻塞事件循环）
+        
+        Args:
+            agent_name: 智能体名称
+            queries: 查询文本列表
+            top_k: 返回结果数量
+            min_similarity: 相似度阈值（低于阈值的文本块不返回，为空不过滤）
+            
+        Returns:
+            List[dict]: 合并去重后的搜索结果列表（最相似的在前）
+        """
+        tombstones = self.purger.get_tombstones(agent_name)
+        replica = self.replicas.acquire(agent_name, self.get_vector_count(agent_name))
+        if replica is not None:
+            queries = [q for q in queries if q and q.strip()]
+            if not queries:
+                return []
+            query_vectors = await self.milvus_store.aembed_queries(queries, agent_name)
+            # 小矩阵乘法耗时在毫秒级以内，直接在事件循环中执行
+            return self.milvus_store.merge_hits(
+                replica.search(query_vectors, top_k, tombstones), top_k, min_similarity=min_similarity
+            )
+        
+        if self.load_manager.get_state(agent_name) != LoadState.LOADED:
+            # 需要访问 Milvus 加载 Collection，放到线程池执行
+            await asyncio.to_thread(self.load_manager.ensure_loaded, agent_name)
+        else:
+            self.load_manager.touch(agent_name)
+        return await self.milvus_store.asearch_similar_batch(
+            agent_name, queries, top_k, exclude_file_ids=tombstones, min_similarity=min_similarity
+        )
+    
+    def has_match(self, agent_name: str, queries: List[str], min_similarity: float) -> bool:
+        """
+        是否有文本块与任一查询匹配（阈值预检，Milvus 异常直接抛出）
+        
+        稠密向量达到阈值，或混合检索时 BM25 一路有命中，即算匹配。混合检索知识库的副本只能判断
+        稠密一路：副本未命中时再由 Milvus 检索（含 BM25 一路）确认。
+        
+        Args:
+            agent_name: 智能体名称
+            queries: 查询文本列表
+            min_similarity: 相似度阈值
+            
+        Returns:
+            bool: 是否有匹配的文本块
+        """
+        tombstones = self.purger.get_tombstones(agent_name)
+        replica = self.replicas.acquire(agent_name, self.get_vector_count(agent_name), dense_only=True)
+        if replica is not None:
+            queries = [q for q in queries if q and q.strip()]
+            if not queries:
+                return False
+            query_vectors = self.milvus_store.embed_queries(queries, agent_name)
+            if self.milvus_store.merge_hits(
+                replica.search(query_vectors, 1, tombstones), 1, min_similarity=min_similarity
+            ):
+                return True
+            if not replica.dense_only:
+                return False
+        
+        self.load_manager.ensure_loaded(agent_name)
+        return self.milvus_store.has_match(agent_name, queries, min_similarity, exclude_file_ids=tombstones)
+    
+    async def ahas_match(self, agent_name: str, queries: List[str], min_similarity: float) -> bool:
+        """阈值预检（异步版本，语义同 has_match）"""
+        tombstones = self.purger.get_tombstones(agent_name)
+        replica = self.replicas.acquire(agent_name, self.get_vector_count(agent_name), dense_only=True)
+        if replica is not None:
+            queries = [q for q in queries if q and q.strip()]
+            if not queries:
+                return False
+            query_vectors = await self.milvus_store.aembed_queries(queries, agent_name)
+            if self.milvus_store.merge_hits(
+                replica.search(query_vectors, 1, tombstones), 1, min_similarity=min_similarity
+            ):
+                return True
+            if not replica.dense_only:
+                return False
+        
+        if self.load_manager.get_state(agent_name) != LoadState.LOADED:
+            await asyncio.to_thread(self.load_manager.ensure_loaded, agent_name)
+        else:
+            self.load_manager.touch(agent_name)
+        return await self.milvus_store.ahas_match(agent_name, queries, min_similarity, exclude_file_ids=tombstones)
     
     def get_statistics(self, agent_name: str) -> Dict[str, Any]:
         """
@@ -157,6 +600,59 @@ class VectorStoreManager:
         """
         return self.milvus_store.get_collection_stats(agent_name)
     
+    def check_replica_parity(self, agent_name: str, queries: List[str], top_k: int = 10) -> Dict[str, Any]:
+        """
+        校验进程内副本与 Milvus 稠密检索结果的一致性
+        
+        Args:
+            agent_name: 智能体名称
+            queries: 查询文本列表
+            top_k: 对比的结果数量
+            
+        Returns:
+            dict: 平均召回、最大分数差及每条查询的明细
+        """
+        self.load_manager.ensure_loaded(agent_name, reason="parity")
+        return self.replicas.check_parity(agent_name, queries, top_k)
+    
+    def warm_up_collections(self, agent_names: List[str]) -> Dict[str, bool]:
+        """
+        预热加载 Collection，并启动空闲释放后台线程
+        
+        Args:
+            agent_names: 需要预热的智能体名称列表
+            
+        Returns:
+            dict: {agent_name: 是否已加载}
+        """
+        results = self.load_manager.warm_up(agent_names)
+        self.load_manager.start()
+        return results
+    
+    def release_collection(self, agent_name: str) -> bool:
+        """
+        释放 Collection（下次检索时自动重新加载）
+        
+        Args:
+            agent_name: 智能体名称
+            
+        Returns:
+            bool: 是否成功
+        """
+        return self.load_manager.release(agent_name)
+    
+    def get_vector_count(self, agent_name: str) -> int:
+        """
+        获取向量数量（内存统计，不访问 Milvus，用于对话热路径）
+        
+        Args:
+            agent_name: 智能体名称
+            
+        Returns:
+            int: 向量数量
+        """
+        return self.stats.get_vector_count(agent_name)
+    
     def clear_collection(self, agent_name: str) -> bool:
         """
         清空集合中的所有向量
@@ -169,7 +665,11 @@ class VectorStoreManager:
         """
         try:
             # 通过删除并重建集合来清空
-            self.milvus_store.delete_collection(agent_name)
+            with self.write_lock(agent_name):
+                self.milvus_store.delete_collection(agent_name)
+            self.stats.reset(agent_name)
+            self.load_manager.forget(agent_name)
+            self.replicas.invalidate(agent_name)
             # 重新初始化向量存储
             self.get_vector_store(agent_name)
             print(f"✅ 集合已清空: {agent_name}")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+将智能体的独立 Collection 迁移到共享 Collection（partition key 布局）
+
+用法：
+    python migrate_to_shared_collection.py                  # 迁移所有智能体，保留原 Collection
+    python migrate_to_shared_collection.py --agents a b     # 只迁移指定智能体
+    python migrate_to_shared_collection.py --drop-source    # 校验通过后删除原 Collection
+
+迁移完成后设置环境变量 MILVUS_STORAGE_LAYOUT=shared 并重启服务。
+迁移期间请暂停文档上传与删除，否则迁移开始后的写入不会被复制。
+"""
+import argparse
+import sys
+
+from config.database import SessionLocal, init_db
+from config.milvus import milvus_settings
+from repository.agent_repository import AgentRepository
+from application.milvus_service import get_milvus_store
+
+
+def migrate(agent_names, batch_size: int, drop_source: bool, overwrite: bool) -> bool:
+    """迁移指定智能体，返回是否全部校验通过"""
+    milvus_store = get_milvus_store()
+    
+    results = []
+    for agent_name in agent_names:
+        try:
+            results.append(milvus_store.migrate_agent_to_shared(
+                agent_name,
+                batch_size=batch_size,
+                drop_source=drop_source,
+                overwrite=overwrite
+            ))
+        except Exception as e:
+            print(f"❌ 迁移失败: {agent_name}, {e}")
+            results.append({"agent_name": agent_name, "status": "failed", "copied": 0, "verified": False})
+    
+    print("")
+    print(f"📊 迁移结果（共享 Collection: {milvus_settings.shared_collection}）")
+    for result in results:
+        mark = "✅" if result["verified"] else "❌"
+        print(f"   {mark} {result['agent_name']}: {result['status']}, 复制 {result['copied']} 条")
+    
+    return all(result["verified"] for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移智能体 Collection 到共享布局")
+    parser.add_argument("--agents", nargs="*", help="要迁移的智能体名称（默认全部）")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批复制的实体数量")
+    parser.add_argument("--drop-source", action="store_true", help="校验通过后删除原 Collection")
+    parser.add_argument("--overwrite", action="store_true", help="共享 Collection 中已有数据时覆盖")
+    args = parser.parse_args()
+    
+    init_db()
+    agent_names = args.agents
+    if not agent_names:
+        db = SessionLocal()
+        try:
+            agent_names = [agent.name for agent in AgentRepository.list_all(db, limit=100_000)]
+        finally:
+            db.close()
+    
+    ok = migrate(agent_names, args.batch_size, args.drop_source, args.overwrite)
+    if ok:
+        print("")
+        print("下一步：设置 MILVUS_STORAGE_LAYOUT=shared 并重启服务")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,12 @@
 """
 import uuid
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
-from domain.entities import Agent, AgentStatus, AgentType, Document, DocumentStatus
+from domain.entities import (
+    Agent, AgentStatus, AgentType, Document, DocumentStatus,
+    Conversation, ConversationStatus, IndexRebuild, IndexRebuildStatus
+)
 
 
 class AgentRepository:
@@ -70,6 +73,18 @@ class AgentRepository:
     def exists_by_name(db: Session, name: str) -> bool:
         """检查名称是否存在"""
         return db.query(Agent).filter(Agent.name == name).first() is not None
+    
+    @staticmethod
+    def list_names_with_online_conversations(db: Session) -> List[str]:
+        """获取被在线客服使用的智能体名称"""
+        rows = (
+            db.query(Agent.name)
+            .join(Conversation, Conversation.agent_id == Agent.id)
+            .filter(Conversation.status == ConversationStatus.ONLINE)
+            .distinct()
+            .all()
+        )
+        return [row[0] for row in rows]
 
 
 class DocumentRepository:
@@ -93,15 +108,34 @@ class DocumentRepository:
         """获取智能体的所有文档"""
         return db.query(Document).filter(Document.agent_id == agent_id).all()
     
+    @staticmethod
+    def sum_chunks_by_agent_name(db: Session, agent_name: str) -> int:
+        """汇总智能体所有就绪文档的分块（向量）数量"""
+        from sqlalchemy import func
+        
+        total = (
+            db.query(func.coalesce(func.sum(Document.chunks_count), 0))
+            .join(Agent, Agent.id == Document.agent_id)
+            .filter(
+                Agent.name == agent_name,
+                Document.status == DocumentStatus.READY,
+                Document.deleted_at.is_(None)
+            )
+            .scalar()
+        )
+        return int(total or 0)
+    
     @staticmethod
     def update_status(
         db: Session,
         doc_id: str,
         status: DocumentStatus,
         chunks_count: Optional[int] = None,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        vector_ids: Optional[List[int]] = None,
+        vector_collection: Optional[str] = None
     ) -> Optional[Document]:
-        """更新文档状态"""
+        """更新文档状态（就绪时可同时记录文本块的向量主键及所在物理 Collection）"""
         doc = db.query(Document).filter(Document.id == doc_id).first()
         if not doc:
             return None
@@ -115,6 +149,10 @@ class DocumentRepository:
         if error_message:
             doc.error_message = error_message
         
+        if vector_ids is not None:
+            doc.vector_ids = vector_ids
+            doc.vector_collection = vector_collection
+        
         if status == DocumentStatus.READY:
             doc.processed_at = datetime.utcnow()
         
@@ -133,9 +171,159 @@ class DocumentRepository:
         db.commit()
         return True
     
+    @staticmethod
+    def mark_deleted(db: Session, doc_id: str) -> Optional[Document]:
+        """软删除文档（记录删除时间，向量由后台清除）"""
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if not doc:
+            return None
+        if doc.deleted_at is None:
+            doc.deleted_at = datetime.utcnow()
+            db.commit()
+            db.refresh(doc)
+        return doc
+    
+    @staticmethod
+    def mark_deleted_by_agent(db: Session, agent_id: str) -> List[str]:
+        """软删除智能体的所有文档，返回本次标记的文档 ID"""
+        doc_ids = [
+            doc_id for (doc_id,) in db.query(Document.id)
+            .filter(Document.agent_id == agent_id, Document.deleted_at.is_(None))
+            .all()
+        ]
+        if doc_ids:
+            db.query(Document).filter(Document.id.in_(doc_ids)).update(
+                {Document.deleted_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        return doc_ids
+    
+    @staticmethod
+    def list_deleted(db: Session) -> List[Tuple[str, Document]]:
+        """获取所有已软删除、等待清除的文档（按删除时间排序），返回 (智能体名称, 文档)"""
+        return (
+            db.query(Agent.name, Document)
+            .join(Agent, Agent.id == Document.agent_id)
+            .filter(Document.deleted_at.isnot(None))
+            .order_by(Document.deleted_at)
+            .all()
+        )
+    
+    @staticmethod
+    def list_deleted_ids_by_agent_name(db: Session, agent_name: str) -> List[str]:
+        """获取智能体已软删除的文档 ID"""
+        return [
+            doc_id for (doc_id,) in db.query(Document.id)
+            .join(Agent, Agent.id == Document.agent_id)
+            .filter(Agent.name == agent_name, Document.deleted_at.isnot(None))
+            .all()
+        ]
+    
+    @staticmethod
+    def count_live_by_agent_name(db: Session, agent_name: str) -> int:
+        """统计智能体未删除的文档数量（含处理中、失败）"""
+        return (
+            db.query(Document)
+            .join(Agent, Agent.id == Document.agent_id)
+            .filter(Agent.name == agent_name, Document.deleted_at.is_(None))
+            .count()
+        )
+    
+    @staticmethod
+    def delete_many(db: Session, doc_ids: List[str]) -> int:
+        """批量删除文档记录"""
+        if not doc_ids:
+            return 0
+        count = db.query(Document).filter(Document.id.in_(doc_ids)).delete(synchronize_session=False)
+        db.commit()
+        return count
+    
     @staticmethod
     def delete_by_agent(db: Session, agent_id: str) -> int:
         """删除智能体的所有文档"""
         count = db.query(Document).filter(Document.agent_id == agent_id).delete()
         db.commit()
         return count
+
+
+class IndexRebuildRepository:
+    """索引重建记录仓储"""
+    
+    ACTIVE_STATUSES = (
+        IndexRebuildStatus.PENDING,
+        IndexRebuildStatus.COPYING,
+        IndexRebuildStatus.INDEXING,
+        IndexRebuildStatus.SWAPPING
+    )
+    
+    @staticmethod
+    def create(db: Session, rebuild: IndexRebuild) -> IndexRebuild:
+        """创建重建记录"""
+        db.add(rebuild)
+        db.commit()
+        db.refresh(rebuild)
+        return rebuild
+    
+    @staticmethod
+    def get_by_id(db: Session, rebuild_id: str) -> Optional[IndexRebuild]:
+        """根据 ID 获取重建记录"""
+        return db.query(IndexRebuild).filter(IndexRebuild.id == rebuild_id).first()
+    
+    @staticmethod
+    def list_by_agent(db: Session, agent_id: str, limit: int = 20) -> List[IndexRebuild]:
+        """获取智能体的重建记录（最新的在前）"""
+        return (
+            db.query(IndexRebuild)
+            .filter(IndexRebuild.agent_id == agent_id)
+            .order_by(IndexRebuild.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+    
+    @staticmethod
+    def get_active_by_agent(db: Session, agent_id: str) -> Optional[IndexRebuild]:
+        """获取智能体正在进行的重建"""
+        return (
+            db.query(IndexRebuild)
+            .filter(
+                IndexRebuild.agent_id == agent_id,
+                IndexRebuild.status.in_(IndexRebuildRepository.ACTIVE_STATUSES)
+            )
+            .first()
+        )
+    
+    @staticmethod
+    def update(db: Session, rebuild_id: str, update_data: dict) -> Optional[IndexRebuild]:
+        """更新重建记录"""
+        rebuild = db.query(IndexRebuild).filter(IndexRebuild.id == rebuild_id).first()
+        if not rebuild:
+            return None
+        
+        for field, value in update_data.items():
+            if hasattr(rebuild, field):
+                setattr(rebuild, field, value)
+        
+        if update_data.get("status") in (IndexRebuildStatus.COMPLETED, IndexRebuildStatus.FAILED):
+            rebuild.finished_at = datetime.utcnow()
+        
+        db.commit()
+        db.refresh(rebuild)
+        return rebuild
+    
+    @staticmethod
+    def fail_unfinished(db: Session) -> int:
+        """将进程重启前未完成的重建标记为失败"""
+        count = (
+            db.query(IndexRebuild)
+            .filter(IndexRebuild.status.in_(IndexRebuildRepository.ACTIVE_STATUSES))
+            .update(
+                {
+                    IndexRebuild.status: IndexRebuildStatus.FAILED,
+                    IndexRebuild.error_message: "服务重启，重建中断",
+                    IndexRebuild.finished_at: datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+        )
+        db.commit()
+        return count